@@ -0,0 +1 @@
+"""Нагрузочные бенчмарки горячих путей API (запуск: python -m api.bench.run)."""
@@ -0,0 +1,174 @@
+"""
+Микробенчмарк проверки JWT: сравнивает верификаторы api.jwt_auth.VERIFIERS по числу проверок
+в секунду и сверяет, что они одинаково принимают и отклоняют токены (exp, nbf, подпись, alg).
+
+Запуск:
+    python -m api.bench.jwt_bench --tokens 2000 --rounds 3 --output jwt_bench.json
+
+Каждый токен уникален, кэш проверенных токенов не участвует — измеряется сама проверка
+(разбор заголовка + подпись + claims). Отдельной строкой — попадание в кэш decode_token_async.
+Выход с кодом 1, если верификаторы разошлись хотя бы в одном случае.
+"""
+import argparse
+import asyncio
+import base64
+import json
+import platform
+import sys
+import time
+import uuid
+from typing import Any, Callable
+
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives.asymmetric import rsa
+from jose import exceptions, jwk, jwt
+
+from api import jwt_auth
+
+
+def _claims(**overrides: Any) -> dict[str, Any]:
+    now = int(time.time())
+    claims = {
+        "exp": now + 3600,
+        "iat": now,
+        "jti": uuid.uuid4().hex,
+        "user_id": "bench",
+        "role": 1,
+        "email": "bench@bench.local",
+        "username": "bench",
+    }
+    claims.update(overrides)
+    return {k: v for k, v in claims.items() if v is not None}
+
+
+def _b64(data: bytes) -> str:
+    return base64.urlsafe_b64encode(data).rstrip(b"=").decode()
+
+
+def _semantic_cases(private_pem: str, other_pem: str, public_pem: str) -> dict[str, str]:
+    """Токены, на которых верификаторы обязаны вести себя одинаково."""
+    sign = lambda claims, key=private_pem: jwt.encode(claims, key, algorithm="RS256")  # noqa: E731
+    valid = sign(_claims())
+    header, payload, signature = valid.split(".")
+    forged_payload = _b64(json.dumps(_claims(user_id="admin")).encode())
+    unsigned_header = _b64(json.dumps({"alg": "none", "typ": "JWT"}).encode())
+    hs_header = _b64(json.dumps({"alg": "HS256", "typ": "JWT"}).encode())
+    return {
+        "valid": valid,
+        "expired": sign(_claims(exp=int(time.time()) - 10)),
+        "not_yet_valid": sign(_claims(nbf=int(time.time()) + 600)),
+        "exp_not_int": sign(_claims(exp="soon")),
+        "with_audience": sign(_claims(aud="other-service")),
+        "sub_not_string": sign(_claims(sub=42)),
+        "wrong_key": sign(_claims(), other_pem),
+        "tampered_payload": f"{header}.{forged_payload}.{signature}",
+        "alg_none": f"{unsigned_header}.{payload}.",
+        # Подмена алгоритма: HMAC с открытым ключом в качестве секрета
+        "alg_hs256_public_key": f"{hs_header}.{payload}.{_b64(public_pem.encode())}",
+        "truncated": f"{header}.{payload}",
+        "garbage": "not-a-token",
+    }
+
+
+def _outcome(verifier: Any, token: str, key: Any) -> str:
+    try:
+        if verifier.header(token).get("alg") != jwt_auth.JWT_ALGORITHM:
+            return "rejected"
+        verifier.decode(token, key)
+        return "accepted"
+    except exceptions.ExpiredSignatureError:
+        return "expired"
+    except exceptions.JWTError:
+        return "rejected"
+
+
+def _throughput(op: Callable[[str], Any], tokens: list[str], rounds: int) -> dict[str, float]:
+    best = float("inf")
+    for _ in range(rounds):
+        started = time.perf_counter()
+        for token in tokens:
+            op(token)
+        best = min(best, time.perf_counter() - started)
+    return {
+        "verifications_per_sec": round(len(tokens) / best, 1),
+        "us_per_verification": round(best / len(tokens) * 1e6, 2),
+    }
+
+
+async def _cached_throughput(token: str, count: int, rounds: int) -> dict[str, float]:
+    await jwt_auth.decode_token_async(token)
+    best = float("inf")
+    for _ in range(rounds):
+        started = time.perf_counter()
+        for _ in range(count):
+            await jwt_auth.decode_token_async(token)
+        best = min(best, time.perf_counter() - started)
+    return {
+        "verifications_per_sec": round(count / best, 1),
+        "us_per_verification": round(best / count * 1e6, 2),
+    }
+
+
+def run(args: argparse.Namespace) -> dict[str, Any]:
+    private_key = rsa.generate_private_key(public_exponent=65537, key_size=args.key_size)
+    other_key = rsa.generate_private_key(public_exponent=65537, key_size=args.key_size)
+    pem = lambda key: key.private_bytes(  # noqa: E731
+        serialization.Encoding.PEM, serialization.PrivateFormat.PKCS8, serialization.NoEncryption()
+    ).decode()
+    public_pem = private_key.public_key().public_bytes(
+        serialization.Encoding.PEM, serialization.PublicFormat.SubjectPublicKeyInfo
+    ).decode()
+    public_jwk = jwk.construct(public_pem, algorithm="RS256").to_dict()
+
+    cases = _semantic_cases(pem(private_key), pem(other_key), public_pem)
+    tokens = [jwt.encode(_claims(), pem(private_key), algorithm="RS256") for _ in range(args.tokens)]
+
+    semantics: dict[str, dict[str, str]] = {name: {} for name in cases}
+    backends: dict[str, Any] = {}
+    for name, verifier in jwt_auth.VERIFIERS.items():
+        key = verifier.load_key(public_jwk)
+        for case, token in cases.items():
+            semantics[case][name] = _outcome(verifier, token, key)
+        backends[name] = _throughput(lambda t: verifier.decode(t, key), tokens, args.rounds)
+        print(
+            f"{name:<14} {backends[name]['verifications_per_sec']:>10.1f} проверок/с "
+            f"{backends[name]['us_per_verification']:>8.2f} мкс"
+        )
+
+    # Попадание в кэш проверенных токенов (повторный запрос той же сессии)
+    jwt_auth.key_manager.load_jwks({"keys": [public_jwk]})
+    cached = asyncio.run(_cached_throughput(tokens[0], args.tokens, args.rounds))
+    print(f"{'claims cache':<14} {cached['verifications_per_sec']:>10.1f} проверок/с {cached['us_per_verification']:>8.2f} мкс")
+
+    mismatches = [case for case, outcomes in semantics.items() if len(set(outcomes.values())) > 1]
+    for case in mismatches:
+        print(f"РАСХОЖДЕНИЕ {case}: {semantics[case]}")
+    return {
+        "python": platform.python_version(),
+        "params": {"tokens": args.tokens, "rounds": args.rounds, "key_size": args.key_size},
+        "backends": backends,
+        "claims_cache": cached,
+        "semantics": semantics,
+        "mismatches": mismatches,
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Микробенчмарк проверки JWT в Lingwo API")
+    parser.add_argument("--tokens", type=int, default=2000, help="уникальных токенов на прогон")
+    parser.add_argument("--rounds", type=int, default=3, help="прогонов (берётся лучший)")
+    parser.add_argument("--key-size", type=int, default=2048)
+    parser.add_argument("--output", default=None, help="JSON с результатами")
+    args = parser.parse_args()
+
+    report = run(args)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        print(f"Результаты: {args.output}")
+    if report["mismatches"]:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,126 @@
+"""
+Отложенная запись черновиков активных сочинений в Postgres (write-behind).
+Автосохранение пишет только в Redis и помечает пользователя в essay:dirty (api.essay_store);
+фоновая задача API раз в DRAFT_FLUSH_INTERVAL_SEC забирает пачку пометок и одним
+INSERT ... ON CONFLICT переносит состояния в essay_drafts. При нескольких процессах API
+каждый забирает свои пометки (SPOP), при ошибке записи они возвращаются в множество.
+"""
+import asyncio
+import contextlib
+import logging
+import os
+from datetime import datetime, timezone
+
+from sqlalchemy import delete, or_, tuple_
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from api.db import AsyncSessionLocal
+from api.essay_store import DIRTY_ESSAYS_KEY, active_essay_key, closed_essay_key, from_hash
+from api.models import EssayDraft
+from api.redis_client import redis_client
+
+logger = logging.getLogger(__name__)
+
+DRAFT_FLUSH_INTERVAL_SEC = float(os.getenv("DRAFT_FLUSH_INTERVAL_SEC", "5"))
+DRAFT_FLUSH_BATCH = int(os.getenv("DRAFT_FLUSH_BATCH", "500"))
+
+
+async def delete_draft(session: AsyncSession, user_id: str) -> None:
+    """Удаляет черновик в транзакции вызывающего (завершение или сброс сочинения)."""
+    await session.execute(delete(EssayDraft).where(EssayDraft.user_id == user_id))
+
+
+async def flush_dirty_drafts(batch: int = DRAFT_FLUSH_BATCH) -> int:
+    """Записывает в БД до batch изменённых черновиков. Возвращает число обработанных пометок."""
+    user_ids = await redis_client.spop(DIRTY_ESSAYS_KEY, batch)
+    if not user_ids:
+        return 0
+
+    try:
+        pipe = redis_client.pipeline(transaction=False)
+        for user_id in user_ids:
+            pipe.hgetall(active_essay_key(user_id))
+        states = await pipe.execute(raise_on_error=False)
+
+        now = datetime.now(timezone.utc)
+        rows = []
+        for data in states:
+            # Пустой ответ — сочинение уже завершено или сброшено; ошибка — ключ в старом формате
+            if not data or isinstance(data, Exception):
+                continue
+            state = from_hash(data)
+            rows.append(
+                {
+                    "user_id": state.user_id,
+                    "essay_type": state.type,
+                    "theme": state.theme,
+                    "text": state.text,
+                    "started_at": state.started_at,
+                    "version": state.version,
+                    "updated_at": now,
+                }
+            )
+        if rows:
+            stmt = insert(EssayDraft).values(rows)
+            excluded = stmt.excluded
+            stmt = stmt.on_conflict_do_update(
+                index_elements=[EssayDraft.user_id],
+                set_={
+                    "essay_type": excluded.essay_type,
+                    "theme": excluded.theme,
+                    "text": excluded.text,
+                    "started_at": excluded.started_at,
+                    "version": excluded.version,
+                    "updated_at": excluded.updated_at,
+                },
+                # Не затираем более новую версию того же сочинения
+                where=or_(
+                    EssayDraft.started_at != excluded.started_at,
+                    EssayDraft.version < excluded.version,
+                ),
+            )
+            async with AsyncSessionLocal() as session:
+                await session.execute(stmt)
+                await session.commit()
+    except Exception:
+        await redis_client.sadd(DIRTY_ESSAYS_KEY, *user_ids)
+        raise
+
+    if rows:
+        await _drop_closed(rows)
+    return len(user_ids)
+
+
+async def _drop_closed(rows: list[dict]) -> None:
+    """
+    Сочинение могли завершить или сбросить, пока пачка писалась: тогда его черновик
+    уже удалён, а запись выше вернула его обратно. Маркер закрытия с тем же started_at это выдаёт.
+    """
+    markers = await redis_client.mget([closed_essay_key(row["user_id"]) for row in rows])
+    closed = [
+        (row["user_id"], row["started_at"])
+        for row, marker in zip(rows, markers)
+        if marker and datetime.fromisoformat(marker) == row["started_at"]
+    ]
+    if not closed:
+        return
+    async with AsyncSessionLocal() as session:
+        await session.execute(
+            delete(EssayDraft).where(tuple_(EssayDraft.user_id, EssayDraft.started_at).in_(closed))
+        )
+        await session.commit()
+
+
+async def run_draft_flusher(stop: asyncio.Event) -> None:
+    """Фоновая задача API: переносит черновики в БД, пока не выставлен stop; перед выходом — последний сброс."""
+    while True:
+        try:
+            while await flush_dirty_drafts() >= DRAFT_FLUSH_BATCH:
+                pass
+        except Exception as e:
+            logger.warning("essay_drafts: не удалось записать черновики: %s", e)
+        if stop.is_set():
+            break
+        with contextlib.suppress(asyncio.TimeoutError):
+            await asyncio.wait_for(stop.wait(), timeout=DRAFT_FLUSH_INTERVAL_SEC)
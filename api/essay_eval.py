@@ -3,17 +3,36 @@
 Тип essay: итоговое сочинение (k1–k5, зачет/незачет = 0 или 1, макс 5). Тип ege: ЕГЭ задание 27 (K1–K10, макс 22).
 Возвращает criteries, common_mistakes, max_score, total_score (сырые баллы), total_score_per (0–1).
 """
+import hashlib
 import json
 import logging
 import os
+import random
 import re
+import threading
+import time
+import unicodedata
+from abc import ABC, abstractmethod
 from pathlib import Path
-from typing import Any
+from typing import Any, Callable
+
+from api.inference import InferenceEngine
 
 logger = logging.getLogger(__name__)
 
-# Модель загружается лениво при первом вызове
-_llama_model = None
+# Число параллельных слотов (контекстов) модели и общее число потоков CPU на все слоты
+LLAMA_N_PARALLEL = max(1, int(os.getenv("LLAMA_N_PARALLEL", "1")))
+LLAMA_N_THREADS = int(os.getenv("LLAMA_N_THREADS", "6"))
+# Слоёв модели на GPU (-1 — все, 0 — только CPU)
+LLAMA_N_GPU_LAYERS = int(os.getenv("LLAMA_N_GPU_LAYERS", "-1"))
+# Каждый слот на GPU держит свою копию весов в видеопамяти — по умолчанию один слот
+LLAMA_GPU_SLOTS = max(1, int(os.getenv("LLAMA_GPU_SLOTS", "1")))
+# Оценка памяти на слот на CPU (KV-кэш n_ctx=8192 и буферы); веса общие через mmap
+LLAMA_SLOT_MEMORY_MB = max(1, int(os.getenv("LLAMA_SLOT_MEMORY_MB", "1536")))
+
+# Движок и контексты модели создаются лениво при первом вызове
+_engine: InferenceEngine | None = None
+_engine_lock = threading.Lock()
 
 # Итоговое сочинение: по каждому критерию только «зачет» (1) или «незачет» (0), макс 5 баллов
 PROMPT_ESSAY = """Ты — эксперт по проверке итоговых сочинений. По каждому из 5 критериев выставляется только «зачет» или «незачет». В JSON для каждого критерия укажи score: 1 (зачет) или 0 (незачет).
@@ -78,6 +97,13 @@ PROMPT_EGE = """Ты — эксперт по проверке сочинений
 
 ESSAY_MAX_SCORE = 5.0  # 5 критериев, по каждому 0 или 1 (зачет/незачет)
 
+
+def criterion_max_score(essay_type: str, key: str) -> int:
+    """Максимальный балл критерия: K1–K10 для ЕГЭ по EGE_MAX_BY_CRITERION, k1–k5 итогового — 1."""
+    if essay_type == "ege":
+        return EGE_MAX_BY_CRITERION.get(key.lower(), 0)
+    return 1
+
 # Проверка темы сочинения: осмысленная формулировка (итоговое сочинение или ЕГЭ)
 PROMPT_VALIDATE_THEME = """Проверь, является ли следующая строка осмысленной темой сочинения (итоговое сочинение или ЕГЭ по русскому языку).
 Тема должна быть формулировкой проблемы или вопроса, по которому можно написать сочинение. Не допускаются: бессмысленный текст, случайный набор слов, оскорбления, реклама.
@@ -87,6 +113,57 @@ PROMPT_VALIDATE_THEME = """Проверь, является ли следующ
 """
 
 
+# Грамматики GBNF для ответа модели: генерация ограничена JSON нужной формы и заканчивается,
+# как только объект закрыт (без markdown и текста после JSON).
+MISTAKE_TYPES = ("punctuation", "spelling", "grammar", "style")
+LLAMA_JSON_GRAMMAR = os.getenv("LLAMA_JSON_GRAMMAR", "1") != "0"
+
+_GBNF_COMMON = r"""
+ws ::= " "?
+string ::= "\"" ( [^"\\\x7F\x00-\x1F] | "\\" ( ["\\/bfnrt] | "u" [0-9a-fA-F] [0-9a-fA-F] [0-9a-fA-F] [0-9a-fA-F] ) )* "\""
+strings ::= "[" ws ( string ( "," ws string )* )? ws "]"
+int ::= [0-9] [0-9]? [0-9]? [0-9]? [0-9]?
+range ::= "[" ws int "," ws int ws "]"
+ranges ::= "[" ws ( range ( "," ws range )* )? ws "]"
+"""
+
+
+def _gbnf_key(key: str) -> str:
+    return '"\\"' + key + '\\":" ws'
+
+
+def _build_eval_grammar(max_by_criterion: dict[str, int], extra_lists: dict[str, str]) -> str:
+    """
+    Грамматика ответа оценки: {"criteries": {k1..kN}, "common_mistakes": [4 типа ошибок по порядку]}.
+    Балл каждого критерия ограничен диапазоном 0..max; extra_lists — необязательные списки строк у критериев
+    (found_in_text, suggestions), как в промпте.
+    """
+    rules = [
+        'root ::= "{" ws ' + _gbnf_key("criteries") + ' criteries "," ws ' + _gbnf_key("common_mistakes") + ' mistakes ws "}"',
+        'criteries ::= "{" ws ' + ' "," ws '.join(f"{_gbnf_key(k)} crit-{k}" for k in max_by_criterion) + ' ws "}"',
+    ]
+    for key, max_val in max_by_criterion.items():
+        extra = ""
+        if key in extra_lists:
+            extra = f' ( "," ws {_gbnf_key(extra_lists[key])} strings )?'
+        rules.append(
+            f'crit-{key} ::= "{{" ws {_gbnf_key("score")} [0-{max_val}] "," ws {_gbnf_key("comment")} string{extra} ws "}}"'
+        )
+    rules.append('mistakes ::= "[" ws ' + ' "," ws '.join(f"mistake-{t}" for t in MISTAKE_TYPES) + ' ws "]"')
+    for t in MISTAKE_TYPES:
+        rules.append(
+            f'mistake-{t} ::= "{{" ws {_gbnf_key("type")} "\\"{t}\\"" "," ws {_gbnf_key("count")} int "," ws {_gbnf_key("ranges")} ranges ws "}}"'
+        )
+    return "\n".join(rules) + _GBNF_COMMON
+
+
+ESSAY_GRAMMAR = _build_eval_grammar({f"k{i}": 1 for i in range(1, 6)}, {"k1": "found_in_text", "k2": "suggestions"})
+EGE_GRAMMAR = _build_eval_grammar(EGE_MAX_BY_CRITERION, {})
+VALIDATE_THEME_GRAMMAR = (
+    'root ::= "{" ws ' + _gbnf_key("valid") + ' ( "true" | "false" ) "," ws ' + _gbnf_key("message") + ' string ws "}"'
+    + _GBNF_COMMON
+)
+
 def _model_path() -> Path:
     path = os.getenv("LLAMA_MODEL_PATH")
     if path:
@@ -104,36 +181,299 @@ def _model_path() -> Path:
     return repo / "gemma-3-4b-it-UD-Q6_K_XL.gguf"
 
 
-def _get_model():
-    global _llama_model
-    if _llama_model is None:
+GEMMA_USER_PREFIX = "<start_of_turn>user\n"
+GEMMA_USER_SUFFIX = "<end_of_turn>\n<start_of_turn>model\n"
+
+GEMMA_TOP_K = 64
+GEMMA_TOP_P = 0.95
+GEMMA_REPEAT_PENALTY = 1.0
+GEMMA_MIN_P = 0.01
+
+
+def _gemma_prompt(prompt: str) -> str:
+    """Оборачивает промпт в формат Gemma (user turn + начало ответа model)."""
+    return GEMMA_USER_PREFIX + prompt + GEMMA_USER_SUFFIX
+
+
+def _template_prefix(template: str) -> str:
+    """Неизменяемое начало промпта в формате Gemma: всё до строки с {theme} (скобки {{ }} раскрыты)."""
+    head = template[: template.index("{theme}")]
+    head = head[: head.rindex("\n") + 1]
+    return GEMMA_USER_PREFIX + head.replace("{{", "{").replace("}}", "}")
+
+
+# Для этих префиксов каждый слот держит сохранённое состояние llama.cpp (KV-кэш после инструкции),
+# так что на запрос обрабатывается только хвост с темой и текстом.
+PROMPT_PREFIXES = tuple(_template_prefix(t) for t in (PROMPT_ESSAY, PROMPT_EGE, PROMPT_VALIDATE_THEME))
+LLAMA_PREFIX_CACHE = os.getenv("LLAMA_PREFIX_CACHE", "1") != "0"
+
+
+class _ModelSlot:
+    """Контекст модели одного слота и сохранённые состояния для префиксов промптов."""
+
+    def __init__(self, model):
+        self.model = model
+        self.prefix_states: dict[str, tuple[list[int], Any]] = {}
+        self.grammars: dict[str, Any] = {}
+
+    def grammar(self, gbnf: str):
+        """Скомпилированная грамматика (кэшируется в слоте: объект грамматики не разделяется между потоками)."""
+        compiled = self.grammars.get(gbnf)
+        if compiled is None:
+            from llama_cpp import LlamaGrammar
+
+            compiled = LlamaGrammar.from_string(gbnf, verbose=False)
+            self.grammars[gbnf] = compiled
+        return compiled
+
+
+def _restore_prefix(slot: _ModelSlot, prompt: str) -> None:
+    """
+    Подготавливает контекст слота к промпту с известным префиксом: восстанавливает сохранённое
+    состояние (или вычисляет и сохраняет его при первом запросе). Дальше llama-cpp сам находит
+    общий префикс токенов и прогоняет только оставшуюся часть промпта.
+    """
+    prefix = next((p for p in PROMPT_PREFIXES if prompt.startswith(p)), None)
+    if prefix is None:
+        return
+    model = slot.model
+    saved = slot.prefix_states.get(prefix)
+    if saved is None:
+        tokens = model.tokenize(prefix.encode("utf-8"), add_bos=True, special=True)
+        model.reset()
+        model.eval(tokens)
+        slot.prefix_states[prefix] = (tokens, model.save_state())
+        logger.info("essay_eval: сохранено состояние префикса промпта (%s токенов)", len(tokens))
+        return
+    tokens, state = saved
+    n = len(tokens)
+    if model.n_tokens >= n and list(model.input_ids[:n]) == tokens:
+        return
+    model.load_state(state)
+
+
+def _available_memory_mb() -> int | None:
+    """Доступная память: MemAvailable, но не больше остатка до лимита cgroup (контейнер)."""
+    available = None
+    try:
+        with open("/proc/meminfo", encoding="ascii") as f:
+            for line in f:
+                if line.startswith("MemAvailable:"):
+                    available = int(line.split()[1]) // 1024
+                    break
+    except OSError:
+        return None
+    try:
+        with open("/sys/fs/cgroup/memory.max", encoding="ascii") as f:
+            limit = f.read().strip()
+        with open("/sys/fs/cgroup/memory.current", encoding="ascii") as f:
+            current = int(f.read().strip())
+        if limit != "max":
+            left = (int(limit) - current) // (1024 * 1024)
+            available = left if available is None else min(available, left)
+    except (OSError, ValueError):
+        pass
+    return available
+
+
+def _gpu_offload() -> bool:
+    if LLAMA_N_GPU_LAYERS == 0:
+        return False
+    try:
+        from llama_cpp import llama_supports_gpu_offload
+    except ImportError:
+        return False
+    return bool(llama_supports_gpu_offload())
+
+
+def _llama_slot_count() -> int:
+    """
+    Сколько слотов создаёт LlamaCppBackend: каждый слот — отдельный Llama(). На GPU это копия весов
+    на слот, поэтому не больше LLAMA_GPU_SLOTS; на CPU веса общие (mmap), а слоты ограничены
+    доступной памятью из расчёта LLAMA_SLOT_MEMORY_MB на слот.
+    """
+    requested = LLAMA_N_PARALLEL
+    if requested == 1:
+        return 1
+    if _gpu_offload():
+        slots = min(requested, LLAMA_GPU_SLOTS)
+        reason = f"на GPU у каждого слота своя копия весов, LLAMA_GPU_SLOTS={LLAMA_GPU_SLOTS}"
+    else:
+        available = _available_memory_mb()
+        if available is None:
+            return requested
+        path = _model_path()
+        weights = path.stat().st_size // (1024 * 1024) if path.exists() else 0
+        slots = max(1, min(requested, (available - weights) // LLAMA_SLOT_MEMORY_MB))
+        reason = f"доступно {available} МБ, веса {weights} МБ, на слот {LLAMA_SLOT_MEMORY_MB} МБ"
+    if slots < requested:
+        logger.warning("essay_eval: LLAMA_N_PARALLEL=%s уменьшено до %s слотов (%s)", requested, slots, reason)
+    return slots
+
+
+class InferenceBackend(ABC):
+    """
+    Бэкенд генерации для движка инференса: create_slot() создаёт контекст для одного слота,
+    complete() выполняет в нём completion (ответ в формате llama-cpp: {"choices": [{"text": ...}]}).
+    Бэкенд без любого из методов не создаётся (TypeError при создании, а не во время оценки).
+    """
+
+    name = "base"
+
+    @abstractmethod
+    def model_id(self) -> str:
+        """Идентификатор модели (входит в отпечаток кэша результатов оценки)."""
+
+    @abstractmethod
+    def create_slot(self) -> Any:
+        """Контекст модели для одного слота."""
+
+    @abstractmethod
+    def complete(
+        self, slot: Any, prompt: str, params: dict[str, Any], on_text: Callable[[str], None] | None = None
+    ) -> dict[str, Any]:
+        """Completion в слоте slot."""
+
+    def n_slots(self) -> int:
+        """Сколько слотов создать движку; по умолчанию LLAMA_N_PARALLEL."""
+        return LLAMA_N_PARALLEL
+
+
+class LlamaCppBackend(InferenceBackend):
+    """Локальная модель GGUF через llama-cpp-python."""
+
+    name = "llama"
+
+    def __init__(self) -> None:
+        self._n_slots: int | None = None
+
+    def model_id(self) -> str:
+        return _model_path().name
+
+    def n_slots(self) -> int:
+        if self._n_slots is None:
+            self._n_slots = _llama_slot_count()
+        return self._n_slots
+
+    def create_slot(self) -> _ModelSlot:
         from llama_cpp import Llama
 
         path = _model_path()
         if not path.exists():
             raise FileNotFoundError(f"Модель не найдена: {path}")
-        _llama_model = Llama(
+        model = Llama(
             model_path=str(path),
             n_ctx=8192,
-            n_gpu_layers=-1,
-            n_threads=6,
+            n_gpu_layers=LLAMA_N_GPU_LAYERS,
+            n_threads=max(1, LLAMA_N_THREADS // self.n_slots()),
             n_batch=512,
+            use_mmap=True,
             verbose=False,
         )
-    return _llama_model
+        return _ModelSlot(model)
+
+    def complete(
+        self, slot: _ModelSlot, prompt: str, params: dict[str, Any], on_text: Callable[[str], None] | None = None
+    ) -> dict[str, Any]:
+        """
+        params — аргументы llama-cpp; grammar передаётся текстом GBNF и компилируется в слоте.
+        С on_text генерация идёт потоком: каждый фрагмент текста сразу передаётся в on_text.
+        """
+        params = dict(params)
+        gbnf = params.pop("grammar", None)
+        if gbnf:
+            params["grammar"] = slot.grammar(gbnf)
+        if LLAMA_PREFIX_CACHE:
+            _restore_prefix(slot, prompt)
+        if on_text is None:
+            return slot.model(prompt, **params)
+
+        parts: list[str] = []
+        for chunk in slot.model(prompt, stream=True, **params):
+            piece = _get_response_chunk(chunk)
+            if piece:
+                parts.append(piece)
+                on_text(piece)
+        return {"choices": [{"text": "".join(parts)}]}
+
+
+class StubBackend(InferenceBackend):
+    """
+    Детерминированная заглушка для нагрузочных тестов без модели: по типу промпта отдаёт готовый JSON
+    (баллы зависят от хэша промпта) с задержкой STUB_LATENCY_MS, потоково — кусками по STUB_CHUNK_CHARS.
+    """
 
-GEMMA_USER_PREFIX = "<start_of_turn>user\n"
-GEMMA_USER_SUFFIX = "<end_of_turn>\n<start_of_turn>model\n"
+    name = "stub"
 
-GEMMA_TOP_K = 64
-GEMMA_TOP_P = 0.95
-GEMMA_REPEAT_PENALTY = 1.0
-GEMMA_MIN_P = 0.01
+    def __init__(self, latency_ms: float = 0.0, chunk_chars: int = 32):
+        self.latency_sec = max(0.0, latency_ms) / 1000
+        self.chunk_chars = max(1, chunk_chars)
 
+    def model_id(self) -> str:
+        return "stub"
 
-def _gemma_prompt(prompt: str) -> str:
-    """Оборачивает промпт в формат Gemma (user turn + начало ответа model)."""
-    return GEMMA_USER_PREFIX + prompt + GEMMA_USER_SUFFIX
+    def create_slot(self) -> None:
+        return None
+
+    def _response(self, prompt: str) -> dict[str, Any]:
+        rng = random.Random(hashlib.sha256(prompt.encode("utf-8")).digest())
+        if prompt.startswith(PROMPT_PREFIXES[2]):
+            return {"valid": True, "message": ""}
+        if prompt.startswith(PROMPT_PREFIXES[1]):
+            max_by_criterion = EGE_MAX_BY_CRITERION
+        else:
+            max_by_criterion = {f"k{i}": 1 for i in range(1, 6)}
+        criteries = {k: {"score": rng.randint(0, m), "comment": "stub"} for k, m in max_by_criterion.items()}
+        mistakes = []
+        for t in MISTAKE_TYPES:
+            count = rng.randint(0, 3)
+            ranges = [[start, start + 5] for start in sorted(rng.sample(range(0, 500, 10), count))]
+            mistakes.append({"type": t, "count": count, "ranges": ranges})
+        return {"criteries": criteries, "common_mistakes": mistakes}
+
+    def complete(
+        self, slot: None, prompt: str, params: dict[str, Any], on_text: Callable[[str], None] | None = None
+    ) -> dict[str, Any]:
+        text = json.dumps(self._response(prompt), ensure_ascii=False)
+        if on_text is None:
+            if self.latency_sec:
+                time.sleep(self.latency_sec)
+        else:
+            pieces = [text[i : i + self.chunk_chars] for i in range(0, len(text), self.chunk_chars)]
+            for piece in pieces:
+                if self.latency_sec:
+                    time.sleep(self.latency_sec / len(pieces))
+                on_text(piece)
+        return {"choices": [{"text": text}]}
+
+
+INFERENCE_BACKEND = os.getenv("INFERENCE_BACKEND", "llama")
+_backend: InferenceBackend | None = None
+
+
+def _get_backend() -> InferenceBackend:
+    global _backend
+    if _backend is None:
+        if INFERENCE_BACKEND == "stub":
+            _backend = StubBackend(
+                latency_ms=float(os.getenv("STUB_LATENCY_MS", "0")),
+                chunk_chars=int(os.getenv("STUB_CHUNK_CHARS", "32")),
+            )
+        elif INFERENCE_BACKEND == "llama":
+            _backend = LlamaCppBackend()
+        else:
+            raise ValueError(f"Неизвестный INFERENCE_BACKEND: {INFERENCE_BACKEND!r} (llama или stub)")
+    return _backend
+
+
+def _get_engine() -> InferenceEngine:
+    global _engine
+    if _engine is None:
+        with _engine_lock:
+            if _engine is None:
+                backend = _get_backend()
+                _engine = InferenceEngine(backend.create_slot, backend.complete, n_slots=backend.n_slots())
+    return _engine
 
 
 def _extract_json(text: str) -> dict[str, Any]:
@@ -194,6 +534,71 @@ def _get_response_text(out: dict[str, Any]) -> str:
     return ""
 
 
+
+def _get_response_chunk(chunk: dict[str, Any]) -> str:
+    """Фрагмент текста из потокового ответа llama-cpp (без strip — пробелы важны при склейке)."""
+    choices = chunk.get("choices") or []
+    if not choices or not isinstance(choices[0], dict):
+        return ""
+    return choices[0].get("text") or ""
+
+
+class _ProgressParser:
+    """
+    Инкрементальный разбор JSON-ответа оценки по мере генерации: возвращает события
+    ("criterion", ключ, объект) как только JSON критерия закрыт, и ("mistakes", список)
+    после закрытия common_mistakes.
+    """
+
+    def __init__(self):
+        self._buf = ""
+        self._pos = 0
+        self._stack: list[tuple[str | None, int]] = []
+        self._in_string = False
+        self._escape = False
+        self._str_start = 0
+        self._last_string: str | None = None
+        self._pending_key: str | None = None
+
+    def feed(self, piece: str) -> list[tuple]:
+        events: list[tuple] = []
+        self._buf += piece
+        buf = self._buf
+        while self._pos < len(buf):
+            i = self._pos
+            c = buf[i]
+            self._pos += 1
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif c == "\\":
+                    self._escape = True
+                elif c == '"':
+                    self._in_string = False
+                    self._last_string = buf[self._str_start + 1 : i]
+                continue
+            if c == '"':
+                self._in_string = True
+                self._str_start = i
+            elif c == ":":
+                self._pending_key = self._last_string
+            elif c == ",":
+                self._pending_key = None
+            elif c in "{[":
+                self._stack.append((self._pending_key, i))
+                self._pending_key = None
+            elif c in "}]" and self._stack:
+                key, start = self._stack.pop()
+                parent = self._stack[-1][0] if self._stack else None
+                try:
+                    if len(self._stack) == 2 and parent in ("criteries", "criteria") and key:
+                        events.append(("criterion", key, json.loads(buf[start : i + 1])))
+                    elif len(self._stack) == 1 and key in ("common_mistakes", "mistakes"):
+                        events.append(("mistakes", json.loads(buf[start : i + 1])))
+                except json.JSONDecodeError:
+                    pass
+        return events
+
 def _normalize_result_essay(raw: dict[str, Any]) -> dict[str, Any]:
     """Приводит ответ модели к формату: criteries (k1–k5), по каждому score только 0 или 1 (зачет/незачет)."""
     criteries = raw.get("criteries") or raw.get("criteria") or {}
@@ -249,7 +654,7 @@ def _normalize_result_ege(raw: dict[str, Any]) -> dict[str, Any]:
     result_criteries = {}
     for i in range(1, 11):
         key = f"K{i}"
-        max_val = EGE_MAX_BY_CRITERION.get(key, 0)
+        max_val = EGE_MAX_BY_CRITERION.get(f"k{i}", 0)
         val = criteries.get(key) or criteries.get(f"k{i}") or criteries.get(str(i))
         if isinstance(val, dict):
             s = val.get("score")
@@ -294,26 +699,31 @@ def _normalize_result_ege(raw: dict[str, Any]) -> dict[str, Any]:
 
 
 def validate_theme_sync(theme: str) -> dict[str, Any]:
-    """Проверка темы сочинения моделью: осмысленная формулировка или нет. Возвращает {"valid": bool, "message": str}."""
+    """
+    Проверка темы сочинения моделью: осмысленная формулировка или нет. Возвращает {"valid": bool, "message": str};
+    parsed=False, если ответ модели не получен или не разобран (такой вердикт нельзя кэшировать).
+    """
     theme_stripped = theme.strip()[:512]
     if len(theme_stripped) < 2:
         return {"valid": False, "message": "Тема слишком короткая. Напишите формулировку темы сочинения."}
 
-    model = _get_model()
+    engine = _get_engine()
     prompt = PROMPT_VALIDATE_THEME.format(theme=theme_stripped)
 
     prompt_with_format = _gemma_prompt(prompt)
+    params = {
+        "max_tokens": 256,
+        "temperature": 0,
+        "top_k": GEMMA_TOP_K,
+        "top_p": GEMMA_TOP_P,
+        "repeat_penalty": GEMMA_REPEAT_PENALTY,
+        "min_p": GEMMA_MIN_P,
+        "stop": ["</s>", "<end_of_turn>"],
+    }
+    if LLAMA_JSON_GRAMMAR:
+        params["grammar"] = VALIDATE_THEME_GRAMMAR
     for attempt in range(2):
-        out = model(
-            prompt_with_format,
-            max_tokens=256,
-            temperature=0,
-            top_k=GEMMA_TOP_K,
-            top_p=GEMMA_TOP_P,
-            repeat_penalty=GEMMA_REPEAT_PENALTY,
-            min_p=GEMMA_MIN_P,
-            stop=["</s>", "<end_of_turn>"],
-        )
+        out = engine.submit_sync(prompt_with_format, params)
         response_text = _get_response_text(out)
         if response_text:
             break
@@ -323,7 +733,7 @@ def validate_theme_sync(theme: str) -> dict[str, Any]:
             theme_stripped[:100],
         )
     else:
-        return {"valid": False, "message": "Не удалось проверить тему. Попробуйте ещё раз."}
+        return {"valid": False, "message": "Не удалось проверить тему. Попробуйте ещё раз.", "parsed": False}
 
     try:
         raw = _extract_json(response_text)
@@ -337,13 +747,65 @@ def validate_theme_sync(theme: str) -> dict[str, Any]:
             response_text[:300],
             e,
         )
-        return {"valid": False, "message": "Не удалось проверить тему. Попробуйте ещё раз."}
+        return {"valid": False, "message": "Не удалось проверить тему. Попробуйте ещё раз.", "parsed": False}
+
+
+ESSAY_TEXT_LIMIT = 8000
+ESSAY_EVAL_PARAMS = {
+    "max_tokens": 1536,
+    "temperature": 0.3,
+    "top_k": GEMMA_TOP_K,
+    "top_p": GEMMA_TOP_P,
+    "repeat_penalty": GEMMA_REPEAT_PENALTY,
+    "min_p": GEMMA_MIN_P,
+    "stop": ["</s>", "<end_of_turn>", "\n\n\n"],
+}
+# Версия промптов оценки: меняется при любом изменении шаблонов или грамматик
+EVAL_PROMPT_VERSION = hashlib.sha256(
+    "\0".join((PROMPT_ESSAY, PROMPT_EGE, ESSAY_GRAMMAR, EGE_GRAMMAR)).encode("utf-8")
+).hexdigest()[:16]
+
+
+def model_id() -> str:
+    """Идентификатор модели этого процесса; воркер оценки получает его от model_server (op model_id)."""
+    return _get_backend().model_id()
 
 
-def evaluate_essay_sync(theme: str, text: str, essay_type: str = "essay") -> dict[str, Any]:
+def evaluation_fingerprint(theme: str, text: str, essay_type: str, model: str) -> str:
+    """
+    Хэш всего, от чего зависит результат оценки: тип, тема, текст, модель (model_id процесса,
+    который оценивает), версия промптов, параметры генерации. Текст нормализуется только так,
+    чтобы не сдвинуть позиции ошибок (ranges): NFC и обрезка пробелов в конце.
+    """
+    normalized_text = unicodedata.normalize("NFC", text[:ESSAY_TEXT_LIMIT]).rstrip()
+    payload = json.dumps(
+        [
+            essay_type if essay_type == "ege" else "essay",
+            " ".join(theme.split()),
+            normalized_text,
+            model,
+            EVAL_PROMPT_VERSION,
+            ESSAY_EVAL_PARAMS,
+            LLAMA_JSON_GRAMMAR,
+        ],
+        ensure_ascii=False,
+        sort_keys=True,
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def evaluate_essay_sync(
+    theme: str,
+    text: str,
+    essay_type: str = "essay",
+    on_progress: Callable[[dict[str, Any]], None] | None = None,
+) -> dict[str, Any]:
     """
     Синхронная оценка сочинения. essay_type: "essay" (итоговое, k1–k5, макс 25) или "ege" (К1–К10, макс 22).
-    Возвращает: criteries, common_mistakes, max_score, total_score (сырые баллы), total_score_per (0–1).
+    Возвращает: criteries, common_mistakes, max_score, total_score (сырые баллы), total_score_per (0–1),
+    parsed (False, если ответ модели пуст или не разобран и баллы выставлены по умолчанию).
+    on_progress (если задан) вызывается во время генерации: {"event": "criterion", "key", "data"} по мере
+    готовности каждого критерия и {"event": "mistakes", "data"} после списка ошибок.
     """
     is_ege = essay_type == "ege"
     if is_ege:
@@ -359,22 +821,32 @@ def evaluate_essay_sync(theme: str, text: str, essay_type: str = "essay") -> dic
         default_criteries = {f"k{i}": {"score": 0, "comment": "", "found_in_text": [], "suggestions": []} for i in range(1, 6)}
         normalizer = _normalize_result_essay
 
-    model = _get_model()
-    text_truncated = text[:8000]
+    engine = _get_engine()
+    text_truncated = text[:ESSAY_TEXT_LIMIT]
     # Экранируем фигурные скобки в тексте пользователя, чтобы они не конфликтовали с .format()
     text_escaped = text_truncated.replace("{", "{{").replace("}", "}}")
     prompt = prompt_tpl.format(theme=theme, text=text_escaped)
     prompt_with_format = _gemma_prompt(prompt)
-    out = model(
-        prompt_with_format,
-        max_tokens=1536,
-        temperature=0.3,
-        top_k=GEMMA_TOP_K,
-        top_p=GEMMA_TOP_P,
-        repeat_penalty=GEMMA_REPEAT_PENALTY,
-        min_p=GEMMA_MIN_P,
-        stop=["</s>", "<end_of_turn>", "\n\n\n"],
-    )
+    params = dict(ESSAY_EVAL_PARAMS)
+    if LLAMA_JSON_GRAMMAR:
+        params["grammar"] = EGE_GRAMMAR if is_ege else ESSAY_GRAMMAR
+
+    on_text = None
+    if on_progress is not None:
+        parser = _ProgressParser()
+
+        def on_text(piece: str) -> None:
+            for event in parser.feed(piece):
+                if event[0] == "criterion":
+                    key = event[1].upper() if is_ege else event[1].lower()
+                    criterion = normalizer({"criteries": {key: event[2]}})["criteries"].get(key)
+                    if criterion is not None:
+                        on_progress({"event": "criterion", "key": key, "data": criterion})
+                else:
+                    mistakes = normalizer({"common_mistakes": event[1]})["common_mistakes"]
+                    on_progress({"event": "mistakes", "data": mistakes})
+
+    out = engine.submit_sync(prompt_with_format, params, on_text)
     response_text = _get_response_text(out)
     if not response_text:
         logger.warning("essay_eval: модель вернула пустой ответ")
@@ -384,13 +856,16 @@ def evaluate_essay_sync(theme: str, text: str, essay_type: str = "essay") -> dic
             "max_score": max_score,
             "total_score": 0.0,
             "total_score_per": 0.0,
+            "parsed": False,
         }
 
+    parsed = True
     try:
         raw = _extract_json(response_text)
     except json.JSONDecodeError as e:
         logger.warning("essay_eval: не удалось распарсить JSON из ответа (первые 500 символов): %s ... ошибка: %s", response_text[:500], e)
         raw = {}
+        parsed = False
 
     normalized = normalizer(raw)
     criteries = normalized["criteries"]
@@ -406,4 +881,5 @@ def evaluate_essay_sync(theme: str, text: str, essay_type: str = "essay") -> dic
         "max_score": max_score,
         "total_score": total_raw,
         "total_score_per": total_score_per,
+        "parsed": parsed,
     }
@@ -0,0 +1,428 @@
+"""
+Активное (незавершённое) сочинение пользователя в Redis.
+Состояние хранится хэшем essay:active:{user_id}: метаданные (user_id, type, theme, started_at),
+текст и номер версии в отдельных полях. Автосохранение может прислать либо весь текст,
+либо правки (смещение + замена) относительно известной клиенту версии — тогда по сети и в Redis
+передаётся только изменённый фрагмент, а параллельная вкладка со старой версией получает 409.
+Смещения в правках — в кодовых точках Unicode (для текста без эмодзи совпадают с индексами строк JS).
+
+Жизненный цикл (создание, сохранение, завершение) — Lua-скрипты: каждая операция выполняется
+атомарно за один запрос к Redis. Скрипты загружаются в Redis при старте API (load_scripts).
+При завершении сочинение переименовывается в essay:finishing:{user_id} — повторная отправка
+той же формы получает 409, а не второе сочинение в БД.
+
+Каждое изменение помечает пользователя в множестве essay:dirty; api.essay_drafts периодически
+переносит такие черновики в Postgres (essay_drafts). Если сочинения нет в Redis (вытеснено по
+maxmemory — ключам задан TTL для volatile-lru, — или Redis перезапущен без данных), оно
+восстанавливается из черновика. Завершённое или сброшенное сочинение оставляет маркер
+essay:closed:{user_id} со своим started_at, чтобы запоздалая запись черновика его не воскресила.
+Чтобы промах в Redis (пользователь без активного сочинения — обычный случай) не шёл каждый раз
+в Postgres, отсутствие черновика запоминается маркером essay:nodraft:{user_id} на
+NO_DRAFT_MARKER_TTL_SEC; создание сочинения маркер снимает.
+"""
+import logging
+import os
+from datetime import datetime
+from typing import Any, Optional
+
+from fastapi import HTTPException
+from redis.exceptions import ResponseError
+
+from api.db import AsyncSessionLocal
+from api.models import EssayDraft
+from api.redis_client import redis_client
+from api.schemas import EssayState, EssayTextOp
+
+logger = logging.getLogger(__name__)
+
+ACTIVE_ESSAY_PREFIX = "essay:active:"
+FINISHING_ESSAY_PREFIX = "essay:finishing:"
+CLOSED_ESSAY_PREFIX = "essay:closed:"
+NO_DRAFT_PREFIX = "essay:nodraft:"
+DIRTY_ESSAYS_KEY = "essay:dirty"
+# Срок жизни активного сочинения в Redis с последнего сохранения (дальше — только черновик в БД)
+ACTIVE_ESSAY_TTL_SEC = int(os.getenv("ACTIVE_ESSAY_TTL_SEC", str(14 * 24 * 3600)))
+CLOSED_MARKER_TTL_SEC = 3600
+NO_DRAFT_MARKER_TTL_SEC = int(os.getenv("NO_DRAFT_MARKER_TTL_SEC", "3600"))
+# Сколько живёт захваченное для завершения сочинение, если процесс API упал до записи в БД
+FINISH_CLAIM_TTL_SEC = 300
+
+# Сдвиг на n кодовых точек UTF-8 от байтовой позиции pos; nil — если текст закончился раньше
+_LUA_ADVANCE = """
+local function advance(text, pos, n)
+    local len = #text
+    while n > 0 do
+        if pos > len then
+            return nil
+        end
+        pos = pos + 1
+        while pos <= len do
+            local b = string.byte(text, pos)
+            if b < 128 or b >= 192 then
+                break
+            end
+            pos = pos + 1
+        end
+        n = n - 1
+    end
+    return pos
+end
+"""
+
+# Во всех скриптах изменения: KEYS[1] — активное сочинение, KEYS[2] — essay:dirty.
+# Полная замена текста. ARGV: текст, ожидаемая версия ('' — без проверки), TTL, user_id.
+# Ответ: {0} — нет сочинения, {-1, версия} — конфликт версий, {1, версия, user_id, type, theme, started_at}
+_SAVE_LUA = """
+if redis.call('EXISTS', KEYS[1]) == 0 then
+    return {0}
+end
+local version = tonumber(redis.call('HGET', KEYS[1], 'version') or '0')
+if ARGV[2] ~= '' and tonumber(ARGV[2]) ~= version then
+    return {-1, version}
+end
+version = version + 1
+redis.call('HSET', KEYS[1], 'text', ARGV[1], 'version', version)
+redis.call('EXPIRE', KEYS[1], ARGV[3])
+redis.call('SADD', KEYS[2], ARGV[4])
+local meta = redis.call('HMGET', KEYS[1], 'user_id', 'type', 'theme', 'started_at')
+return {1, version, meta[1], meta[2], meta[3], meta[4]}
+"""
+
+# Правки текста. ARGV: ожидаемая версия, TTL, user_id, далее тройки (offset, delete, insert) — по порядку.
+# Ответ: {0} — нет сочинения, {-1, версия} — конфликт версий, {-2, версия} — смещение за концом текста,
+# {1, новая версия}
+_PATCH_LUA = _LUA_ADVANCE + """
+if redis.call('EXISTS', KEYS[1]) == 0 then
+    return {0}
+end
+local version = tonumber(redis.call('HGET', KEYS[1], 'version') or '0')
+if tonumber(ARGV[1]) ~= version then
+    return {-1, version}
+end
+local text = redis.call('HGET', KEYS[1], 'text') or ''
+for i = 4, #ARGV, 3 do
+    local start = advance(text, 1, tonumber(ARGV[i]))
+    local stop = start and advance(text, start, tonumber(ARGV[i + 1]))
+    if not stop then
+        return {-2, version}
+    end
+    text = string.sub(text, 1, start - 1) .. ARGV[i + 2] .. string.sub(text, stop)
+end
+version = version + 1
+redis.call('HSET', KEYS[1], 'text', text, 'version', version)
+redis.call('EXPIRE', KEYS[1], ARGV[2])
+redis.call('SADD', KEYS[2], ARGV[3])
+return {1, version}
+"""
+
+# Создать, только если активного сочинения нет. KEYS[3] — маркер «черновика нет».
+# ARGV: TTL, user_id, '1' — создавать только при маркере, далее пары поле/значение.
+# Ответ: 1 — создано, 0 — уже есть, -1 — нет маркера (черновик надо проверить в БД)
+_CREATE_LUA = """
+if redis.call('EXISTS', KEYS[1]) == 1 then
+    return 0
+end
+if ARGV[3] == '1' and redis.call('EXISTS', KEYS[3]) == 0 then
+    return -1
+end
+redis.call('HSET', KEYS[1], unpack(ARGV, 4))
+redis.call('EXPIRE', KEYS[1], ARGV[1])
+redis.call('SADD', KEYS[2], ARGV[2])
+redis.call('DEL', KEYS[3])
+return 1
+"""
+
+# Запомнить, что черновика нет, если активного сочинения по-прежнему нет (иначе его черновик
+# может появиться в БД). KEYS — активное, маркер; ARGV[1] — TTL маркера
+_NO_DRAFT_LUA = """
+if redis.call('EXISTS', KEYS[1]) == 1 then
+    return 0
+end
+redis.call('SET', KEYS[2], '1', 'EX', ARGV[1])
+return 1
+"""
+
+# Захват для завершения: KEYS — активное, завершаемое, маркер закрытия; ARGV — TTL захвата, TTL маркера.
+# Ответ: {0} — нет сочинения, {-1} — уже завершается, {1, поле, значение, ...}
+_CLAIM_LUA = """
+if redis.call('EXISTS', KEYS[1]) == 0 then
+    if redis.call('EXISTS', KEYS[2]) == 1 then
+        return {-1}
+    end
+    return {0}
+end
+local started_at = redis.call('HGET', KEYS[1], 'started_at')
+redis.call('RENAME', KEYS[1], KEYS[2])
+redis.call('EXPIRE', KEYS[2], ARGV[1])
+redis.call('SET', KEYS[3], started_at, 'EX', ARGV[2])
+local data = redis.call('HGETALL', KEYS[2])
+table.insert(data, 1, 1)
+return data
+"""
+
+# Вернуть захваченное сочинение (запись в БД не удалась), если пользователь не начал новое.
+# KEYS — активное, завершаемое, маркер закрытия, essay:dirty; ARGV — TTL, user_id
+_RELEASE_LUA = """
+if redis.call('EXISTS', KEYS[2]) == 0 or redis.call('EXISTS', KEYS[1]) == 1 then
+    return 0
+end
+redis.call('RENAME', KEYS[2], KEYS[1])
+redis.call('EXPIRE', KEYS[1], ARGV[1])
+redis.call('DEL', KEYS[3])
+redis.call('SADD', KEYS[4], ARGV[2])
+return 1
+"""
+
+# Сбросить активное сочинение. KEYS — активное, маркер закрытия; ARGV[1] — TTL маркера
+_CLOSE_LUA = """
+local started_at = redis.call('HGET', KEYS[1], 'started_at')
+if not started_at then
+    return 0
+end
+redis.call('DEL', KEYS[1])
+redis.call('SET', KEYS[2], started_at, 'EX', ARGV[1])
+return 1
+"""
+
+_create_script = redis_client.register_script(_CREATE_LUA)
+_save_script = redis_client.register_script(_SAVE_LUA)
+_patch_script = redis_client.register_script(_PATCH_LUA)
+_claim_script = redis_client.register_script(_CLAIM_LUA)
+_release_script = redis_client.register_script(_RELEASE_LUA)
+_close_script = redis_client.register_script(_CLOSE_LUA)
+_no_draft_script = redis_client.register_script(_NO_DRAFT_LUA)
+_SCRIPTS = (
+    _create_script, _save_script, _patch_script, _claim_script, _release_script, _close_script, _no_draft_script,
+)
+
+
+def active_essay_key(user_id: str) -> str:
+    return f"{ACTIVE_ESSAY_PREFIX}{user_id}"
+
+
+def _finishing_key(user_id: str) -> str:
+    return f"{FINISHING_ESSAY_PREFIX}{user_id}"
+
+
+def closed_essay_key(user_id: str) -> str:
+    return f"{CLOSED_ESSAY_PREFIX}{user_id}"
+
+
+def _no_draft_key(user_id: str) -> str:
+    return f"{NO_DRAFT_PREFIX}{user_id}"
+
+
+async def load_scripts() -> None:
+    """Загружает Lua-скрипты в Redis (при старте), чтобы вызовы сразу шли через EVALSHA."""
+    for script in _SCRIPTS:
+        await redis_client.script_load(script.script)
+
+
+def _not_found() -> HTTPException:
+    return HTTPException(status_code=404, detail="Активное сочинение не найдено.")
+
+
+def _conflict(version: int) -> HTTPException:
+    return HTTPException(
+        status_code=409,
+        detail={"message": "Сочинение изменено в другой вкладке.", "version": version},
+    )
+
+
+def _to_hash(state: EssayState) -> dict[str, Any]:
+    return {
+        "user_id": state.user_id,
+        "type": state.type,
+        "theme": state.theme,
+        "started_at": state.started_at.isoformat(),
+        "text": state.text,
+        "version": state.version,
+    }
+
+
+async def _upgrade_legacy(key: str) -> None:
+    """Переводит состояние из прежнего формата (JSON-строка EssayState) в хэш."""
+    data = await redis_client.get(key)
+    if data is None:
+        return
+    state = EssayState.model_validate_json(data)
+    pipe = redis_client.pipeline(transaction=True)
+    pipe.delete(key)
+    pipe.hset(key, mapping=_to_hash(state))
+    pipe.expire(key, ACTIVE_ESSAY_TTL_SEC)
+    pipe.sadd(DIRTY_ESSAYS_KEY, state.user_id)
+    await pipe.execute()
+    logger.info("essay_store: состояние %s переведено в хэш", key)
+
+
+def from_hash(data: dict[str, str]) -> EssayState:
+    return EssayState(
+        user_id=data["user_id"],
+        type=data["type"],
+        theme=data["theme"],
+        text=data.get("text", ""),
+        started_at=datetime.fromisoformat(data["started_at"]),
+        version=int(data.get("version", 0)),
+    )
+
+
+async def _run(script, keys: list[str], args: list[Any]) -> Any:
+    try:
+        return await script(keys=keys, args=args)
+    except ResponseError as e:
+        if "WRONGTYPE" not in str(e):
+            raise
+        await _upgrade_legacy(keys[0])
+        return await script(keys=keys, args=args)
+
+
+async def _create(state: EssayState, require_no_draft: bool = False) -> int:
+    """1 — создано, 0 — активное уже есть, -1 (только с require_no_draft) — черновик не проверен."""
+    args: list[Any] = [ACTIVE_ESSAY_TTL_SEC, state.user_id, "1" if require_no_draft else "0"]
+    for field, value in _to_hash(state).items():
+        args.extend((field, value))
+    keys = [active_essay_key(state.user_id), DIRTY_ESSAYS_KEY, _no_draft_key(state.user_id)]
+    return int(await _create_script(keys=keys, args=args))
+
+
+async def mark_no_draft(user_id: str) -> None:
+    """Запоминает, что черновика в БД нет (после удаления черновика или пустой проверки)."""
+    try:
+        await _no_draft_script(
+            keys=[active_essay_key(user_id), _no_draft_key(user_id)], args=[NO_DRAFT_MARKER_TTL_SEC]
+        )
+    except Exception as e:
+        # Без маркера следующий промах просто сходит в БД
+        logger.warning("essay_store: не удалось запомнить отсутствие черновика %s: %s", user_id, e)
+
+
+async def _rehydrate(user_id: str) -> bool:
+    """Восстанавливает сочинение в Redis из черновика в БД. True, если черновик был."""
+    if await redis_client.exists(_no_draft_key(user_id)):
+        return False
+    async with AsyncSessionLocal() as session:
+        draft = await session.get(EssayDraft, user_id)
+    if draft is None:
+        await mark_no_draft(user_id)
+        return False
+    closed = await redis_client.get(closed_essay_key(user_id))
+    if closed and datetime.fromisoformat(closed) == draft.started_at:
+        # Черновик завершённого сочинения удаляет завершающий запрос
+        return False
+    state = EssayState(
+        user_id=draft.user_id,
+        type=draft.essay_type,
+        theme=draft.theme,
+        text=draft.text,
+        started_at=draft.started_at,
+        version=draft.version,
+    )
+    if await _create(state):
+        logger.info("essay_store: сочинение %s восстановлено из черновика (version=%s)", user_id, draft.version)
+    return True
+
+
+async def get_active_essay(user_id: str) -> Optional[EssayState]:
+    key = active_essay_key(user_id)
+    try:
+        data = await redis_client.hgetall(key)
+    except ResponseError as e:
+        if "WRONGTYPE" not in str(e):
+            raise
+        await _upgrade_legacy(key)
+        data = await redis_client.hgetall(key)
+    if not data:
+        if not await _rehydrate(user_id):
+            return None
+        data = await redis_client.hgetall(key)
+    return from_hash(data) if data else None
+
+
+async def create_active_essay(state: EssayState) -> bool:
+    """Сохраняет новое активное сочинение; False, если у пользователя уже есть активное."""
+    # Обычно маркер «черновика нет» на месте, и создание — один запрос к Redis без БД
+    created = await _create(state, require_no_draft=True)
+    if created >= 0:
+        return bool(created)
+    if await _rehydrate(state.user_id):
+        return False
+    return bool(await _create(state))
+
+
+async def save_active_text(user_id: str, text: str, version: Optional[int] = None) -> EssayState:
+    """Заменяет текст целиком; при переданной версии — только если она совпадает с текущей."""
+    keys = [active_essay_key(user_id), DIRTY_ESSAYS_KEY]
+    args = [text, "" if version is None else version, ACTIVE_ESSAY_TTL_SEC, user_id]
+    result = await _run(_save_script, keys, args)
+    if result[0] == 0 and await _rehydrate(user_id):
+        result = await _run(_save_script, keys, args)
+    if result[0] == 0:
+        raise _not_found()
+    if result[0] == -1:
+        raise _conflict(int(result[1]))
+    _, new_version, owner, essay_type, theme, started_at = result
+    return EssayState(
+        user_id=owner,
+        type=essay_type,
+        theme=theme,
+        text=text,
+        started_at=datetime.fromisoformat(started_at),
+        version=int(new_version),
+    )
+
+
+async def patch_active_text(user_id: str, version: int, ops: list[EssayTextOp]) -> int:
+    """Применяет правки к тексту версии version. Возвращает новую версию."""
+    keys = [active_essay_key(user_id), DIRTY_ESSAYS_KEY]
+    args: list[Any] = [version, ACTIVE_ESSAY_TTL_SEC, user_id]
+    for op in ops:
+        args.extend((op.offset, op.delete, op.insert))
+    result = await _run(_patch_script, keys, args)
+    if result[0] == 0 and await _rehydrate(user_id):
+        result = await _run(_patch_script, keys, args)
+    if result[0] == 0:
+        raise _not_found()
+    if result[0] == -1:
+        raise _conflict(int(result[1]))
+    if result[0] == -2:
+        raise HTTPException(status_code=422, detail="Правка выходит за пределы текста.")
+    return int(result[1])
+
+
+async def claim_active_essay(user_id: str) -> EssayState:
+    """
+    Забирает активное сочинение для завершения. После записи в БД — finish_claimed_essay,
+    при ошибке — release_claimed_essay.
+    """
+    keys = [active_essay_key(user_id), _finishing_key(user_id), closed_essay_key(user_id)]
+    args = [FINISH_CLAIM_TTL_SEC, CLOSED_MARKER_TTL_SEC]
+    result = await _run(_claim_script, keys, args)
+    if result[0] == 0 and await _rehydrate(user_id):
+        result = await _run(_claim_script, keys, args)
+    if result[0] == 0:
+        raise _not_found()
+    if result[0] == -1:
+        raise HTTPException(status_code=409, detail="Сочинение уже отправлено на проверку.")
+    fields = result[1:]
+    return from_hash(dict(zip(fields[::2], fields[1::2])))
+
+
+async def finish_claimed_essay(user_id: str) -> None:
+    """После коммита сочинения в БД (черновик удалён в той же транзакции)."""
+    await redis_client.delete(_finishing_key(user_id))
+    await mark_no_draft(user_id)
+
+
+async def release_claimed_essay(user_id: str) -> None:
+    try:
+        await _release_script(
+            keys=[active_essay_key(user_id), _finishing_key(user_id), closed_essay_key(user_id), DIRTY_ESSAYS_KEY],
+            args=[ACTIVE_ESSAY_TTL_SEC, user_id],
+        )
+    except Exception as e:
+        logger.warning("essay_store: не удалось вернуть сочинение %s: %s", user_id, e)
+
+
+async def delete_active_essay(user_id: str) -> None:
+    """Сбрасывает активное сочинение в Redis; черновик в БД удаляет вызывающий (essay_drafts.delete_draft)."""
+    await _run(_close_script, [active_essay_key(user_id), closed_essay_key(user_id)], [CLOSED_MARKER_TTL_SEC])
@@ -0,0 +1,62 @@
+"""
+Кэш результатов оценки сочинений в Redis по отпечатку (essay_eval.evaluation_fingerprint):
+одинаковый текст с той же темой, моделью, промптами и параметрами генерации не оценивается повторно.
+Записи живут EVAL_CACHE_TTL_SEC; при ограничении памяти Redis (maxmemory-policy volatile-lru)
+вытесняются самые давно использованные. Счётчики попаданий/промахов — в хэше evalcache:stats.
+"""
+import json
+import logging
+import os
+from typing import Any, Optional
+
+from api.redis_client import redis_client
+
+logger = logging.getLogger(__name__)
+
+EVAL_CACHE_ENABLED = os.getenv("EVAL_CACHE_ENABLED", "1") != "0"
+EVAL_CACHE_TTL_SEC = int(os.getenv("EVAL_CACHE_TTL_SEC", str(30 * 24 * 3600)))
+EVAL_CACHE_PREFIX = "evalcache:"
+EVAL_CACHE_STATS_KEY = "evalcache:stats"
+
+
+async def get_cached_evaluation(fingerprint: str) -> Optional[dict[str, Any]]:
+    """Результат оценки из кэша или None. Попадание продлевает срок жизни записи."""
+    if not EVAL_CACHE_ENABLED:
+        return None
+    key = f"{EVAL_CACHE_PREFIX}{fingerprint}"
+    try:
+        pipe = redis_client.pipeline(transaction=False)
+        pipe.get(key)
+        pipe.expire(key, EVAL_CACHE_TTL_SEC)
+        data, _ = await pipe.execute()
+        await redis_client.hincrby(EVAL_CACHE_STATS_KEY, "hit" if data else "miss", 1)
+    except Exception as e:
+        logger.warning("eval_cache: ошибка чтения кэша: %s", e)
+        return None
+    return json.loads(data) if data else None
+
+
+async def set_cached_evaluation(fingerprint: str, result: dict[str, Any]) -> None:
+    if not EVAL_CACHE_ENABLED:
+        return
+    try:
+        await redis_client.set(f"{EVAL_CACHE_PREFIX}{fingerprint}", json.dumps(result, ensure_ascii=False), ex=EVAL_CACHE_TTL_SEC)
+    except Exception as e:
+        logger.warning("eval_cache: ошибка записи в кэш: %s", e)
+
+
+async def get_cache_stats() -> dict[str, Any]:
+    """Счётчики кэша (GET /health/eval_cache): hit, miss, bypass и доля попаданий hit_rate."""
+    raw = await redis_client.hgetall(EVAL_CACHE_STATS_KEY)
+    stats: dict[str, Any] = {name: int(raw.get(name, 0)) for name in ("hit", "miss", "bypass")}
+    lookups = stats["hit"] + stats["miss"]
+    stats["hit_rate"] = round(stats["hit"] / lookups, 4) if lookups else 0.0
+    stats["enabled"] = EVAL_CACHE_ENABLED
+    return stats
+
+
+async def count_bypass() -> None:
+    try:
+        await redis_client.hincrby(EVAL_CACHE_STATS_KEY, "bypass", 1)
+    except Exception as e:
+        logger.warning("eval_cache: ошибка обновления статистики: %s", e)
@@ -0,0 +1,35 @@
+"""
+Прогресс оценки сочинения: воркер пишет события (criterion, mistakes, done, retry, error)
+в Redis Stream сочинения, API отдаёт их клиенту через SSE (GET /essay/{id}/stream).
+Stream хранит историю, поэтому клиент, подключившийся позже, получает все события с начала.
+"""
+import json
+import os
+from typing import Any
+
+from api.redis_client import redis_client
+
+EVAL_PROGRESS_TTL_SEC = int(os.getenv("EVAL_PROGRESS_TTL_SEC", "3600"))
+EVAL_PROGRESS_MAXLEN = 200
+
+
+def _progress_key(essay_id: int) -> str:
+    return f"essay:eval:stream:{essay_id}"
+
+
+async def publish_progress(essay_id: int, event: str, data: Any = None) -> None:
+    key = _progress_key(essay_id)
+    pipe = redis_client.pipeline(transaction=False)
+    pipe.xadd(key, {"event": event, "data": json.dumps(data, ensure_ascii=False)}, maxlen=EVAL_PROGRESS_MAXLEN, approximate=True)
+    pipe.expire(key, EVAL_PROGRESS_TTL_SEC)
+    await pipe.execute()
+
+
+async def read_progress(essay_id: int, last_id: str, block_ms: int) -> list[tuple[str, str, str]]:
+    """Ждёт события после last_id не дольше block_ms. Возвращает [(id, event, data_json)]."""
+    response = await redis_client.xread({_progress_key(essay_id): last_id}, block=block_ms, count=50)
+    out: list[tuple[str, str, str]] = []
+    for _, entries in response or []:
+        for entry_id, fields in entries:
+            out.append((entry_id, fields.get("event", ""), fields.get("data", "null")))
+    return out
@@ -0,0 +1,119 @@
+"""
+Очередь задач оценки сочинений в Redis.
+Задача попадает в eval:queue (список), при взятии воркером переносится в eval:processing
+(sorted set, score — дедлайн видимости). Если воркер не подтвердил задачу до дедлайна
+(упал, перезапустился), она возвращается в очередь. Неудачные попытки повторяются до
+EVAL_MAX_ATTEMPTS раз, затем задача уходит в eval:dead. Повтор откладывается: задача остаётся
+в eval:processing с дедлайном через EVAL_RETRY_BACKOFF_SEC × 2^(попытка − 1) и возвращается
+в очередь тем же requeue_expired.
+"""
+import json
+import logging
+import os
+import time
+import uuid
+from typing import Any, Optional
+
+from api.redis_client import redis_client
+
+logger = logging.getLogger(__name__)
+
+EVAL_QUEUE_KEY = "eval:queue"
+EVAL_PROCESSING_KEY = "eval:processing"
+EVAL_JOBS_KEY = "eval:jobs"
+EVAL_DEAD_KEY = "eval:dead"
+
+EVAL_VISIBILITY_TIMEOUT_SEC = int(os.getenv("EVAL_VISIBILITY_TIMEOUT_SEC", "600"))
+EVAL_MAX_ATTEMPTS = int(os.getenv("EVAL_MAX_ATTEMPTS", "3"))
+EVAL_RETRY_BACKOFF_SEC = float(os.getenv("EVAL_RETRY_BACKOFF_SEC", "30"))
+EVAL_RETRY_BACKOFF_MAX_SEC = float(os.getenv("EVAL_RETRY_BACKOFF_MAX_SEC", "600"))
+
+# Атомарно: снять задачу с конца очереди и поставить её в processing с дедлайном
+_RESERVE_LUA = """
+local job_id = redis.call('RPOP', KEYS[1])
+if not job_id then
+    return false
+end
+redis.call('ZADD', KEYS[2], ARGV[1], job_id)
+return job_id
+"""
+
+# Вернуть в очередь задачи с истёкшим дедлайном видимости
+_REQUEUE_EXPIRED_LUA = """
+local expired = redis.call('ZRANGEBYSCORE', KEYS[1], '-inf', ARGV[1], 'LIMIT', 0, tonumber(ARGV[2]))
+for _, job_id in ipairs(expired) do
+    redis.call('ZREM', KEYS[1], job_id)
+    redis.call('RPUSH', KEYS[2], job_id)
+end
+return #expired
+"""
+
+_reserve_script = redis_client.register_script(_RESERVE_LUA)
+_requeue_expired_script = redis_client.register_script(_REQUEUE_EXPIRED_LUA)
+
+
+async def enqueue_evaluation(essay_id: int, **options: Any) -> str:
+    """Ставит сочинение в очередь на оценку. Возвращает id задачи."""
+    job_id = uuid.uuid4().hex
+    job = {"id": job_id, "essay_id": essay_id, "attempts": 0, "enqueued_at": time.time(), **options}
+    pipe = redis_client.pipeline(transaction=True)
+    pipe.hset(EVAL_JOBS_KEY, job_id, json.dumps(job))
+    pipe.lpush(EVAL_QUEUE_KEY, job_id)
+    await pipe.execute()
+    return job_id
+
+
+async def reserve_job() -> Optional[dict[str, Any]]:
+    """Берёт следующую задачу из очереди (или None, если очередь пуста)."""
+    deadline = time.time() + EVAL_VISIBILITY_TIMEOUT_SEC
+    job_id = await _reserve_script(keys=[EVAL_QUEUE_KEY, EVAL_PROCESSING_KEY], args=[deadline])
+    if not job_id:
+        return None
+    data = await redis_client.hget(EVAL_JOBS_KEY, job_id)
+    if not data:
+        logger.warning("eval_queue: задача %s без данных, удаляем", job_id)
+        await redis_client.zrem(EVAL_PROCESSING_KEY, job_id)
+        return None
+    return json.loads(data)
+
+
+async def extend_visibility(job_id: str) -> None:
+    """Продлевает дедлайн видимости задачи, пока воркер её выполняет."""
+    deadline = time.time() + EVAL_VISIBILITY_TIMEOUT_SEC
+    await redis_client.zadd(EVAL_PROCESSING_KEY, {job_id: deadline}, xx=True)
+
+
+async def ack_job(job_id: str) -> None:
+    """Подтверждает успешное выполнение задачи."""
+    pipe = redis_client.pipeline(transaction=True)
+    pipe.zrem(EVAL_PROCESSING_KEY, job_id)
+    pipe.hdel(EVAL_JOBS_KEY, job_id)
+    await pipe.execute()
+
+
+async def fail_job(job: dict[str, Any], error: str) -> bool:
+    """
+    Отмечает неудачную попытку. Возвращает True, если задача поставлена на повтор,
+    False — если попытки исчерпаны и задача перенесена в eval:dead.
+    """
+    job_id = job["id"]
+    job["attempts"] = int(job.get("attempts", 0)) + 1
+    job["last_error"] = error[:500]
+    retry = job["attempts"] < EVAL_MAX_ATTEMPTS
+    pipe = redis_client.pipeline(transaction=True)
+    if retry:
+        # Не сразу в очередь: падающее сочинение не должно крутиться без паузы
+        delay = min(EVAL_RETRY_BACKOFF_SEC * 2 ** (job["attempts"] - 1), EVAL_RETRY_BACKOFF_MAX_SEC)
+        pipe.hset(EVAL_JOBS_KEY, job_id, json.dumps(job))
+        pipe.zadd(EVAL_PROCESSING_KEY, {job_id: time.time() + delay})
+    else:
+        pipe.zrem(EVAL_PROCESSING_KEY, job_id)
+        pipe.hdel(EVAL_JOBS_KEY, job_id)
+        pipe.lpush(EVAL_DEAD_KEY, json.dumps(job))
+    await pipe.execute()
+    return retry
+
+
+async def requeue_expired(batch: int = 100) -> int:
+    """Возвращает в очередь задачи, чей дедлайн видимости истёк. Возвращает их количество."""
+    return int(await _requeue_expired_script(keys=[EVAL_PROCESSING_KEY, EVAL_QUEUE_KEY], args=[time.time(), batch]))
@@ -0,0 +1,238 @@
+"""
+Воркер оценки сочинений: берёт задачи из очереди Redis (api.eval_queue), оценивает
+сочинение локальной моделью и сохраняет результат в БД.
+Запуск: python -m api.eval_worker
+Пропускная способность масштабируется числом процессов воркера, EVAL_WORKER_CONCURRENCY
+ограничивает число одновременных оценок в одном процессе.
+"""
+import asyncio
+import contextlib
+import logging
+import os
+import signal
+from typing import Any
+
+from dotenv import load_dotenv
+
+from api.db import AsyncSessionLocal, pin_to_primary
+from api.essay_eval import evaluation_fingerprint
+from api.eval_cache import count_bypass, get_cached_evaluation, set_cached_evaluation
+from api.eval_progress import publish_progress
+from api.eval_queue import ack_job, extend_visibility, fail_job, requeue_expired, reserve_job, EVAL_VISIBILITY_TIMEOUT_SEC
+from api.model_client import evaluate_essay, evaluation_model_id
+from api.models import Essay
+from api.redis_client import redis_client
+from api.user_progress import invalidate_progress, record_score
+from api.user_stats import refresh_stats_day
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+# По умолчанию столько одновременных оценок, сколько слотов у движка инференса
+EVAL_WORKER_CONCURRENCY = int(os.getenv("EVAL_WORKER_CONCURRENCY", os.getenv("LLAMA_N_PARALLEL", "1")))
+EVAL_POLL_INTERVAL_SEC = float(os.getenv("EVAL_POLL_INTERVAL_SEC", "0.5"))
+EVAL_REQUEUE_INTERVAL_SEC = 30.0
+# Пауза при ошибках Redis в цикле воркера растёт до этого значения
+EVAL_ERROR_BACKOFF_MAX_SEC = float(os.getenv("EVAL_ERROR_BACKOFF_MAX_SEC", "30"))
+
+
+async def _run_model(essay_id: int, theme: str, text: str, essay_type: str) -> dict[str, Any]:
+    """Оценка моделью с публикацией прогресса в поток сочинения."""
+    logger.info("essay_eval: старт оценки сочинения %s (type=%s, theme=%s, len=%s)", essay_id, essay_type, theme[:50], len(text))
+
+    # События прогресса публикуем по порядку, не задерживая приём следующих
+    progress: asyncio.Queue = asyncio.Queue()
+
+    async def publish_loop() -> None:
+        while True:
+            event = await progress.get()
+            try:
+                await publish_progress(essay_id, event["event"], {k: v for k, v in event.items() if k != "event"})
+            except Exception as e:
+                logger.warning("essay_eval: не удалось опубликовать прогресс %s: %s", essay_id, e)
+            finally:
+                progress.task_done()
+
+    publisher = asyncio.create_task(publish_loop())
+    try:
+        result = await evaluate_essay(theme, text, essay_type, progress.put_nowait)
+        await progress.join()
+    finally:
+        publisher.cancel()
+    return result
+
+
+async def _evaluate_essay_task(essay_id: int, fresh: bool = False) -> None:
+    """
+    Оценить сочинение локальной моделью и обновить запись в БД. Ошибки оценки пробрасываются (повтор задачи).
+    Сначала проверяется кэш результатов; fresh=True — оценить заново, минуя кэш.
+    """
+    async with AsyncSessionLocal() as session:
+        essay = await session.get(Essay, essay_id)
+        if not essay:
+            logger.warning("essay_eval: сочинение %s не найдено", essay_id)
+            return
+        theme, text, essay_type = essay.theme, essay.text, (essay.essay_type or "essay")
+
+    # Модель спрашиваем у model_server: у воркера свои настройки окружения, они могут разойтись
+    model = await evaluation_model_id()
+    fingerprint = evaluation_fingerprint(theme, text, essay_type, model)
+    result = None
+    if fresh:
+        await count_bypass()
+    else:
+        result = await get_cached_evaluation(fingerprint)
+
+    if result is not None:
+        logger.info("essay_eval: результат для сочинения %s взят из кэша", essay_id)
+        for key, criterion in result["criteries"].items():
+            await publish_progress(essay_id, "criterion", {"key": key, "data": criterion})
+        await publish_progress(essay_id, "mistakes", {"data": result["common_mistakes"]})
+    else:
+        result = await _run_model(essay_id, theme, text, essay_type)
+        graded_by = result.pop("model_id", model)
+        if graded_by != model:
+            # Оценивала другая реплика (обновление модели в процессе) — кэшируем под её моделью
+            fingerprint = evaluation_fingerprint(theme, text, essay_type, graded_by)
+        if result.get("parsed", True):
+            await set_cached_evaluation(fingerprint, result)
+    logger.info("essay_eval: оценка готова для %s, total_score=%s", essay_id, result.get("total_score"))
+    async with AsyncSessionLocal() as session:
+        essay = await session.get(Essay, essay_id)
+        if not essay:
+            logger.warning("essay_eval: сочинение %s не найдено при сохранении", essay_id)
+            return
+        previous_score_per, previous_criteries = essay.total_score_per, essay.criteries
+        essay.criteries = result["criteries"]
+        essay.common_mistakes = result["common_mistakes"]
+        essay.max_score = result["max_score"]
+        essay.total_score = result["total_score"]
+        essay.total_score_per = result.get("total_score_per")
+        session.add(essay)
+        # Агрегаты прогресса — в той же транзакции, что и оценка
+        await record_score(session, essay, previous_score_per, previous_criteries)
+        # Срез статистики дня пересчитывается под той же блокировкой строки прогресса
+        await session.flush()
+        await refresh_stats_day(session, essay.user_id, essay.ended_at)
+        await session.commit()
+        user_id = essay.user_id
+    # Клиент перечитывает сочинение по событию done — оно должно прийти из основной БД
+    await pin_to_primary(user_id)
+    await invalidate_progress(user_id)
+    logger.info("essay_eval: сочинение %s сохранено", essay_id)
+    await publish_progress(
+        essay_id,
+        "done",
+        {
+            "total_score": result["total_score"],
+            "total_score_per": result.get("total_score_per"),
+            "max_score": result["max_score"],
+        },
+    )
+
+
+async def _keep_visible(job_id: str, done: asyncio.Event) -> None:
+    """Продлевает видимость задачи, пока идёт оценка (она может быть дольше таймаута), до done."""
+    while True:
+        with contextlib.suppress(asyncio.TimeoutError):
+            await asyncio.wait_for(done.wait(), timeout=EVAL_VISIBILITY_TIMEOUT_SEC / 3)
+        if done.is_set():
+            return
+        try:
+            await extend_visibility(job_id)
+        except Exception as e:
+            # Следующая попытка — через треть таймаута, до дедлайна есть ещё две
+            logger.warning("eval_worker: не удалось продлить видимость задачи %s: %s", job_id, e)
+
+
+async def _run_job(job: dict[str, Any], slots: asyncio.Semaphore) -> None:
+    evaluated = asyncio.Event()
+    heartbeat = asyncio.create_task(_keep_visible(job["id"], evaluated))
+    try:
+        try:
+            await _evaluate_essay_task(int(job["essay_id"]), fresh=bool(job.get("fresh")))
+        finally:
+            # Продление видимости завершается до ack/fail: запоздавший ZADD XX перезаписал бы дедлайн повтора
+            evaluated.set()
+            await heartbeat
+    except Exception as e:
+        logger.exception("eval_worker: ошибка оценки сочинения %s: %s", job.get("essay_id"), e)
+        try:
+            retry = await fail_job(job, repr(e))
+        except Exception as queue_error:
+            # Задача останется в eval:processing и вернётся в очередь по дедлайну видимости
+            logger.warning("eval_worker: не удалось отметить ошибку задачи %s: %s", job["id"], queue_error)
+            return
+        with contextlib.suppress(Exception):
+            await publish_progress(int(job["essay_id"]), "retry" if retry else "error")
+        if not retry:
+            logger.error("eval_worker: сочинение %s не оценено, попытки исчерпаны", job.get("essay_id"))
+    else:
+        try:
+            await ack_job(job["id"])
+        except Exception as e:
+            # Без подтверждения задача повторится по дедлайну (результат возьмётся из кэша)
+            logger.warning("eval_worker: не удалось подтвердить задачу %s: %s", job["id"], e)
+    finally:
+        slots.release()
+
+
+async def run_worker(stop: asyncio.Event) -> None:
+    slots = asyncio.Semaphore(EVAL_WORKER_CONCURRENCY)
+    running: set[asyncio.Task] = set()
+    loop = asyncio.get_running_loop()
+    next_requeue = 0.0
+    backoff = EVAL_POLL_INTERVAL_SEC
+
+    while not stop.is_set():
+        await slots.acquire()
+        if stop.is_set():
+            slots.release()
+            break
+        try:
+            if loop.time() >= next_requeue:
+                requeued = await requeue_expired()
+                if requeued:
+                    logger.warning("eval_worker: возвращено в очередь %s просроченных задач", requeued)
+                next_requeue = loop.time() + EVAL_REQUEUE_INTERVAL_SEC
+            job = await reserve_job()
+        except Exception as e:
+            # Сбой Redis не должен останавливать воркер: пауза с ростом и новая попытка
+            slots.release()
+            logger.warning("eval_worker: ошибка очереди, повтор через %.1f с: %s", backoff, e)
+            with contextlib.suppress(asyncio.TimeoutError):
+                await asyncio.wait_for(stop.wait(), timeout=backoff)
+            backoff = min(backoff * 2, EVAL_ERROR_BACKOFF_MAX_SEC)
+            continue
+        backoff = EVAL_POLL_INTERVAL_SEC
+        if job is None:
+            slots.release()
+            with contextlib.suppress(asyncio.TimeoutError):
+                await asyncio.wait_for(stop.wait(), timeout=EVAL_POLL_INTERVAL_SEC)
+            continue
+
+        task = asyncio.create_task(_run_job(job, slots))
+        running.add(task)
+        task.add_done_callback(running.discard)
+
+    # Дожидаемся начатых оценок; незавершённые при kill вернутся в очередь по дедлайну видимости
+    if running:
+        logger.info("eval_worker: ожидание %s задач перед остановкой", len(running))
+        await asyncio.gather(*running, return_exceptions=True)
+
+
+async def main() -> None:
+    await redis_client.ping()
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stop.set)
+    logger.info("eval_worker: запущен, concurrency=%s", EVAL_WORKER_CONCURRENCY)
+    await run_worker(stop)
+    logger.info("eval_worker: остановлен")
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(name)s: %(message)s")
+    asyncio.run(main())
@@ -0,0 +1,109 @@
+"""
+Движок инференса: очередь промптов и пул слотов (контекстов llama.cpp).
+Каждый слот — отдельный контекст со своим KV-кэшем. На CPU веса общие (GGUF открывается через
+mmap, страницы весов общие для всех контекстов процесса); на GPU у каждого слота своя копия весов,
+поэтому число слотов выбирает бэкенд (essay_eval.LlamaCppBackend.n_slots).
+Свободный слот сразу берёт следующий промпт из очереди, поэтому одновременные запросы
+декодируются параллельно, а не ждут друг друга на одном контексте.
+"""
+import asyncio
+import logging
+import queue
+import threading
+from concurrent.futures import Future
+from typing import Any, Callable, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class _Request:
+    __slots__ = ("prompt", "params", "on_text", "future")
+
+    def __init__(self, prompt: str, params: dict[str, Any], on_text: Optional[Callable[[str], None]]):
+        self.prompt = prompt
+        self.params = params
+        self.on_text = on_text
+        self.future: Future = Future()
+
+
+class InferenceEngine:
+    """
+    Пул из n_slots слотов. slot_factory() создаёт контекст модели (вызывается в потоке слота
+    при первом запросе), run(slot, prompt, params, on_text) выполняет генерацию и возвращает ответ;
+    если передан on_text, он вызывается в потоке слота с каждым новым фрагментом текста.
+    """
+
+    def __init__(
+        self,
+        slot_factory: Callable[[], Any],
+        run: Callable[[Any, str, dict[str, Any], Optional[Callable[[str], None]]], Any],
+        n_slots: int = 1,
+    ):
+        self._slot_factory = slot_factory
+        self._run = run
+        self._n_slots = max(1, n_slots)
+        self._pending: "queue.Queue[Optional[_Request]]" = queue.Queue()
+        self._threads: list[threading.Thread] = []
+        self._start_lock = threading.Lock()
+
+    @property
+    def n_slots(self) -> int:
+        return self._n_slots
+
+    def pending(self) -> int:
+        """Число промптов, ожидающих свободного слота."""
+        return self._pending.qsize()
+
+    def _ensure_started(self) -> None:
+        if self._threads:
+            return
+        with self._start_lock:
+            if self._threads:
+                return
+            for i in range(self._n_slots):
+                t = threading.Thread(target=self._slot_loop, args=(i,), name=f"inference-slot-{i}", daemon=True)
+                t.start()
+                self._threads.append(t)
+
+    def _slot_loop(self, index: int) -> None:
+        slot = None
+        while True:
+            req = self._pending.get()
+            if req is None:
+                return
+            if not req.future.set_running_or_notify_cancel():
+                continue
+            try:
+                if slot is None:
+                    slot = self._slot_factory()
+                    logger.info("inference: слот %s готов", index)
+                req.future.set_result(self._run(slot, req.prompt, req.params, req.on_text))
+            except BaseException as e:
+                req.future.set_exception(e)
+
+    def submit_future(
+        self, prompt: str, params: dict[str, Any], on_text: Optional[Callable[[str], None]] = None
+    ) -> Future:
+        self._ensure_started()
+        req = _Request(prompt, params, on_text)
+        self._pending.put(req)
+        return req.future
+
+    async def submit(
+        self, prompt: str, params: dict[str, Any], on_text: Optional[Callable[[str], None]] = None
+    ) -> Any:
+        """Ставит промпт в очередь и ждёт результат генерации."""
+        return await asyncio.wrap_future(self.submit_future(prompt, params, on_text))
+
+    def submit_sync(
+        self, prompt: str, params: dict[str, Any], on_text: Optional[Callable[[str], None]] = None
+    ) -> Any:
+        """Блокирующий вариант submit для синхронного кода (asyncio.to_thread, воркеры)."""
+        return self.submit_future(prompt, params, on_text).result()
+
+    def shutdown(self) -> None:
+        for _ in self._threads:
+            self._pending.put(None)
+        for t in self._threads:
+            t.join()
+        self._threads = []
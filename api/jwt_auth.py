@@ -1,12 +1,50 @@
-import os
-from pydantic import BaseModel
-from jose import jwt, jwk, exceptions
-from typing import Dict, Any
+"""
+Проверка JWT (RS256) от сервиса авторизации.
+Открытые ключи берутся из JWKS (JWKS_URL) и хранятся по kid: фоновая задача API
+(run_jwks_refresher) перечитывает набор раз в JWKS_REFRESH_SEC, даже если запросов нет, —
+удалённый из JWKS ключ перестаёт приниматься и на простаивающей реплике. Токен с незнакомым
+kid вызывает внеочередное перечитывание (не чаще JWKS_MIN_REFRESH_SEC, параллельные запросы
+ждут одну загрузку).
+Проверенные токены кэшируются по SHA-256 до exp в ограниченном LRU, поэтому повторные
+запросы той же сессии (автосохранение) не проверяют подпись заново.
+Подпись проверяет сменный верификатор (JWT_VERIFIER): cryptography с заранее разобранным
+открытым ключом (по умолчанию) или python-jose; правила проверки у них одинаковые
+(сравнение скорости — python -m api.bench.jwt_bench).
+Отозванные токены (выход, отзыв администратором) отсекаются по копии в памяти (api.token_revocation)
+— и для свежепроверенных, и для взятых из кэша.
+"""
 import asyncio
+import base64
+import binascii
+import contextlib
+import hashlib
+import json
+import logging
+import os
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Optional
+
 import httpx
+from cryptography.exceptions import InvalidSignature
+from cryptography.hazmat.primitives import hashes
+from cryptography.hazmat.primitives.asymmetric import padding, rsa
 from fastapi import HTTPException
+from jose import exceptions, jwk, jwt
+from pydantic import BaseModel
+
+from api.token_revocation import revocations
+
+logger = logging.getLogger(__name__)
 
 JWKS_URL: str = os.environ.get("JWKS_URL", "http://auth-lingwo:8000/.well-known/jwks.json")
+JWKS_REFRESH_SEC = int(os.getenv("JWKS_REFRESH_SEC", "600"))
+# Защита от перебора случайных kid: внеочередное перечитывание не чаще этого интервала
+JWKS_MIN_REFRESH_SEC = int(os.getenv("JWKS_MIN_REFRESH_SEC", "30"))
+JWKS_TIMEOUT_SEC = float(os.getenv("JWKS_TIMEOUT_SEC", "5"))
+JWT_CLAIMS_CACHE_SIZE = int(os.getenv("JWT_CLAIMS_CACHE_SIZE", "10000"))
+JWT_ALGORITHM = "RS256"
+JWT_VERIFIER = os.getenv("JWT_VERIFIER", "cryptography")
 
 
 class Claims(BaseModel):
@@ -20,79 +58,259 @@ class Claims(BaseModel):
     token: str | None = None
 
 
-_decoding_key_lock = asyncio.Lock()
-_decoding_key_cache = None
+def _unauthorized(detail: str) -> HTTPException:
+    return HTTPException(status_code=401, detail=detail, headers={"WWW-Authenticate": "Bearer"})
+
+
+class JoseVerifier:
+    """Проверка через python-jose (чистый Python поверх cryptography)."""
+
+    name = "jose"
+
+    def load_key(self, data: Dict[str, Any]) -> Any:
+        return jwk.construct(data, algorithm=JWT_ALGORITHM)
+
+    def header(self, token: str) -> Dict[str, Any]:
+        return jwt.get_unverified_header(token)
+
+    def decode(self, token: str, key: Any) -> Dict[str, Any]:
+        return jwt.decode(token, key, algorithms=[JWT_ALGORITHM], options={"verify_signature": True})
+
 
+def _b64decode(segment: str) -> bytes:
+    return base64.urlsafe_b64decode(segment + "=" * (-len(segment) % 4))
 
-async def get_decoding_key_rs256():
+
+def _int_claim(claims: Dict[str, Any], name: str, message: str) -> Optional[int]:
+    if name not in claims:
+        return None
+    try:
+        return int(claims[name])
+    except (TypeError, ValueError):
+        raise exceptions.JWTClaimsError(message)
+
+
+class CryptographyVerifier:
     """
-    Асинхронно загружает и кэширует ключ JWKS.
-    Гарантированно выполнится только один раз.
+    RS256 напрямую через cryptography: ключ разбирается один раз при загрузке JWKS, на запрос —
+    только разбор сегментов и RSA verify. Проверки claims повторяют jwt.decode из python-jose
+    без audience/issuer: iat, nbf, exp (без допуска), aud (любой aud отклоняется), sub и jti — строки.
     """
-    print(f"⏳ Fetching JWKS from: {JWKS_URL} (Первая и единственная загрузка)")
 
-    global _decoding_key_cache
-    if _decoding_key_cache is not None:
-        return _decoding_key_cache
+    name = "cryptography"
 
-    async with _decoding_key_lock:
-        if _decoding_key_cache is not None:
-            return _decoding_key_cache
+    def load_key(self, data: Dict[str, Any]) -> rsa.RSAPublicKey:
+        e = int.from_bytes(_b64decode(data["e"]), "big")
+        n = int.from_bytes(_b64decode(data["n"]), "big")
+        return rsa.RSAPublicNumbers(e, n).public_key()
 
+    def _split(self, token: str) -> list[str]:
+        parts = token.split(".")
+        if len(parts) != 3:
+            raise exceptions.JWTError("Not enough segments")
+        return parts
+
+    def header(self, token: str) -> Dict[str, Any]:
         try:
-            async with httpx.AsyncClient(timeout=10.0) as client:
-                response = await client.get(JWKS_URL)
-                response.raise_for_status()
+            header = json.loads(_b64decode(self._split(token)[0]))
+        except (ValueError, binascii.Error):
+            raise exceptions.JWTError("Error decoding token headers.")
+        if not isinstance(header, dict):
+            raise exceptions.JWTError("Invalid header string: must be a json object")
+        return header
+
+    def decode(self, token: str, key: rsa.RSAPublicKey) -> Dict[str, Any]:
+        header_b64, payload_b64, signature_b64 = self._split(token)
+        if self.header(token).get("alg") != JWT_ALGORITHM:
+            raise exceptions.JWTError("The specified alg value is not allowed")
+        try:
+            signature = _b64decode(signature_b64)
+            key.verify(signature, f"{header_b64}.{payload_b64}".encode(), padding.PKCS1v15(), hashes.SHA256())
+        except (InvalidSignature, binascii.Error, ValueError):
+            raise exceptions.JWTError("Signature verification failed.")
+        try:
+            claims = json.loads(_b64decode(payload_b64))
+        except (ValueError, binascii.Error):
+            raise exceptions.JWTError("Invalid payload string")
+        if not isinstance(claims, dict):
+            raise exceptions.JWTError("Invalid payload string: must be a json object")
+
+        now = int(time.time())
+        _int_claim(claims, "iat", "Issued At claim (iat) must be an integer.")
+        nbf = _int_claim(claims, "nbf", "Not Before claim (nbf) must be an integer.")
+        if nbf is not None and nbf > now:
+            raise exceptions.JWTClaimsError("The token is not yet valid (nbf)")
+        exp = _int_claim(claims, "exp", "Expiration Time claim (exp) must be an integer.")
+        if exp is not None and exp < now:
+            raise exceptions.ExpiredSignatureError("Signature has expired.")
+        if "aud" in claims:
+            raise exceptions.JWTClaimsError("Invalid audience")
+        if "sub" in claims and not isinstance(claims["sub"], str):
+            raise exceptions.JWTClaimsError("Subject must be a string.")
+        if "jti" in claims and not isinstance(claims["jti"], str):
+            raise exceptions.JWTClaimsError("JWT ID must be a string.")
+        return claims
+
+
+VERIFIERS = {verifier.name: verifier for verifier in (CryptographyVerifier(), JoseVerifier())}
 
-                jwks = response.json()
-                jwk_data = next(
-                    (
-                        key
-                        for key in jwks.get("keys", [])
-                        if key.get("alg") == "RS256" and key.get("kty") == "RSA"
-                    ),
-                    None,
-                )
 
-                if jwk_data is None:
-                    raise ValueError("Критическая ошибка: ключ RS256 не найден в JWKS.")
+class JwksKeyManager:
+    """Открытые ключи RS256 из JWKS по kid (ключ без kid хранится под None)."""
 
-                public_key = jwk.construct(jwk_data)
+    def __init__(self, url: str, verifier: Any):
+        self.url = url
+        self.verifier = verifier
+        self._keys: Dict[Optional[str], Any] = {}
+        self._fetched_at = 0.0
+        self._attempted_at = 0.0
+        self._refreshing: Optional[asyncio.Task] = None
 
-                print("✅ JWT public key успешно загружен и возвращен.")
-                _decoding_key_cache = public_key
-                return public_key
+    def load_jwks(self, jwks: Dict[str, Any]) -> None:
+        """Заменяет набор ключей документом JWKS; ключи не RS256 пропускаются."""
+        keys = {}
+        for data in jwks.get("keys", []):
+            if data.get("kty") != "RSA" or data.get("alg", JWT_ALGORITHM) != JWT_ALGORITHM:
+                continue
+            keys[data.get("kid")] = self.verifier.load_key(data)
+        if not keys:
+            raise ValueError("ключ RS256 не найден в JWKS")
+        if set(self._keys) - set(keys):
+            # Ключ отозван из JWKS: подписанные им токены больше не принимаются
+            claims_cache.clear()
+        self._keys = keys
+        self._fetched_at = time.monotonic()
 
+    async def _fetch(self) -> None:
+        self._attempted_at = time.monotonic()
+        try:
+            async with httpx.AsyncClient(timeout=JWKS_TIMEOUT_SEC) as client:
+                response = await client.get(self.url)
+                response.raise_for_status()
+                self.load_jwks(response.json())
+            logger.info("jwt_auth: загружено ключей JWKS: %s", len(self._keys))
         except Exception as e:
-            print(f"🚨 КРИТИЧЕСКАЯ ОШИБКА: Не удалось получить ключ JWKS: {e}")
-            raise SystemExit(1)
+            # Старые ключи остаются в силе до следующей попытки
+            logger.warning("jwt_auth: не удалось получить JWKS %s: %s", self.url, e)
 
+    async def refresh(self) -> None:
+        """Перечитывает JWKS; одновременные вызовы ждут одну загрузку."""
+        if self._refreshing is None or self._refreshing.done():
+            self._refreshing = asyncio.create_task(self._fetch())
+        await asyncio.shield(self._refreshing)
+
+    async def get_keys(self, kid: Optional[str]) -> list:
+        """Ключи-кандидаты для kid из заголовка токена (без kid — все ключи набора)."""
+        now = time.monotonic()
+        if not self._keys:
+            await self.refresh()
+        elif now - self._fetched_at > JWKS_REFRESH_SEC and now - self._attempted_at > JWKS_MIN_REFRESH_SEC:
+            # Набор устарел: обновляем в фоне, текущий запрос проверяется старыми ключами
+            if self._refreshing is None or self._refreshing.done():
+                self._refreshing = asyncio.create_task(self._fetch())
+        if kid is not None and kid not in self._keys and now - self._attempted_at > JWKS_MIN_REFRESH_SEC:
+            await self.refresh()
+        if not self._keys:
+            raise HTTPException(status_code=503, detail="Сервис авторизации недоступен, повторите позже.")
+        if kid is None:
+            return list(self._keys.values())
+        # Ключ JWKS без kid подходит любому токену
+        key = self._keys.get(kid, self._keys.get(None))
+        if key is None:
+            raise _unauthorized("Недействительный токен: неизвестный ключ подписи")
+        return [key]
+
+
+class ClaimsCache:
+    """LRU проверенных токенов: SHA-256 токена -> Claims, запись действует до exp."""
+
+    def __init__(self, max_size: int):
+        self.max_size = max_size
+        self._items: "OrderedDict[bytes, Claims]" = OrderedDict()
+
+    @staticmethod
+    def _key(token: str) -> bytes:
+        return hashlib.sha256(token.encode()).digest()
+
+    def get(self, token: str) -> Optional[Claims]:
+        key = self._key(token)
+        claims = self._items.get(key)
+        if claims is None:
+            return None
+        if claims.exp <= time.time():
+            del self._items[key]
+            return None
+        self._items.move_to_end(key)
+        return claims
+
+    def put(self, token: str, claims: Claims) -> None:
+        if self.max_size <= 0:
+            return
+        self._items[self._key(token)] = claims
+        self._items.move_to_end(self._key(token))
+        while len(self._items) > self.max_size:
+            self._items.popitem(last=False)
+
+    def clear(self) -> None:
+        self._items.clear()
+
+
+verifier = VERIFIERS[JWT_VERIFIER]
+key_manager = JwksKeyManager(JWKS_URL, verifier)
+claims_cache = ClaimsCache(JWT_CLAIMS_CACHE_SIZE)
 
-async def decode_token_async(token_str: str) -> Claims:
-    """Декодирует и валидирует токен, используя асинхронно полученный ключ."""
 
-    decoding_key = await get_decoding_key_rs256()
+async def run_jwks_refresher(stop: asyncio.Event) -> None:
+    """Фоновая задача API: перечитывает JWKS раз в JWKS_REFRESH_SEC, пока не выставлен stop."""
+    while not stop.is_set():
+        # Ошибки загрузки логирует _fetch; старые ключи остаются в силе
+        await key_manager.refresh()
+        with contextlib.suppress(asyncio.TimeoutError):
+            await asyncio.wait_for(stop.wait(), timeout=JWKS_REFRESH_SEC)
+
+
+def _verify(token_str: str, keys: list) -> Dict[str, Any]:
+    error: Optional[exceptions.JWTError] = None
+    for key in keys:
+        try:
+            return verifier.decode(token_str, key)
+        except (exceptions.ExpiredSignatureError, exceptions.JWTClaimsError):
+            # Подпись уже сошлась, токен отклонён по содержимому
+            raise
+        except exceptions.JWTError as e:
+            # Токен без kid при нескольких ключах: пробуем следующий
+            error = e
+    raise error or exceptions.JWTError("ключ не найден")
+
+
+async def decode_token_async(token_str: str) -> Claims:
+    """Декодирует и валидирует токен: сначала кэш проверенных токенов, затем подпись по JWKS."""
+    cached = claims_cache.get(token_str)
+    if cached is not None:
+        if revocations.is_revoked(cached):
+            raise _unauthorized("Токен отозван")
+        return cached
 
     try:
-        token_data: Dict[str, Any] = jwt.decode(
-            token_str,
-            decoding_key,
-            algorithms=["RS256"],
-            options={"verify_signature": True},
-        )
+        header = verifier.header(token_str)
+    except exceptions.JWTError as e:
+        raise _unauthorized(f"Недействительный токен: {e}")
+    if header.get("alg") != JWT_ALGORITHM:
+        raise _unauthorized("Недействительный токен: неподдерживаемый алгоритм")
+    keys = await key_manager.get_keys(header.get("kid"))
 
+    try:
+        token_data = _verify(token_str, keys)
         claims = Claims(**token_data)
         claims.token = token_str
-        return claims
-
     except exceptions.JWTError as e:
-        raise HTTPException(
-            status_code=401,
-            detail=f"Недействительный токен: {e}",
-            headers={"WWW-Authenticate": "Bearer"},
-        )
+        raise _unauthorized(f"Недействительный токен: {e}")
     except Exception:
         raise HTTPException(
             status_code=500,
             detail="Внутренняя ошибка сервера при обработке токена",
         )
+    claims_cache.put(token_str, claims)
+    if revocations.is_revoked(claims):
+        raise _unauthorized("Токен отозван")
+    return claims
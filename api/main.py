@@ -1,4 +1,5 @@
 import asyncio
+import base64
 import hashlib
 import json
 import logging
@@ -16,18 +17,35 @@ if __name__ == "__main__" and __package__ is None:
 from contextlib import asynccontextmanager
 from dotenv import load_dotenv
 from qdrant_client import QdrantClient
-from sentence_transformers import SentenceTransformer
 import uvicorn
-from fastapi import BackgroundTasks, Depends, FastAPI, HTTPException, Query, Security
+from fastapi import Depends, FastAPI, HTTPException, Query, Response, Security
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import StreamingResponse
 from fastapi.security import HTTPAuthorizationCredentials, HTTPBearer
-from sqlalchemy import select
+from sqlalchemy import and_, func, literal_column, or_, select, tuple_
 from sqlalchemy.ext.asyncio import AsyncSession
 
-from api.db import AsyncSessionLocal, get_session, init_db
-from api.essay_eval import evaluate_essay_sync, validate_theme_sync
-from api.jwt_auth import Claims, decode_token_async
-from api.models import Essay, UserSettings
+from api.db import engine, get_session, pin_to_primary, pool_stats, read_session
+from api.essay_drafts import delete_draft, run_draft_flusher
+from api.essay_store import (
+    claim_active_essay,
+    create_active_essay,
+    delete_active_essay,
+    finish_claimed_essay,
+    get_active_essay,
+    load_scripts,
+    mark_no_draft,
+    patch_active_text,
+    release_claimed_essay,
+    save_active_text,
+)
+from api.eval_cache import get_cache_stats
+from api.eval_progress import read_progress
+from api.eval_queue import enqueue_evaluation
+from api.jwt_auth import Claims, decode_token_async, run_jwks_refresher
+from api.migrations import verify_schema
+from api.model_client import embed, validate_theme
+from api.models import ESSAY_SEARCH_CONFIG, Essay, UserSettings
 from api.rate_limit import check_model_rate_limit
 from api.redis_client import redis_client
 from api.schemas import (
@@ -35,35 +53,59 @@ from api.schemas import (
     EssayEndRequest,
     EssayEndResponse,
     EssayListItem,
+    EssayPatchRequest,
+    EssayPatchResponse,
     EssaySaveRequest,
     EssayStartRequest,
     EssayState,
     RandomTopicResponse,
     RecommendedTopicResponse,
+    StatsResponse,
     UserSettingsResponse,
     UserSettingsUpdate,
     ValidateThemeRequest,
     ValidateThemeResponse,
 )
+from api.theme_cache import get_theme_verdict, normalize_theme, set_theme_verdict
+from api.token_revocation import run_revocation_listener
+from api.user_progress import forget_essay, get_progress, invalidate_progress
+from api.user_stats import STATS_BUCKETS, get_stats, refresh_stats_day
 
 load_dotenv()
 
 QDRANT_HOST = os.getenv("QDRANT_HOST", "localhost")
 QDRANT_PORT = int(os.getenv("QDRANT_PORT", "6333"))
 QDRANT_COLLECTION_NAME = os.getenv("QDRANT_COLLECTION_NAME", "themes")
-EMBEDDING_MODEL_NAME = os.getenv("EMBEDDING_MODEL_NAME", "sentence-transformers/paraphrase-multilingual-MiniLM-L12-v2")
 THEMES_PATH = os.getenv("THEMES_PATH")
+# Косинусная близость к известной теме из Qdrant, начиная с которой тема считается допустимой без модели
+THEME_SIMILARITY_THRESHOLD = float(os.getenv("THEME_SIMILARITY_THRESHOLD", "0.9"))
 API_HOST = os.getenv("API_HOST", "127.0.0.1")
 API_PORT = int(os.getenv("API_PORT", "8001"))
+# Сколько SSE-поток прогресса оценки ждёт результата, прежде чем закрыться
+EVAL_STREAM_TIMEOUT_SEC = int(os.getenv("EVAL_STREAM_TIMEOUT_SEC", "900"))
+EVAL_STREAM_PING_SEC = 15
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
-    await init_db()
+    # Схема обновляется отдельно (python -m api.migrate); здесь только проверка версии
+    await verify_schema(engine)
     try:
         await redis_client.ping()
+        await load_scripts()
     except Exception as exc:
         raise RuntimeError(f"Redis недоступен: {exc}") from exc
+    # Черновики активных сочинений переносятся из Redis в БД в фоне
+    stop_background = asyncio.Event()
+    flusher = asyncio.create_task(run_draft_flusher(stop_background))
+    # Копия отозванных токенов из сервиса авторизации (pub/sub)
+    revocation_listener = asyncio.create_task(run_revocation_listener(stop_background))
+    # Ключи JWKS обновляются по расписанию, а не только при запросах
+    jwks_refresher = asyncio.create_task(run_jwks_refresher(stop_background))
     yield
+    stop_background.set()
+    await flusher
+    await revocation_listener
+    await jwks_refresher
 
 
 APP = FastAPI(title="Lingwo API", version="0.1.0", lifespan=lifespan)
@@ -78,11 +120,12 @@ APP.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor"],
 )
 
 _cached_themes: Optional[List[str]] = None
+_cached_theme_keys: Optional[set[str]] = None
 _qdrant_client: Optional[QdrantClient] = None
-_embedding_model: Optional[SentenceTransformer] = None
 
 
 async def get_current_user(
@@ -91,6 +134,13 @@ async def get_current_user(
     try:
         claims = await decode_token_async(auth.credentials)
         return claims
+    except HTTPException as e:
+        if e.status_code == 503:
+            raise
+        raise HTTPException(
+            status_code=401,
+            headers={"WWW-Authenticate": "Bearer"},
+        )
     except Exception:
         raise HTTPException(
             status_code=401,
@@ -98,10 +148,22 @@ async def get_current_user(
         )
 
 
-async def require_model_rate_limit(claim: Claims = Depends(get_current_user)) -> None:
-    """Зависимость: проверка лимита запросов к модели (тема + оценка), 429 при превышении."""
+async def get_read_session(claim: Claims = Depends(get_current_user)) -> AsyncSession:
+    """Сессия для эндпоинтов только на чтение: реплика, кроме недавно писавших пользователей (pin_to_primary)."""
+    async with read_session(claim.user_id if claim else None) as session:
+        yield session
+
+
+async def require_theme_rate_limit(claim: Claims = Depends(get_current_user)) -> None:
+    """Зависимость: лимит запросов к проверке темы, 429 при превышении (503 — модель перегружена)."""
+    if claim and claim.user_id:
+        await check_model_rate_limit(claim.user_id, "theme")
+
+
+async def require_grading_rate_limit(claim: Claims = Depends(get_current_user)) -> None:
+    """Зависимость: лимит запросов к оценке сочинений, 429 при превышении (503 — модель перегружена)."""
     if claim and claim.user_id:
-        await check_model_rate_limit(claim.user_id)
+        await check_model_rate_limit(claim.user_id, "grading")
 
 
 def _get_themes_path() -> Path:
@@ -214,17 +276,7 @@ def _get_qdrant_client() -> QdrantClient:
     return _qdrant_client
 
 
-def _get_embedding_model() -> SentenceTransformer:
-    global _embedding_model
-    if _embedding_model is None:
-        _embedding_model = SentenceTransformer(EMBEDDING_MODEL_NAME)
-    return _embedding_model
-
-
-def _random_theme_from_sections(sections: List[str]) -> str:
-    model = _get_embedding_model()
-    query_vector = model.encode(" ".join(sections), normalize_embeddings=True).tolist()
-
+def _query_themes(query_vector: List[float], limit: int, score_threshold: Optional[float] = None) -> list:
     client = _get_qdrant_client()
     # qdrant-client API differs between versions:
     # newer versions use query_points, older expose search.
@@ -232,17 +284,23 @@ def _random_theme_from_sections(sections: List[str]) -> str:
         response = client.query_points(
             collection_name=QDRANT_COLLECTION_NAME,
             query=query_vector,
-            limit=60,
-            with_payload=True,
-        )
-        results = response.points if hasattr(response, "points") else response
-    else:
-        results = client.search(
-            collection_name=QDRANT_COLLECTION_NAME,
-            query_vector=query_vector,
-            limit=60,
+            limit=limit,
             with_payload=True,
+            score_threshold=score_threshold,
         )
+        return response.points if hasattr(response, "points") else response
+    return client.search(
+        collection_name=QDRANT_COLLECTION_NAME,
+        query_vector=query_vector,
+        limit=limit,
+        with_payload=True,
+        score_threshold=score_threshold,
+    )
+
+
+async def _random_theme_from_sections(sections: List[str]) -> str:
+    [query_vector] = await embed([" ".join(sections)])
+    results = await asyncio.to_thread(_query_themes, query_vector, 60)
 
     candidate_themes = []
     for point in results:
@@ -256,8 +314,51 @@ def _random_theme_from_sections(sections: List[str]) -> str:
     return random.choice(candidate_themes)
 
 
-def _redis_key(user_id: str) -> str:
-    return f"essay:active:{user_id}"
+def _is_known_theme(normalized: str) -> bool:
+    """Тема совпадает с одной из тем all_themes.txt (после нормализации)."""
+    global _cached_theme_keys
+    if _cached_theme_keys is None:
+        _cached_theme_keys = {normalize_theme(t) for t in _load_all_themes()}
+    return normalized in _cached_theme_keys
+
+
+async def _similar_known_theme(theme: str) -> Optional[str]:
+    """Известная тема из Qdrant, близкая к данной (cosine >= THEME_SIMILARITY_THRESHOLD), или None."""
+    [query_vector] = await embed([theme])
+    results = await asyncio.to_thread(_query_themes, query_vector, 1, THEME_SIMILARITY_THRESHOLD)
+    for point in results:
+        payload: dict[str, Any] = (getattr(point, "payload", None) or {})
+        known = payload.get("theme")
+        if isinstance(known, str) and known:
+            return known
+    return None
+
+
+async def _check_theme(theme: str) -> dict[str, Any]:
+    """
+    Проверка темы: кэш вердиктов по нормализованному тексту, затем совпадение или близость
+    к известным темам, и только потом модель. Вердикт модели кэшируется.
+    """
+    normalized = normalize_theme(theme)
+    if len(normalized) >= 2:
+        cached = await get_theme_verdict(normalized)
+        if cached is not None:
+            return cached
+        try:
+            if _is_known_theme(normalized):
+                return {"valid": True, "message": ""}
+            similar = await _similar_known_theme(theme)
+            if similar is not None:
+                verdict = {"valid": True, "message": ""}
+                await set_theme_verdict(normalized, verdict)
+                return verdict
+        except Exception as e:
+            logger.warning("check_theme: поиск похожих тем недоступен: %s", e)
+
+    result = await validate_theme(theme)
+    if len(normalized) >= 2 and result.get("parsed", True):
+        await set_theme_verdict(normalized, {"valid": result["valid"], "message": result.get("message", "")})
+    return result
 
 
 @APP.get("/health")
@@ -265,10 +366,22 @@ async def health():
     return {"status": "OK"}
 
 
+@APP.get("/health/db")
+async def health_db():
+    """Статистика пула соединений этого процесса — для расчёта max_connections по репликам."""
+    return pool_stats()
+
+
+@APP.get("/health/eval_cache")
+async def health_eval_cache():
+    """Попадания и промахи кэша результатов оценки (общие для всех воркеров)."""
+    return await get_cache_stats()
+
+
 @APP.get("/settings", response_model=UserSettingsResponse)
 async def get_settings(
     claim: Claims = Depends(get_current_user),
-    session: AsyncSession = Depends(get_session),
+    session: AsyncSession = Depends(get_read_session),
 ):
     if claim is None or claim.token is None:
         raise HTTPException(status_code=401, headers={"WWW-Authenticate": "Bearer"})
@@ -311,6 +424,9 @@ async def patch_settings(
         row.auto_save_interval_sec = payload.auto_save_interval_sec
     await session.commit()
     await session.refresh(row)
+    await pin_to_primary(claim.user_id)
+    if payload.target_percent is not None:
+        await invalidate_progress(claim.user_id)
     return UserSettingsResponse(
         target_percent=row.target_percent,
         auto_save_enabled=row.auto_save_enabled,
@@ -333,7 +449,7 @@ async def random_topic(
         section_list = [s.strip() for s in sections.split("|") if s.strip()]
         if len(section_list) > 3:
             raise HTTPException(status_code=400, detail="Допустимо не более 3 разделов.")
-        theme = _random_theme_from_sections(section_list)
+        theme = await _random_theme_from_sections(section_list)
     else:
         theme = random.choice(_load_all_themes())
 
@@ -343,33 +459,15 @@ async def random_topic(
 @APP.get("/recommended_topic", response_model=RecommendedTopicResponse)
 async def recommended_topic(
     claim: Claims = Depends(get_current_user),
-    session: AsyncSession = Depends(get_session),
+    session: AsyncSession = Depends(get_read_session),
 ):
     if claim is None or claim.token is None:
         raise HTTPException(status_code=401, headers={"WWW-Authenticate": "Bearer"})
 
-    result = await session.execute(
-        select(Essay)
-        .where(Essay.user_id == claim.user_id, Essay.total_score_per.isnot(None))
-        .order_by(Essay.ended_at.desc())
-        .limit(10)
-    )
-    recent = result.scalars().all()
-
-    current_avg_pct: Optional[float] = None
-    if recent:
-        weights = list(range(len(recent), 0, -1))
-        total_w = sum(weights)
-        weighted_sum = sum(
-            (e.total_score_per or 0) * w for e, w in zip(recent, weights)
-        )
-        current_avg_pct = round((weighted_sum / total_w) * 100, 1)
-
-    settings_row = await session.execute(
-        select(UserSettings).where(UserSettings.user_id == claim.user_id)
-    )
-    user_settings = settings_row.scalar_one_or_none()
-    target_percent = user_settings.target_percent if user_settings else 70
+    # Взвешенное среднее по последним оценкам и целевой процент — из кэша агрегатов (api.user_progress)
+    progress = await get_progress(session, claim.user_id)
+    current_avg_pct: Optional[float] = progress["weighted_avg_percent"]
+    target_percent = progress["target_percent"]
 
     level = _determine_recommendation_level(current_avg_pct, target_percent)
 
@@ -391,7 +489,7 @@ async def recommended_topic(
 @APP.post("/start_essay", response_model=EssayState)
 async def start_essay(
     payload: EssayStartRequest,
-    _: None = Depends(require_model_rate_limit),
+    _: None = Depends(require_theme_rate_limit),
     claim: Claims = Depends(get_current_user),
 ):
     if claim is None or claim.token is None:
@@ -401,7 +499,7 @@ async def start_essay(
     # Если theme_source не передан (None) — тоже проверяем, иначе повторная отправка могла бы пройти без проверки.
     if payload.theme_source not in ("recommended", "random"):
         try:
-            result = await asyncio.to_thread(validate_theme_sync, payload.theme.strip())
+            result = await _check_theme(payload.theme.strip())
             if not result.get("valid", True):
                 raise HTTPException(
                     status_code=400,
@@ -413,13 +511,6 @@ async def start_essay(
             logger.exception("start_essay validate_theme: %s", e)
             raise HTTPException(status_code=500, detail="Не удалось проверить тему.")
 
-    existing = await redis_client.get(_redis_key(claim.user_id))
-    if existing:
-        raise HTTPException(
-            status_code=409,
-            detail="Активное сочинение уже существует.",
-        )
-
     state = EssayState(
         user_id=claim.user_id,
         type=payload.type,
@@ -427,32 +518,40 @@ async def start_essay(
         text="",
         started_at=datetime.now(timezone.utc),
     )
-    await redis_client.set(_redis_key(claim.user_id), state.model_dump_json())
+    if not await create_active_essay(state):
+        raise HTTPException(
+            status_code=409,
+            detail="Активное сочинение уже существует.",
+        )
     return state
 
 
 @APP.post("/essay/clear")
 async def clear_essay(
     claim: Claims = Depends(get_current_user),
+    session: AsyncSession = Depends(get_session),
 ):
-    """Завершить без результатов: удалить активное сочинение из Redis."""
+    """Завершить без результатов: удалить активное сочинение из Redis и его черновик."""
     if claim is None or claim.token is None:
         raise HTTPException(status_code=401, headers={"WWW-Authenticate": "Bearer"})
-    await redis_client.delete(_redis_key(claim.user_id))
+    await delete_active_essay(claim.user_id)
+    await delete_draft(session, claim.user_id)
+    await session.commit()
+    await mark_no_draft(claim.user_id)
     return {"ok": True}
 
 
 @APP.post("/essay/validate_theme", response_model=ValidateThemeResponse)
 async def validate_theme(
     payload: ValidateThemeRequest,
-    _: None = Depends(require_model_rate_limit),
+    _: None = Depends(require_theme_rate_limit),
     claim: Claims = Depends(get_current_user),
 ):
     """Проверка темы сочинения: осмысленная формулировка (ИИ)."""
     if claim is None or claim.token is None:
         raise HTTPException(status_code=401, headers={"WWW-Authenticate": "Bearer"})
     try:
-        result = await asyncio.to_thread(validate_theme_sync, payload.theme.strip())
+        result = await _check_theme(payload.theme.strip())
         return ValidateThemeResponse(valid=result["valid"], message=result.get("message", ""))
     except Exception as e:
         logger.exception("validate_theme: %s", e)
@@ -467,10 +566,10 @@ async def get_current_essay(
     if claim is None or claim.token is None:
         raise HTTPException(status_code=401, headers={"WWW-Authenticate": "Bearer"})
 
-    data = await redis_client.get(_redis_key(claim.user_id))
-    if not data:
+    state = await get_active_essay(claim.user_id)
+    if state is None:
         raise HTTPException(status_code=404, detail="Активное сочинение не найдено.")
-    return EssayState.model_validate_json(data)
+    return state
 
 
 @APP.post("/essay/save", response_model=EssayState)
@@ -482,66 +581,38 @@ async def save_essay(
     if claim is None or claim.token is None:
         raise HTTPException(status_code=401, headers={"WWW-Authenticate": "Bearer"})
 
-    data = await redis_client.get(_redis_key(claim.user_id))
-    if not data:
-        raise HTTPException(status_code=404, detail="Активное сочинение не найдено.")
+    return await save_active_text(claim.user_id, payload.text, payload.version)
 
-    state = EssayState.model_validate_json(data)
-    state.text = payload.text
-    await redis_client.set(_redis_key(claim.user_id), state.model_dump_json())
-    return state
 
+@APP.post("/essay/patch", response_model=EssayPatchResponse)
+async def patch_essay(
+    payload: EssayPatchRequest,
+    claim: Claims = Depends(get_current_user),
+):
+    """Автосохранение правками относительно версии payload.version; 409 — текст изменён в другой вкладке."""
+    if claim is None or claim.token is None:
+        raise HTTPException(status_code=401, headers={"WWW-Authenticate": "Bearer"})
 
-logger = logging.getLogger(__name__)
+    version = await patch_active_text(claim.user_id, payload.version, payload.ops)
+    return EssayPatchResponse(version=version)
 
 
-async def _evaluate_essay_task(essay_id: int) -> None:
-    """Фоновая задача: оценить сочинение локальной моделью и обновить запись в БД."""
-    async with AsyncSessionLocal() as session:
-        essay = await session.get(Essay, essay_id)
-        if not essay:
-            logger.warning("essay_eval: сочинение %s не найдено", essay_id)
-            return
-        theme, text, essay_type = essay.theme, essay.text, (essay.essay_type or "essay")
-    logger.info("essay_eval: старт оценки сочинения %s (type=%s, theme=%s, len=%s)", essay_id, essay_type, theme[:50], len(text))
-    try:
-        result = await asyncio.to_thread(evaluate_essay_sync, theme, text, essay_type)
-    except Exception as e:
-        logger.exception("essay_eval: ошибка оценки сочинения %s: %s", essay_id, e)
-        return
-    logger.info("essay_eval: оценка готова для %s, total_score=%s", essay_id, result.get("total_score"))
-    async with AsyncSessionLocal() as session:
-        essay = await session.get(Essay, essay_id)
-        if not essay:
-            logger.warning("essay_eval: сочинение %s не найдено при сохранении", essay_id)
-            return
-        essay.criteries = result["criteries"]
-        essay.common_mistakes = result["common_mistakes"]
-        essay.max_score = result["max_score"]
-        essay.total_score = result["total_score"]
-        essay.total_score_per = result.get("total_score_per")
-        session.add(essay)
-        await session.commit()
-    logger.info("essay_eval: сочинение %s сохранено", essay_id)
+logger = logging.getLogger(__name__)
 
 
 @APP.post("/essay/end", response_model=EssayEndResponse)
 @APP.post("/end_essay", response_model=EssayEndResponse)
 async def end_essay(
     payload: EssayEndRequest,
-    background_tasks: BackgroundTasks,
-    _: None = Depends(require_model_rate_limit),
+    _: None = Depends(require_grading_rate_limit),
     claim: Claims = Depends(get_current_user),
     session: AsyncSession = Depends(get_session),
 ):
     if claim is None or claim.token is None:
         raise HTTPException(status_code=401, headers={"WWW-Authenticate": "Bearer"})
 
-    data = await redis_client.get(_redis_key(claim.user_id))
-    if not data:
-        raise HTTPException(status_code=404, detail="Активное сочинение не найдено.")
-
-    state = EssayState.model_validate_json(data)
+    # Сочинение атомарно забирается из активных: двойная отправка получит 409, а не второй INSERT
+    state = await claim_active_essay(claim.user_id)
     state.text = payload.text
     ended_at = datetime.now(timezone.utc)
 
@@ -559,12 +630,20 @@ async def end_essay(
         common_mistakes=[],
     )
     session.add(essay)
-    await session.commit()
-    await session.refresh(essay)
+    await delete_draft(session, claim.user_id)
+    try:
+        await session.commit()
+        await session.refresh(essay)
+    except Exception:
+        await release_claimed_essay(claim.user_id)
+        raise
 
-    await redis_client.delete(_redis_key(claim.user_id))
+    await finish_claimed_essay(claim.user_id)
+    # Новое сочинение должно сразу появиться в GET /essays, даже если реплика отстаёт
+    await pin_to_primary(claim.user_id)
 
-    background_tasks.add_task(_evaluate_essay_task, essay.id)
+    # Оценка выполняется отдельным процессом (python -m api.eval_worker)
+    await enqueue_evaluation(essay.id, fresh=payload.fresh)
 
     return EssayEndResponse(
         id=essay.id,
@@ -582,60 +661,149 @@ async def end_essay(
     )
 
 
+def _essay_search(term: str):
+    """
+    Условие и ранг поиска: слова (tsvector, морфология русского) или подстрока без учёта регистра
+    (ILIKE по индексу триграмм ix_essays_search_trgm — выражение должно совпадать с индексом).
+    """
+    query = func.websearch_to_tsquery(ESSAY_SEARCH_CONFIG, term)
+    pattern = "%" + term.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_") + "%"
+    haystack = Essay.theme.op("||")(literal_column("' '")).op("||")(Essay.text)
+    condition = or_(Essay.search_vector.op("@@")(query), haystack.ilike(pattern))
+    return condition, func.ts_rank_cd(Essay.search_vector, query)
+
+
+# Ключ курсора GET /essays для каждой сортировки: значения колонок последней строки страницы
+_ESSAY_CURSOR_KEYS = {
+    "date": ("ended_at", "id"),
+    "score": ("total_score", "ended_at", "id"),
+    "theme": ("theme", "ended_at", "id"),
+    "relevance": ("rank", "id"),
+}
+
+
+def _encode_cursor(order: str, values: list) -> str:
+    raw = json.dumps({"o": order, "k": values}, ensure_ascii=False, default=lambda v: v.isoformat())
+    return base64.urlsafe_b64encode(raw.encode("utf-8")).decode("ascii").rstrip("=")
+
+
+def _decode_cursor(cursor: str, order: str) -> list:
+    try:
+        data = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+        values = list(data["k"])
+        if data["o"] != order or len(values) != len(_ESSAY_CURSOR_KEYS[order]):
+            raise ValueError(cursor)
+        if "ended_at" in _ESSAY_CURSOR_KEYS[order]:
+            i = _ESSAY_CURSOR_KEYS[order].index("ended_at")
+            values[i] = datetime.fromisoformat(values[i])
+        return values
+    except (ValueError, KeyError, TypeError):
+        raise HTTPException(status_code=400, detail="Некорректный курсор.")
+
+
 @APP.get("/essays")
 async def list_essays(
+    response: Response,
     claim: Claims = Depends(get_current_user),
-    session: AsyncSession = Depends(get_session),
+    session: AsyncSession = Depends(get_read_session),
     limit: int = Query(100, ge=1, le=200),
     search: Optional[str] = Query(None, description="Поиск по теме или тексту сочинения"),
     type_filter: Optional[str] = Query(None, description="Тип: essay или ege"),
-    order: str = Query("date", description="Сортировка: date, score, theme"),
+    order: str = Query("date", description="Сортировка: date, score, theme, relevance (при search)"),
+    cursor: Optional[str] = Query(None, description="Курсор следующей страницы из заголовка X-Next-Cursor"),
 ) -> list[dict]:
-    """Список сочинений текущего пользователя. Поле excerpt — первые 150 символов текста."""
+    """
+    Список сочинений текущего пользователя. Поле excerpt — первые 150 символов текста.
+    Если есть следующая страница, её курсор возвращается в заголовке X-Next-Cursor.
+    """
     if claim is None or claim.token is None:
         raise HTTPException(status_code=401, headers={"WWW-Authenticate": "Bearer"})
 
-    q = select(Essay).where(Essay.user_id == claim.user_id)
+    q = select(
+        Essay.id,
+        Essay.essay_type,
+        Essay.theme,
+        Essay.ended_at,
+        Essay.total_score,
+        Essay.total_score_per,
+        Essay.max_score,
+        Essay.criteries,
+        func.left(Essay.text, 150).label("excerpt"),
+    ).where(Essay.user_id == claim.user_id)
     if type_filter in ("essay", "ege"):
         q = q.where(Essay.essay_type == type_filter)
+    term = (search or "").strip()
+    if order not in _ESSAY_CURSOR_KEYS or (order == "relevance" and not term):
+        order = "date"
+    if term:
+        condition, rank = _essay_search(term)
+        q = q.where(condition)
+        if order == "relevance":
+            q = q.add_columns(rank.label("rank"))
+
+    # Порядок строгий (id в конце), курсор — «строго после» последней строки в этом порядке.
+    # Индексы ix_essays_user_* покрывают user_id + порядок сортировки.
+    after = _decode_cursor(cursor, order) if cursor else None
     if order == "score":
-        q = q.order_by(Essay.total_score.desc().nulls_last(), Essay.ended_at.desc())
+        q = q.order_by(Essay.total_score.desc(), Essay.ended_at.desc(), Essay.id.desc())
+        if after:
+            q = q.where(tuple_(Essay.total_score, Essay.ended_at, Essay.id) < tuple_(*after))
     elif order == "theme":
-        q = q.order_by(Essay.theme.asc(), Essay.ended_at.desc())
+        q = q.order_by(Essay.theme.asc(), Essay.ended_at.desc(), Essay.id.desc())
+        if after:
+            q = q.where(
+                or_(
+                    Essay.theme > after[0],
+                    and_(Essay.theme == after[0], tuple_(Essay.ended_at, Essay.id) < tuple_(after[1], after[2])),
+                )
+            )
+    elif order == "relevance":
+        q = q.order_by(rank.desc(), Essay.id.desc())
+        if after:
+            q = q.where(tuple_(rank, Essay.id) < tuple_(*after))
     else:
-        q = q.order_by(Essay.ended_at.desc())
-    q = q.limit(limit * 2 if search else limit)
-    result = await session.execute(q)
-    rows = result.scalars().all()
-
-    out: list[dict] = []
-    for e in rows:
-        text = (e.text or "")[:150]
-        if search:
-            search_lower = search.strip().lower()
-            if search_lower and search_lower not in (e.theme or "").lower() and search_lower not in (e.text or "").lower():
-                continue
-        raw_crit = getattr(e, "criteries", None)
-        if raw_crit is None:
-            criteries: dict = {}
-        elif isinstance(raw_crit, dict):
-            criteries = raw_crit
-        else:
-            criteries = dict(raw_crit) if raw_crit else {}
-        out.append({
-            "id": e.id,
-            "type": e.essay_type,
-            "theme": e.theme,
-            "ended_at": e.ended_at,
-            "total_score": e.total_score,
-            "total_score_per": e.total_score_per,
-            "max_score": e.max_score,
-            "criteries": criteries,
-            "excerpt": text,
-        })
-        if len(out) >= limit:
-            break
-    return out
+        q = q.order_by(Essay.ended_at.desc(), Essay.id.desc())
+        if after:
+            q = q.where(tuple_(Essay.ended_at, Essay.id) < tuple_(*after))
+    rows = (await session.execute(q.limit(limit + 1))).all()
+
+    if len(rows) > limit:
+        rows = rows[:limit]
+        last = rows[-1]._mapping
+        response.headers["X-Next-Cursor"] = _encode_cursor(order, [last[k] for k in _ESSAY_CURSOR_KEYS[order]])
+
+    return [
+        {
+            "id": row.id,
+            "type": row.essay_type,
+            "theme": row.theme,
+            "ended_at": row.ended_at,
+            "total_score": row.total_score,
+            "total_score_per": row.total_score_per,
+            "max_score": row.max_score,
+            "criteries": dict(row.criteries) if row.criteries else {},
+            "excerpt": row.excerpt or "",
+        }
+        for row in rows
+    ]
+
+
+@APP.get("/stats", response_model=StatsResponse)
+async def user_stats(
+    bucket: str = Query("week", description="Период: day, week, month"),
+    type_filter: Optional[str] = Query(None, description="Тип: essay или ege"),
+    date_from: Optional[date] = Query(None, description="Начало периода (дата окончания сочинения, UTC)"),
+    date_to: Optional[date] = Query(None, description="Конец периода включительно"),
+    claim: Claims = Depends(get_current_user),
+    session: AsyncSession = Depends(get_read_session),
+):
+    """Статистика текущего пользователя: динамика баллов, средние по критериям, ошибки по типам."""
+    if claim is None or claim.token is None:
+        raise HTTPException(status_code=401, headers={"WWW-Authenticate": "Bearer"})
+    if bucket not in STATS_BUCKETS:
+        raise HTTPException(status_code=400, detail="Некорректный период: day, week или month.")
+
+    return await get_stats(session, claim.user_id, bucket, type_filter, date_from, date_to)
 
 
 @APP.delete("/essay/{essay_id}")
@@ -652,8 +820,14 @@ async def delete_essay(
     essay = result.scalar_one_or_none()
     if not essay:
         raise HTTPException(status_code=404, detail="Сочинение не найдено.")
+    await forget_essay(session, essay)
     await session.delete(essay)
+    if essay.total_score_per is not None:
+        await session.flush()
+        await refresh_stats_day(session, essay.user_id, essay.ended_at)
     await session.commit()
+    await pin_to_primary(claim.user_id)
+    await invalidate_progress(claim.user_id)
     return {"ok": True}
 
 
@@ -661,7 +835,7 @@ async def delete_essay(
 async def get_essay(
     essay_id: int,
     claim: Claims = Depends(get_current_user),
-    session: AsyncSession = Depends(get_session),
+    session: AsyncSession = Depends(get_read_session),
 ):
     """Получить сочинение по id (для опроса результата оценки после POST /essay/end)."""
     if claim is None or claim.token is None:
@@ -688,5 +862,60 @@ async def get_essay(
     )
 
 
+def _sse(event: str, data: str) -> str:
+    return f"event: {event}\ndata: {data}\n\n"
+
+
+@APP.get("/essay/{essay_id}/stream")
+async def stream_essay_evaluation(
+    essay_id: int,
+    claim: Claims = Depends(get_current_user),
+    session: AsyncSession = Depends(get_session),
+):
+    """
+    Прогресс оценки сочинения (server-sent events): criterion — каждый критерий по готовности,
+    mistakes — список ошибок, done — итоговый балл; retry/error — повтор или неудача оценки.
+    """
+    if claim is None or claim.token is None:
+        raise HTTPException(status_code=401, headers={"WWW-Authenticate": "Bearer"})
+
+    result = await session.execute(select(Essay).where(Essay.id == essay_id, Essay.user_id == claim.user_id))
+    essay = result.scalar_one_or_none()
+    if not essay:
+        raise HTTPException(status_code=404, detail="Сочинение не найдено.")
+    # Уже оценено (max_score заполняется вместе с результатом): сразу отдаём итог
+    done_payload = None
+    if essay.max_score is not None:
+        done_payload = json.dumps(
+            {"total_score": essay.total_score, "total_score_per": essay.total_score_per, "max_score": essay.max_score}
+        )
+    # Поток может быть долгим — не держим соединение с БД
+    await session.close()
+
+    async def events():
+        if done_payload is not None:
+            yield _sse("done", done_payload)
+            return
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + EVAL_STREAM_TIMEOUT_SEC
+        last_id = "0"
+        while loop.time() < deadline:
+            entries = await read_progress(essay_id, last_id, EVAL_STREAM_PING_SEC * 1000)
+            if not entries:
+                yield ": ping\n\n"
+                continue
+            for entry_id, event, data in entries:
+                last_id = entry_id
+                yield _sse(event, data)
+                if event in ("done", "error"):
+                    return
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
 if __name__ == "__main__":
     uvicorn.run("api.main:APP", host=API_HOST, port=API_PORT, reload=False)
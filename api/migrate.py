@@ -0,0 +1,41 @@
+"""
+Применение миграций схемы БД (api/migrations). Запускается один раз перед обновлением API
+и воркеров: python -m api.migrate [--status] [--target N].
+"""
+import argparse
+import asyncio
+import logging
+
+from dotenv import load_dotenv
+
+from api.db import engine
+from api.migrations import current_version, load_revisions, upgrade
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+
+async def main(args: argparse.Namespace) -> None:
+    try:
+        if args.status:
+            version = await current_version(engine)
+            for revision in load_revisions():
+                mark = "x" if version and revision.version <= version else " "
+                print(f"[{mark}] {revision.version:04d}_{revision.name}")
+            return
+        applied = await upgrade(engine, args.target)
+        if applied:
+            logger.info("migrate: применено ревизий: %s", len(applied))
+        else:
+            logger.info("migrate: схема актуальна (версия %s)", await current_version(engine))
+    finally:
+        await engine.dispose()
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(name)s: %(message)s")
+    parser = argparse.ArgumentParser(description="Миграции схемы БД Lingwo API")
+    parser.add_argument("--status", action="store_true", help="показать применённые ревизии и выйти")
+    parser.add_argument("--target", type=int, default=None, help="применить ревизии только до этой версии")
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,138 @@
+"""
+Версионные миграции схемы БД API. Каждая ревизия — модуль vNNNN_<имя>.py с функцией
+upgrade(conn); применённые версии записываются в schema_migrations.
+Миграции выполняются один раз отдельной командой (python -m api.migrate) до запуска API,
+сам API при старте только сверяет версию схемы (verify_schema) и DDL не выполняет.
+Ревизия с TRANSACTIONAL = False (CREATE INDEX CONCURRENTLY) выполняется в autocommit,
+поэтому её шаги должны быть идемпотентными (IF NOT EXISTS): при сбое она повторяется целиком.
+"""
+import asyncio
+import importlib
+import logging
+import pkgutil
+import re
+from dataclasses import dataclass
+from types import ModuleType
+from typing import Optional
+
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncConnection, AsyncEngine
+
+logger = logging.getLogger(__name__)
+
+MIGRATIONS_TABLE = "schema_migrations"
+# Ключ pg_advisory_lock: параллельные запуски миграций ждут друг друга
+MIGRATIONS_LOCK_ID = 0x6C696E67
+MIGRATIONS_LOCK_POLL_SEC = 1.0
+
+_REVISION_RE = re.compile(r"^v(\d{4})_(\w+)$")
+
+
+@dataclass(frozen=True)
+class Revision:
+    version: int
+    name: str
+    module: ModuleType
+
+    @property
+    def transactional(self) -> bool:
+        return getattr(self.module, "TRANSACTIONAL", True)
+
+
+def load_revisions() -> list[Revision]:
+    """Ревизии пакета по возрастанию версии; номера должны идти подряд с 1."""
+    revisions = []
+    for info in pkgutil.iter_modules(__path__):
+        match = _REVISION_RE.match(info.name)
+        if match:
+            module = importlib.import_module(f"{__name__}.{info.name}")
+            revisions.append(Revision(int(match.group(1)), match.group(2), module))
+    revisions.sort(key=lambda r: r.version)
+    for expected, revision in enumerate(revisions, start=1):
+        if revision.version != expected:
+            raise RuntimeError(f"Пропущена ревизия миграции {expected:04d} (найдена {revision.version:04d})")
+    return revisions
+
+
+def head_version() -> int:
+    revisions = load_revisions()
+    return revisions[-1].version if revisions else 0
+
+
+async def column_type(conn: AsyncConnection, table: str, column: str) -> Optional[str]:
+    """Тип колонки по information_schema (json, jsonb, ...); для ревизий, меняющих типы."""
+    return await conn.scalar(
+        text(
+            "SELECT data_type FROM information_schema.columns "
+            "WHERE table_schema = current_schema() AND table_name = :table AND column_name = :column"
+        ),
+        {"table": table, "column": column},
+    )
+
+
+async def current_version(engine: AsyncEngine) -> Optional[int]:
+    """Последняя применённая версия; None, если миграции ещё не запускались."""
+    async with engine.connect() as conn:
+        exists = await conn.scalar(text("SELECT to_regclass(:name) IS NOT NULL"), {"name": MIGRATIONS_TABLE})
+        if not exists:
+            return None
+        return await conn.scalar(text(f"SELECT coalesce(max(version), 0) FROM {MIGRATIONS_TABLE}"))
+
+
+async def upgrade(engine: AsyncEngine, target: Optional[int] = None) -> list[Revision]:
+    """Применяет ревизии до target (по умолчанию — до последней). Возвращает применённые."""
+    revisions = load_revisions()
+    applied = []
+    async with engine.connect() as lock_conn:
+        lock_conn = await lock_conn.execution_options(isolation_level="AUTOCOMMIT")
+        # Ожидание опросом, а не блокирующим pg_advisory_lock: ждущий запрос держит снимок,
+        # и CREATE INDEX CONCURRENTLY в другом запуске ждал бы его бесконечно
+        while not await lock_conn.scalar(text("SELECT pg_try_advisory_lock(:id)"), {"id": MIGRATIONS_LOCK_ID}):
+            logger.info("migrations: ожидание другого запуска миграций")
+            await asyncio.sleep(MIGRATIONS_LOCK_POLL_SEC)
+        try:
+            await lock_conn.execute(text(
+                f"CREATE TABLE IF NOT EXISTS {MIGRATIONS_TABLE} ("
+                "version INTEGER PRIMARY KEY, name VARCHAR(128) NOT NULL, "
+                "applied_at TIMESTAMPTZ NOT NULL DEFAULT now())"
+            ))
+            done = await lock_conn.scalar(text(f"SELECT coalesce(max(version), 0) FROM {MIGRATIONS_TABLE}"))
+            for revision in revisions:
+                if revision.version <= done or (target is not None and revision.version > target):
+                    continue
+                logger.info("migrations: применяется %04d_%s", revision.version, revision.name)
+                await _apply(engine, revision)
+                applied.append(revision)
+        finally:
+            await lock_conn.execute(text("SELECT pg_advisory_unlock(:id)"), {"id": MIGRATIONS_LOCK_ID})
+    return applied
+
+
+async def _apply(engine: AsyncEngine, revision: Revision) -> None:
+    record = text(f"INSERT INTO {MIGRATIONS_TABLE} (version, name) VALUES (:version, :name)")
+    params = {"version": revision.version, "name": revision.name}
+    if revision.transactional:
+        async with engine.begin() as conn:
+            await revision.module.upgrade(conn)
+            await conn.execute(record, params)
+        return
+    async with engine.connect() as conn:
+        conn = await conn.execution_options(isolation_level="AUTOCOMMIT")
+        await revision.module.upgrade(conn)
+        await conn.execute(record, params)
+
+
+async def verify_schema(engine: AsyncEngine) -> None:
+    """
+    Проверка при старте API: схема не старее последней ревизии кода. Более новая схема
+    допустима — при поэтапном обновлении старые процессы ещё работают после миграции.
+    """
+    required = head_version()
+    version = await current_version(engine)
+    if version is None or version < required:
+        raise RuntimeError(
+            f"Схема БД устарела: версия {version or 0}, требуется {required}. "
+            "Выполните миграции: python -m api.migrate"
+        )
+    if version > required:
+        logger.warning("migrations: версия схемы %s новее кода (%s)", version, required)
@@ -0,0 +1,39 @@
+"""
+Исходная схема: essays и user_settings, как их создавал create_all, и поля оценки
+из бывшего migrate_essay_eval.sql. На базах, созданных до миграций, шаги ничего не меняют.
+"""
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncConnection
+
+STATEMENTS = (
+    """
+    CREATE TABLE IF NOT EXISTS user_settings (
+        user_id VARCHAR(64) PRIMARY KEY,
+        target_percent INTEGER NOT NULL,
+        auto_save_enabled BOOLEAN NOT NULL,
+        auto_save_interval_sec INTEGER NOT NULL
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS essays (
+        id SERIAL PRIMARY KEY,
+        user_id VARCHAR(64) NOT NULL,
+        essay_type VARCHAR(16) NOT NULL,
+        theme VARCHAR(512) NOT NULL,
+        text TEXT NOT NULL,
+        started_at TIMESTAMPTZ NOT NULL,
+        ended_at TIMESTAMPTZ NOT NULL,
+        total_score DOUBLE PRECISION NOT NULL,
+        criteries JSON NOT NULL
+    )
+    """,
+    "CREATE INDEX IF NOT EXISTS ix_essays_user_id ON essays (user_id)",
+    "ALTER TABLE essays ADD COLUMN IF NOT EXISTS max_score DOUBLE PRECISION",
+    "ALTER TABLE essays ADD COLUMN IF NOT EXISTS common_mistakes JSONB DEFAULT '[]'::jsonb",
+    "ALTER TABLE essays ADD COLUMN IF NOT EXISTS total_score_per DOUBLE PRECISION",
+)
+
+
+async def upgrade(conn: AsyncConnection) -> None:
+    for statement in STATEMENTS:
+        await conn.execute(text(statement))
@@ -0,0 +1,21 @@
+"""
+criteries и common_mistakes — в JSONB: create_all создавал их как JSON, а в базах,
+обновлённых через ALTER, common_mistakes уже JSONB. Запросы статистики и поиска работают
+с jsonb-функциями без приведения типов. NULL заменяются пустыми значениями, колонки — NOT NULL.
+"""
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncConnection
+
+from api.migrations import column_type
+
+
+async def upgrade(conn: AsyncConnection) -> None:
+    for column, default in (("criteries", "'{}'::jsonb"), ("common_mistakes", "'[]'::jsonb")):
+        # Перезапись таблицы только если тип ещё не jsonb
+        if await column_type(conn, "essays", column) != "jsonb":
+            await conn.execute(text(
+                f"ALTER TABLE essays ALTER COLUMN {column} TYPE jsonb USING {column}::jsonb"
+            ))
+        await conn.execute(text(f"UPDATE essays SET {column} = {default} WHERE {column} IS NULL"))
+        await conn.execute(text(f"ALTER TABLE essays ALTER COLUMN {column} SET DEFAULT {default}"))
+        await conn.execute(text(f"ALTER TABLE essays ALTER COLUMN {column} SET NOT NULL"))
@@ -0,0 +1,17 @@
+"""Полнотекстовый поиск по сочинениям: расширение pg_trgm и генерируемая колонка search_vector."""
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncConnection
+
+# Выражение зафиксировано здесь, а не берётся из api.models: миграция не должна меняться вместе с кодом
+SEARCH_VECTOR_SQL = (
+    "setweight(to_tsvector('russian', coalesce(theme, '')), 'A') || "
+    "setweight(to_tsvector('russian', coalesce(text, '')), 'B')"
+)
+
+
+async def upgrade(conn: AsyncConnection) -> None:
+    await conn.execute(text("CREATE EXTENSION IF NOT EXISTS pg_trgm"))
+    await conn.execute(text(
+        "ALTER TABLE essays ADD COLUMN IF NOT EXISTS search_vector tsvector "
+        f"GENERATED ALWAYS AS ({SEARCH_VECTOR_SQL}) STORED"
+    ))
@@ -0,0 +1,31 @@
+"""
+Индексы поиска (GIN) и сортировок списка сочинений (GET /essays). Строятся CONCURRENTLY,
+чтобы не блокировать запись в essays; прерванная сборка оставляет невалидный индекс — он
+удаляется и строится заново при повторном запуске.
+"""
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncConnection
+
+TRANSACTIONAL = False
+
+INDEXES = {
+    "ix_essays_search_vector": "ON essays USING gin (search_vector)",
+    "ix_essays_search_trgm": "ON essays USING gin ((theme || ' ' || text) gin_trgm_ops)",
+    "ix_essays_user_ended": "ON essays (user_id, ended_at DESC, id DESC)",
+    "ix_essays_user_score": "ON essays (user_id, total_score DESC, ended_at DESC, id DESC)",
+    "ix_essays_user_theme": "ON essays (user_id, theme, ended_at DESC, id DESC)",
+}
+
+
+async def upgrade(conn: AsyncConnection) -> None:
+    for name, definition in INDEXES.items():
+        invalid = await conn.scalar(
+            text(
+                "SELECT NOT i.indisvalid FROM pg_index i JOIN pg_class c ON c.oid = i.indexrelid "
+                "WHERE c.relname = :name AND c.relnamespace = current_schema()::regnamespace"
+            ),
+            {"name": name},
+        )
+        if invalid:
+            await conn.execute(text(f"DROP INDEX CONCURRENTLY IF EXISTS {name}"))
+        await conn.execute(text(f"CREATE INDEX CONCURRENTLY IF NOT EXISTS {name} {definition}"))
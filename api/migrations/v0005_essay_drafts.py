@@ -0,0 +1,19 @@
+"""Черновики активных сочинений, переносимые из Redis (api.essay_drafts)."""
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncConnection
+
+
+async def upgrade(conn: AsyncConnection) -> None:
+    await conn.execute(text(
+        """
+        CREATE TABLE IF NOT EXISTS essay_drafts (
+            user_id VARCHAR(64) PRIMARY KEY,
+            essay_type VARCHAR(16) NOT NULL,
+            theme VARCHAR(512) NOT NULL,
+            text TEXT NOT NULL,
+            started_at TIMESTAMPTZ NOT NULL,
+            version INTEGER NOT NULL,
+            updated_at TIMESTAMPTZ NOT NULL
+        )
+        """
+    ))
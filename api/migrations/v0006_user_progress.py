@@ -0,0 +1,30 @@
+"""
+Агрегаты прогресса пользователя (api.user_progress). Таблица могла быть создана create_all
+с колонками JSON — они переводятся в JSONB.
+"""
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncConnection
+
+from api.migrations import column_type
+
+
+async def upgrade(conn: AsyncConnection) -> None:
+    await conn.execute(text(
+        """
+        CREATE TABLE IF NOT EXISTS user_progress (
+            user_id VARCHAR(64) PRIMARY KEY,
+            scored_count INTEGER NOT NULL,
+            count_by_type JSONB NOT NULL,
+            recent JSONB NOT NULL,
+            weighted_avg_percent DOUBLE PRECISION,
+            criteria JSONB NOT NULL,
+            updated_at TIMESTAMPTZ NOT NULL
+        )
+        """
+    ))
+    for column in ("count_by_type", "recent", "criteria"):
+        if await column_type(conn, "user_progress", column) == "jsonb":
+            continue
+        await conn.execute(text(
+            f"ALTER TABLE user_progress ALTER COLUMN {column} TYPE jsonb USING {column}::jsonb"
+        ))
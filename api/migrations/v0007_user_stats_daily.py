@@ -0,0 +1,72 @@
+"""Дневные срезы статистики (GET /stats, api.user_stats) и их заполнение по уже оценённым сочинениям."""
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncConnection
+
+# Заполнение по уже оценённым сочинениям. Запрос зафиксирован здесь, а не берётся из api.user_stats:
+# миграция не должна меняться вместе с кодом
+BACKFILL_SQL = """
+WITH scored AS (
+    SELECT user_id, (ended_at AT TIME ZONE 'UTC')::date AS day, essay_type, total_score_per,
+           criteries, common_mistakes
+    FROM essays
+    WHERE total_score_per IS NOT NULL
+),
+totals AS (
+    SELECT user_id, day, essay_type, count(*) AS essays, sum(total_score_per) AS score_per_sum
+    FROM scored
+    GROUP BY user_id, day, essay_type
+),
+crit AS (
+    SELECT user_id, day, essay_type, jsonb_object_agg(key, jsonb_build_array(total, n)) AS criteria
+    FROM (
+        SELECT s.user_id, s.day, s.essay_type, c.key, sum((c.value->>'score')::float) AS total, count(*) AS n
+        FROM scored s
+        CROSS JOIN jsonb_each(CASE WHEN jsonb_typeof(s.criteries) = 'object' THEN s.criteries ELSE '{}' END) c
+        WHERE jsonb_typeof(c.value->'score') = 'number'
+        GROUP BY s.user_id, s.day, s.essay_type, c.key
+    ) per_key
+    GROUP BY user_id, day, essay_type
+),
+mist AS (
+    SELECT user_id, day, essay_type, jsonb_object_agg(kind, total) AS mistakes
+    FROM (
+        SELECT s.user_id, s.day, s.essay_type, m.value->>'type' AS kind, sum((m.value->>'count')::numeric) AS total
+        FROM scored s
+        CROSS JOIN jsonb_array_elements(
+            CASE WHEN jsonb_typeof(s.common_mistakes) = 'array' THEN s.common_mistakes ELSE '[]' END
+        ) m
+        WHERE m.value->>'type' IS NOT NULL AND jsonb_typeof(m.value->'count') = 'number'
+        GROUP BY s.user_id, s.day, s.essay_type, m.value->>'type'
+    ) per_kind
+    GROUP BY user_id, day, essay_type
+)
+INSERT INTO user_stats_daily (user_id, day, essay_type, essays, score_per_sum, criteria, mistakes)
+SELECT t.user_id, t.day, t.essay_type, t.essays, t.score_per_sum,
+       coalesce(c.criteria, '{}'), coalesce(m.mistakes, '{}')
+FROM totals t
+LEFT JOIN crit c USING (user_id, day, essay_type)
+LEFT JOIN mist m USING (user_id, day, essay_type)
+ON CONFLICT (user_id, day, essay_type) DO UPDATE SET
+    essays = EXCLUDED.essays,
+    score_per_sum = EXCLUDED.score_per_sum,
+    criteria = EXCLUDED.criteria,
+    mistakes = EXCLUDED.mistakes
+"""
+
+
+async def upgrade(conn: AsyncConnection) -> None:
+    await conn.execute(text(
+        """
+        CREATE TABLE IF NOT EXISTS user_stats_daily (
+            user_id VARCHAR(64) NOT NULL,
+            day DATE NOT NULL,
+            essay_type VARCHAR(16) NOT NULL,
+            essays INTEGER NOT NULL,
+            score_per_sum DOUBLE PRECISION NOT NULL,
+            criteria JSONB NOT NULL,
+            mistakes JSONB NOT NULL,
+            PRIMARY KEY (user_id, day, essay_type)
+        )
+        """
+    ))
+    await conn.execute(text(BACKFILL_SQL))
@@ -0,0 +1,231 @@
+"""
+Клиент моделей (LLM оценки и эмбеддинги тем).
+Если задан MODEL_SERVER_SOCKET_DIR или MODEL_SERVER_SOCKETS, запросы уходят в процессы
+api.model_server по Unix-сокетам, и HTTP-воркеры не загружают модели в свою память.
+Иначе модели работают в текущем процессе (как раньше).
+
+Протокол: JSON-сообщения по одному на строку. Запрос {"id", "op", "args"}; ответ {"id", "result"}
+или {"id", "error"}; во время оценки сервер присылает {"id", "progress"}.
+"""
+import asyncio
+import glob
+import itertools
+import json
+import logging
+import os
+from typing import Any, Callable, Optional
+
+logger = logging.getLogger(__name__)
+
+MODEL_SERVER_SOCKET_DIR = os.getenv("MODEL_SERVER_SOCKET_DIR")
+MODEL_SERVER_SOCKETS = [p for p in os.getenv("MODEL_SERVER_SOCKETS", "").split(",") if p.strip()]
+MODEL_SERVER_TIMEOUT_SEC = float(os.getenv("MODEL_SERVER_TIMEOUT_SEC", "900"))
+EMBEDDING_MODEL_NAME = os.getenv("EMBEDDING_MODEL_NAME", "sentence-transformers/paraphrase-multilingual-MiniLM-L12-v2")
+MESSAGE_LIMIT = 16 * 1024 * 1024
+
+_embedding_model = None
+
+
+def encode_message(message: dict[str, Any]) -> bytes:
+    return json.dumps(message, ensure_ascii=False).encode("utf-8") + b"\n"
+
+
+def _socket_paths() -> list[str]:
+    if MODEL_SERVER_SOCKETS:
+        return [p.strip() for p in MODEL_SERVER_SOCKETS]
+    if MODEL_SERVER_SOCKET_DIR:
+        return sorted(glob.glob(os.path.join(MODEL_SERVER_SOCKET_DIR, "*.sock")))
+    return []
+
+
+def remote_enabled() -> bool:
+    return bool(MODEL_SERVER_SOCKETS or MODEL_SERVER_SOCKET_DIR)
+
+
+class _Connection:
+    """Постоянное соединение с одним model_server; запросы мультиплексируются по id."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self.inflight = 0
+        self._reader: Optional[asyncio.StreamReader] = None
+        self._writer: Optional[asyncio.StreamWriter] = None
+        self._reader_task: Optional[asyncio.Task] = None
+        self._waiters: dict[int, tuple[asyncio.Future, Optional[Callable[[dict], None]]]] = {}
+        self._ids = itertools.count(1)
+        self._connect_lock = asyncio.Lock()
+
+    @property
+    def connected(self) -> bool:
+        return self._writer is not None and not self._writer.is_closing()
+
+    async def _ensure_connected(self) -> None:
+        if self.connected:
+            return
+        async with self._connect_lock:
+            if self.connected:
+                return
+            self._reader, self._writer = await asyncio.open_unix_connection(self.path, limit=MESSAGE_LIMIT)
+            self._reader_task = asyncio.create_task(self._read_loop())
+
+    async def _read_loop(self) -> None:
+        error: Exception = ConnectionError(f"model_server {self.path}: соединение закрыто")
+        try:
+            while True:
+                line = await self._reader.readline()
+                if not line:
+                    break
+                message = json.loads(line)
+                waiter = self._waiters.get(message.get("id"))
+                if waiter is None:
+                    continue
+                future, on_progress = waiter
+                if "progress" in message:
+                    if on_progress is not None:
+                        on_progress(message["progress"])
+                elif "error" in message:
+                    self._waiters.pop(message["id"], None)
+                    if not future.done():
+                        future.set_exception(RuntimeError(f"model_server: {message['error']}"))
+                else:
+                    self._waiters.pop(message["id"], None)
+                    if not future.done():
+                        future.set_result(message.get("result"))
+        except Exception as e:
+            error = e
+        finally:
+            if self._writer is not None:
+                self._writer.close()
+            self._writer = None
+            for future, _ in self._waiters.values():
+                if not future.done():
+                    future.set_exception(error)
+            self._waiters.clear()
+
+    def close(self) -> None:
+        """Закрывает соединение: останавливает чтение, ожидающие запросы получают ConnectionError."""
+        if self._reader_task is not None:
+            self._reader_task.cancel()
+        if self._writer is not None:
+            self._writer.close()
+        self._writer = None
+
+    async def request(self, op: str, args: dict[str, Any], on_progress: Optional[Callable[[dict], None]] = None) -> Any:
+        await self._ensure_connected()
+        request_id = next(self._ids)
+        future = asyncio.get_running_loop().create_future()
+        self._waiters[request_id] = (future, on_progress)
+        self.inflight += 1
+        try:
+            self._writer.write(encode_message({"id": request_id, "op": op, "args": args}))
+            await self._writer.drain()
+            return await asyncio.wait_for(future, timeout=MODEL_SERVER_TIMEOUT_SEC)
+        finally:
+            self.inflight -= 1
+            self._waiters.pop(request_id, None)
+
+
+class ModelClient:
+    """Балансирует запросы между репликами model_server: выбирается соединение с наименьшим числом запросов в работе."""
+
+    def __init__(self):
+        self._connections: dict[str, _Connection] = {}
+
+    def _pick(self, exclude: set[str]) -> Optional[_Connection]:
+        for path in _socket_paths():
+            if path not in self._connections:
+                self._connections[path] = _Connection(path)
+        candidates = [c for p, c in self._connections.items() if p not in exclude]
+        if not candidates:
+            return None
+        return min(candidates, key=lambda c: (not c.connected, c.inflight))
+
+    async def request(self, op: str, args: dict[str, Any], on_progress: Optional[Callable[[dict], None]] = None) -> Any:
+        tried: set[str] = set()
+        while True:
+            connection = self._pick(tried)
+            if connection is None:
+                raise ConnectionError("model_server: нет доступных реплик")
+            try:
+                return await connection.request(op, args, on_progress)
+            except TimeoutError:
+                # TimeoutError — подкласс OSError, но реплика жива и, возможно, ещё считает:
+                # повтор на другой реплике только удвоил бы нагрузку
+                raise
+            except (ConnectionError, FileNotFoundError, OSError) as e:
+                # Реплика недоступна (перезапуск, устаревший сокет) — пробуем следующую
+                logger.warning("model_client: реплика %s недоступна: %s", connection.path, e)
+                tried.add(connection.path)
+                self._drop(connection)
+
+    def _drop(self, connection: _Connection) -> None:
+        if self._connections.get(connection.path) is connection:
+            del self._connections[connection.path]
+        connection.close()
+
+
+_client = ModelClient()
+
+
+def _get_embedding_model():
+    global _embedding_model
+    if _embedding_model is None:
+        from sentence_transformers import SentenceTransformer
+
+        _embedding_model = SentenceTransformer(EMBEDDING_MODEL_NAME)
+    return _embedding_model
+
+
+def embed_sync(texts: list[str]) -> list[list[float]]:
+    return _get_embedding_model().encode(texts, normalize_embeddings=True).tolist()
+
+
+async def embed(texts: list[str]) -> list[list[float]]:
+    """Нормализованные эмбеддинги текстов (для поиска тем в Qdrant)."""
+    if remote_enabled():
+        return await _client.request("embed", {"texts": texts})
+    return await asyncio.to_thread(embed_sync, texts)
+
+
+async def validate_theme(theme: str) -> dict[str, Any]:
+    if remote_enabled():
+        return await _client.request("validate_theme", {"theme": theme})
+    from api.essay_eval import validate_theme_sync
+
+    return await asyncio.to_thread(validate_theme_sync, theme)
+
+
+async def evaluation_model_id() -> str:
+    """Идентификатор модели, которая будет оценивать (для отпечатка кэша результатов)."""
+    if remote_enabled():
+        return await _client.request("model_id", {})
+    from api.essay_eval import model_id
+
+    return model_id()
+
+
+async def evaluate_essay(
+    theme: str,
+    text: str,
+    essay_type: str = "essay",
+    on_progress: Optional[Callable[[dict[str, Any]], None]] = None,
+) -> dict[str, Any]:
+    """
+    Оценка сочинения; on_progress вызывается в event loop с событиями прогресса (см. evaluate_essay_sync).
+    В результате — model_id модели, которая оценила.
+    """
+    if remote_enabled():
+        return await _client.request(
+            "evaluate", {"theme": theme, "text": text, "essay_type": essay_type}, on_progress
+        )
+    from api.essay_eval import evaluate_essay_sync, model_id
+
+    callback = None
+    if on_progress is not None:
+        loop = asyncio.get_running_loop()
+
+        def callback(event: dict[str, Any]) -> None:
+            loop.call_soon_threadsafe(on_progress, event)
+
+    result = await asyncio.to_thread(evaluate_essay_sync, theme, text, essay_type, callback)
+    return {**result, "model_id": model_id()}
@@ -0,0 +1,125 @@
+"""
+Сервер моделей: держит LLM (essay_eval) и модель эмбеддингов и обслуживает API-воркеры и
+воркеры оценки по Unix-сокетам (протокол — см. api.model_client).
+Запуск: python -m api.model_server
+MODEL_SERVER_REPLICAS процессов слушают {MODEL_SERVER_SOCKET_DIR}/model-{host}-{i}.sock; каждый процесс —
+отдельная копия модели со своим пулом слотов (LLAMA_N_PARALLEL). Память растёт с числом реплик,
+а не с числом HTTP-воркеров.
+"""
+import asyncio
+import json
+import logging
+import multiprocessing
+import os
+import signal
+import socket
+from typing import Any
+
+from dotenv import load_dotenv
+
+from api.model_client import MESSAGE_LIMIT, encode_message, embed_sync
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+MODEL_SERVER_SOCKET_DIR = os.getenv("MODEL_SERVER_SOCKET_DIR", "/run/lingwo")
+MODEL_SERVER_REPLICAS = int(os.getenv("MODEL_SERVER_REPLICAS", "1"))
+
+
+async def _handle_request(message: dict[str, Any], send) -> None:
+    request_id = message.get("id")
+    op = message.get("op")
+    args = message.get("args") or {}
+    try:
+        if op == "embed":
+            result = await asyncio.to_thread(embed_sync, list(args["texts"]))
+        elif op == "validate_theme":
+            from api.essay_eval import validate_theme_sync
+
+            result = await asyncio.to_thread(validate_theme_sync, args["theme"])
+        elif op == "model_id":
+            from api.essay_eval import model_id
+
+            result = model_id()
+        elif op == "evaluate":
+            from api.essay_eval import evaluate_essay_sync, model_id
+
+            loop = asyncio.get_running_loop()
+
+            def on_progress(event: dict[str, Any]) -> None:
+                loop.call_soon_threadsafe(send, {"id": request_id, "progress": event})
+
+            result = await asyncio.to_thread(
+                evaluate_essay_sync, args["theme"], args["text"], args.get("essay_type", "essay"), on_progress
+            )
+            # Какая модель на самом деле оценила — для ключа кэша результатов у воркера
+            result = {**result, "model_id": model_id()}
+        else:
+            raise ValueError(f"неизвестная операция: {op!r}")
+    except Exception as e:
+        logger.exception("model_server: ошибка операции %s: %s", op, e)
+        send({"id": request_id, "error": repr(e)})
+        return
+    send({"id": request_id, "result": result})
+
+
+async def _handle_connection(reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+    def send(message: dict[str, Any]) -> None:
+        if not writer.is_closing():
+            writer.write(encode_message(message))
+
+    tasks: set[asyncio.Task] = set()
+    try:
+        while True:
+            line = await reader.readline()
+            if not line:
+                break
+            task = asyncio.create_task(_handle_request(json.loads(line), send))
+            tasks.add(task)
+            task.add_done_callback(tasks.discard)
+    except (ConnectionError, ValueError) as e:
+        logger.warning("model_server: соединение прервано: %s", e)
+    finally:
+        for task in tasks:
+            task.cancel()
+        writer.close()
+
+
+async def serve(path: str) -> None:
+    if os.path.exists(path):
+        os.unlink(path)
+    server = await asyncio.start_unix_server(_handle_connection, path=path, limit=MESSAGE_LIMIT)
+    os.chmod(path, 0o660)
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stop.set)
+    logger.info("model_server: слушает %s", path)
+    async with server:
+        await stop.wait()
+    os.unlink(path)
+
+
+def _run_replica(path: str) -> None:
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(name)s: %(message)s")
+    asyncio.run(serve(path))
+
+
+def main() -> None:
+    os.makedirs(MODEL_SERVER_SOCKET_DIR, exist_ok=True)
+    host = socket.gethostname()
+    paths = [os.path.join(MODEL_SERVER_SOCKET_DIR, f"model-{host}-{i}.sock") for i in range(MODEL_SERVER_REPLICAS)]
+    if len(paths) == 1:
+        _run_replica(paths[0])
+        return
+    processes = [multiprocessing.Process(target=_run_replica, args=(p,), name=f"model-server-{i}") for i, p in enumerate(paths)]
+    for process in processes:
+        process.start()
+    signal.signal(signal.SIGTERM, lambda *_: [p.terminate() for p in processes])
+    for process in processes:
+        process.join()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,8 +1,16 @@
-from datetime import datetime
-from sqlalchemy import String, DateTime, Float, JSON, Integer, Text, Boolean
+from datetime import date, datetime
+from sqlalchemy import String, Date, DateTime, Float, Integer, Text, Boolean, Computed
+from sqlalchemy.dialects.postgresql import JSONB, TSVECTOR
 from sqlalchemy.orm import Mapped, mapped_column
 from .db import Base
 
+# Полнотекстовый поиск по сочинениям: тема весит больше текста (см. GET /essays)
+ESSAY_SEARCH_CONFIG = "russian"
+ESSAY_SEARCH_VECTOR_SQL = (
+    f"setweight(to_tsvector('{ESSAY_SEARCH_CONFIG}', coalesce(theme, '')), 'A') || "
+    f"setweight(to_tsvector('{ESSAY_SEARCH_CONFIG}', coalesce(text, '')), 'B')"
+)
+
 
 class UserSettings(Base):
     __tablename__ = "user_settings"
@@ -26,5 +34,46 @@ class Essay(Base):
     total_score: Mapped[float] = mapped_column(Float)  # сырые баллы (сумма по критериям)
     total_score_per: Mapped[float | None] = mapped_column(Float, nullable=True)  # доля от максимума 0–1
     max_score: Mapped[float | None] = mapped_column(Float, nullable=True)
-    criteries: Mapped[dict] = mapped_column(JSON, default=dict)
-    common_mistakes: Mapped[list] = mapped_column(JSON, default=list)
\ No newline at end of file
+    criteries: Mapped[dict] = mapped_column(JSONB, default=dict)
+    common_mistakes: Mapped[list] = mapped_column(JSONB, default=list)
+    # Генерируется Postgres; в ORM-объекты не загружается
+    search_vector = mapped_column(TSVECTOR, Computed(ESSAY_SEARCH_VECTOR_SQL, persisted=True), deferred=True)
+
+
+class EssayDraft(Base):
+    """Черновик активного сочинения — копия состояния из Redis, пишется пачками (api.essay_drafts)."""
+    __tablename__ = "essay_drafts"
+
+    user_id: Mapped[str] = mapped_column(String(64), primary_key=True)
+    essay_type: Mapped[str] = mapped_column(String(16))
+    theme: Mapped[str] = mapped_column(String(512))
+    text: Mapped[str] = mapped_column(Text)
+    started_at: Mapped[datetime] = mapped_column(DateTime(timezone=True))
+    version: Mapped[int] = mapped_column(Integer, default=0)
+    updated_at: Mapped[datetime] = mapped_column(DateTime(timezone=True))
+
+
+class UserProgress(Base):
+    """Агрегаты оценённых сочинений пользователя; обновляются инкрементально (api.user_progress)."""
+    __tablename__ = "user_progress"
+
+    user_id: Mapped[str] = mapped_column(String(64), primary_key=True)
+    scored_count: Mapped[int] = mapped_column(Integer, default=0)
+    count_by_type: Mapped[dict] = mapped_column(JSONB, default=dict)  # {"essay": N, "ege": N}
+    recent: Mapped[list] = mapped_column(JSONB, default=list)  # [[essay_id, ended_at, total_score_per], ...], новые первыми
+    weighted_avg_percent: Mapped[float | None] = mapped_column(Float, nullable=True)
+    criteria: Mapped[dict] = mapped_column(JSONB, default=dict)  # {type: {критерий: [сумма баллов, число]}}
+    updated_at: Mapped[datetime] = mapped_column(DateTime(timezone=True))
+
+
+class UserStatsDaily(Base):
+    """Дневной срез оценённых сочинений пользователя по типу (api.user_stats), день — по UTC."""
+    __tablename__ = "user_stats_daily"
+
+    user_id: Mapped[str] = mapped_column(String(64), primary_key=True)
+    day: Mapped[date] = mapped_column(Date, primary_key=True)
+    essay_type: Mapped[str] = mapped_column(String(16), primary_key=True)
+    essays: Mapped[int] = mapped_column(Integer)
+    score_per_sum: Mapped[float] = mapped_column(Float)  # сумма total_score_per
+    criteria: Mapped[dict] = mapped_column(JSONB, default=dict)  # {критерий: [сумма баллов, число]}
+    mistakes: Mapped[dict] = mapped_column(JSONB, default=dict)  # {тип ошибки: число}
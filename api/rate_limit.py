@@ -1,43 +1,217 @@
 """
-Ограничение запросов к модели (проверка темы, оценка сочинения) на пользователя.
-Скользящее окно 60 секунд, по умолчанию не более 30 запросов в минуту.
+Ограничение запросов к модели на пользователя и общая пропускная способность модели.
+Бюджеты раздельные: проверка темы (theme: /essay/validate_theme, /essay/start) и оценка
+сочинения (grading: /essay/end); у каждого скользящие окна минута/час/сутки (лимит 0 — окно
+отключено). MODEL_CAPACITY_PER_MINUTE — общий лимит запросов к модели от всех пользователей.
+
+Все окна проверяются и засчитываются одним Lua-скриптом за один запрос к Redis: отклонённый
+запрос ничего не записывает, время берётся из Redis (TIME), член ZSET уникален. Перед Redis —
+token bucket в памяти процесса (ёмкость и скорость по самому короткому окну): он отсекает
+очевидный поток запросов без обращения к Redis и никогда не строже окна Redis.
+Если Redis недоступен, запрос пропускается (остаётся только проверка в памяти).
 """
 import logging
+import os
 import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Optional
+from uuid import uuid4
+
 from fastapi import HTTPException
 
 from api.redis_client import redis_client
 
 logger = logging.getLogger(__name__)
 
-# запросов в минуту на одного пользователя
-MODEL_RATE_LIMIT_PER_MINUTE = int(__import__("os").environ.get("MODEL_RATE_LIMIT_PER_MINUTE", "30"))
-RATE_LIMIT_WINDOW_SEC = 60
+# Прежняя настройка: лимит в минуту для обоих бюджетов, если не задан отдельный
+MODEL_RATE_LIMIT_PER_MINUTE = int(os.getenv("MODEL_RATE_LIMIT_PER_MINUTE", "30"))
+THEME_RATE_LIMIT_PER_MINUTE = int(os.getenv("THEME_RATE_LIMIT_PER_MINUTE", str(MODEL_RATE_LIMIT_PER_MINUTE)))
+THEME_RATE_LIMIT_PER_HOUR = int(os.getenv("THEME_RATE_LIMIT_PER_HOUR", "300"))
+THEME_RATE_LIMIT_PER_DAY = int(os.getenv("THEME_RATE_LIMIT_PER_DAY", "1500"))
+GRADING_RATE_LIMIT_PER_MINUTE = int(os.getenv("GRADING_RATE_LIMIT_PER_MINUTE", str(MODEL_RATE_LIMIT_PER_MINUTE)))
+GRADING_RATE_LIMIT_PER_HOUR = int(os.getenv("GRADING_RATE_LIMIT_PER_HOUR", "60"))
+GRADING_RATE_LIMIT_PER_DAY = int(os.getenv("GRADING_RATE_LIMIT_PER_DAY", "200"))
+# Запросов к модели в минуту от всех пользователей (0 — без ограничения)
+MODEL_CAPACITY_PER_MINUTE = int(os.getenv("MODEL_CAPACITY_PER_MINUTE", "0"))
+# Пользователей, для которых процесс держит token bucket (давно не приходившие вытесняются)
+RATE_LIMIT_LOCAL_BUCKETS = int(os.getenv("RATE_LIMIT_LOCAL_BUCKETS", "10000"))
 REDIS_KEY_PREFIX = "ratelimit:model:"
+CAPACITY_KEY = f"{REDIS_KEY_PREFIX}capacity"
+
+
+@dataclass(frozen=True)
+class RateWindow:
+    seconds: int
+    limit: int
+    label: str
+
+
+def _windows(*windows: RateWindow) -> tuple[RateWindow, ...]:
+    return tuple(window for window in windows if window.limit > 0)
+
+
+BUDGETS: dict[str, tuple[RateWindow, ...]] = {
+    "theme": _windows(
+        RateWindow(60, THEME_RATE_LIMIT_PER_MINUTE, "в минуту"),
+        RateWindow(3600, THEME_RATE_LIMIT_PER_HOUR, "в час"),
+        RateWindow(86400, THEME_RATE_LIMIT_PER_DAY, "в сутки"),
+    ),
+    "grading": _windows(
+        RateWindow(60, GRADING_RATE_LIMIT_PER_MINUTE, "в минуту"),
+        RateWindow(3600, GRADING_RATE_LIMIT_PER_HOUR, "в час"),
+        RateWindow(86400, GRADING_RATE_LIMIT_PER_DAY, "в сутки"),
+    ),
+}
+CAPACITY_WINDOWS = _windows(RateWindow(60, MODEL_CAPACITY_PER_MINUTE, "в минуту"))
+BUDGET_NAMES = {"theme": "проверке темы", "grading": "оценке сочинений"}
+
+# KEYS — ZSET окон; ARGV[1] — уникальный член, дальше тройки: номер ключа, окно (мс), лимит.
+# Ответ: {1, 0, 0} — разрешено и засчитано во всех ключах; {0, номер тройки, мс до освобождения}.
+_HIT_LUA = """
+local t = redis.call('TIME')
+local now = tonumber(t[1]) * 1000 + math.floor(tonumber(t[2]) / 1000)
+local member = ARGV[1]
+local horizon = {}
+for i = 2, #ARGV, 3 do
+    local k = tonumber(ARGV[i])
+    local window = tonumber(ARGV[i + 1])
+    if (horizon[k] or 0) < window then
+        horizon[k] = window
+    end
+end
+for k, window in pairs(horizon) do
+    redis.call('ZREMRANGEBYSCORE', KEYS[k], '-inf', now - window)
+end
+for i = 2, #ARGV, 3 do
+    local key = KEYS[tonumber(ARGV[i])]
+    local window = tonumber(ARGV[i + 1])
+    local limit = tonumber(ARGV[i + 2])
+    local from = '(' .. (now - window)
+    local count = redis.call('ZCOUNT', key, from, '+inf')
+    if count >= limit then
+        -- Запрос пройдёт, когда из окна выйдет (count - limit + 1)-й по старшинству
+        local oldest = redis.call('ZRANGEBYSCORE', key, from, '+inf', 'WITHSCORES', 'LIMIT', count - limit, 1)
+        local retry = window
+        if oldest[2] then
+            retry = tonumber(oldest[2]) + window - now
+        end
+        return {0, (i - 2) / 3 + 1, retry}
+    end
+end
+for k, window in pairs(horizon) do
+    redis.call('ZADD', KEYS[k], now, member)
+    redis.call('PEXPIRE', KEYS[k], window)
+end
+return {1, 0, 0}
+"""
+
+_hit_script = redis_client.register_script(_HIT_LUA)
+
+
+class LocalBuckets:
+    """
+    Token bucket на ключ в памяти процесса: ёмкость limit, пополнение limit/seconds в секунду.
+    За любые seconds секунд пропускает не меньше, чем скользящее окно того же лимита,
+    поэтому отказ здесь означает отказ и в Redis.
+    """
+
+    def __init__(self, max_size: int):
+        self.max_size = max_size
+        self._items: "OrderedDict[str, list[float]]" = OrderedDict()
+
+    def take(self, key: str, window: RateWindow) -> float:
+        """Забирает токен; 0 — успешно, иначе через сколько секунд появится токен."""
+        now = time.monotonic()
+        rate = window.limit / window.seconds
+        bucket = self._items.get(key)
+        if bucket is None:
+            bucket = [float(window.limit), now]
+            self._items[key] = bucket
+            while len(self._items) > self.max_size:
+                self._items.popitem(last=False)
+        else:
+            bucket[0] = min(float(window.limit), bucket[0] + (now - bucket[1]) * rate)
+            bucket[1] = now
+            self._items.move_to_end(key)
+        if bucket[0] < 1.0:
+            return (1.0 - bucket[0]) / rate
+        bucket[0] -= 1.0
+        return 0.0
+
+    def refund(self, key: str) -> None:
+        """Возвращает токен, если запрос отклонил Redis (в окне он не засчитан)."""
+        bucket = self._items.get(key)
+        if bucket is not None:
+            bucket[0] += 1.0
+
+    def clear(self) -> None:
+        self._items.clear()
+
 
+local_buckets = LocalBuckets(RATE_LIMIT_LOCAL_BUCKETS)
 
-async def check_model_rate_limit(user_id: str) -> None:
+
+def _rejected(budget: Optional[str], window: RateWindow, retry_sec: float) -> HTTPException:
+    headers = {"Retry-After": str(max(1, int(retry_sec + 0.999)))}
+    if budget is None:
+        return HTTPException(
+            status_code=503,
+            detail="Модель перегружена запросами. Попробуйте позже.",
+            headers=headers,
+        )
+    return HTTPException(
+        status_code=429,
+        detail=(
+            f"Превышен лимит запросов к {BUDGET_NAMES[budget]}: "
+            f"не более {window.limit} {window.label}. Попробуйте позже."
+        ),
+        headers=headers,
+    )
+
+
+async def check_model_rate_limit(user_id: str, budget: str) -> None:
     """
-    Увеличивает счётчик запросов к модели для user_id и при превышении лимита
-    выбрасывает HTTPException 429. Использует скользящее окно в Redis (sorted set).
+    Засчитывает запрос к модели пользователя user_id в бюджет budget ("theme" или "grading")
+    и в общую пропускную способность. При превышении — HTTPException 429 (лимит пользователя)
+    или 503 (модель перегружена) с Retry-After.
     """
-    key = f"{REDIS_KEY_PREFIX}{user_id}"
-    now = time.time()
-    window_start = now - RATE_LIMIT_WINDOW_SEC
-    member = f"{now}"
-
-    pipe = redis_client.pipeline()
-    pipe.zadd(key, {member: now})
-    pipe.zremrangebyscore(key, 0, window_start)
-    pipe.zcard(key)
-    pipe.expire(key, RATE_LIMIT_WINDOW_SEC + 1)
-    results = await pipe.execute()
-    count = results[2] or 0
-
-    if count > MODEL_RATE_LIMIT_PER_MINUTE:
-        await redis_client.zrem(key, member)
-        logger.warning("model rate limit exceeded for user_id=%s (count=%s)", user_id, count)
-        raise HTTPException(
-            status_code=429,
-            detail=f"Превышен лимит запросов к проверке темы и оценке сочинений: не более {MODEL_RATE_LIMIT_PER_MINUTE} в минуту. Попробуйте позже.",
+    # (ключ, окна, бюджет для сообщения; None — общая пропускная способность)
+    scopes = [(f"{REDIS_KEY_PREFIX}{budget}:{user_id}", BUDGETS[budget], budget)]
+    if CAPACITY_WINDOWS:
+        scopes.append((CAPACITY_KEY, CAPACITY_WINDOWS, None))
+    scopes = [scope for scope in scopes if scope[1]]
+    if not scopes:
+        return
+
+    taken: list[str] = []
+    for key, windows, scope_budget in scopes:
+        retry = local_buckets.take(key, windows[0])
+        if retry:
+            for taken_key in taken:
+                local_buckets.refund(taken_key)
+            raise _rejected(scope_budget, windows[0], retry)
+        taken.append(key)
+
+    keys: list[str] = []
+    args: list = [f"{time.time_ns()}-{uuid4().hex}"]
+    checks: list[tuple[Optional[str], RateWindow]] = []
+    for key, windows, scope_budget in scopes:
+        keys.append(key)
+        for window in windows:
+            args += [len(keys), window.seconds * 1000, window.limit]
+            checks.append((scope_budget, window))
+    try:
+        allowed, index, retry_ms = await _hit_script(keys=keys, args=args)
+    except Exception as e:
+        logger.warning("rate_limit: Redis недоступен, запрос %s пропущен без проверки окон: %s", budget, e)
+        return
+    if not allowed:
+        for key in taken:
+            local_buckets.refund(key)
+        scope_budget, window = checks[index - 1]
+        logger.warning(
+            "model rate limit exceeded for user_id=%s (budget=%s, limit=%s %s)",
+            user_id, scope_budget or "capacity", window.limit, window.label,
         )
+        raise _rejected(scope_budget, window, retry_ms / 1000)
@@ -1,4 +1,4 @@
-from datetime import datetime
+from datetime import date, datetime
 from typing import Any, Dict, Literal, Optional
 from pydantic import BaseModel, Field
 
@@ -35,6 +35,30 @@ class RecommendedTopicResponse(BaseModel):
     target_percent: int = Field(..., description="Целевой процент из настроек")
 
 
+class StatsPeriod(BaseModel):
+    period_start: date
+    essays: int
+    avg_score_percent: float = Field(..., description="Средний процент за период (0–100)")
+
+
+class StatsCriterion(BaseModel):
+    type: str = Field(..., description="essay / ege")
+    key: str
+    mean: float = Field(..., description="Средний балл по критерию")
+    max_score: int
+    mean_percent: Optional[float] = Field(None, description="Средний балл в процентах от максимума")
+    essays: int
+
+
+class StatsResponse(BaseModel):
+    bucket: Literal["day", "week", "month"]
+    total_essays: int
+    timeline: list[StatsPeriod]
+    criteria: list[StatsCriterion]
+    weakest_criterion: Optional[StatsCriterion] = None
+    mistakes: Dict[str, int] = Field(default_factory=dict, description="Число ошибок по типам")
+
+
 class EssayStartRequest(BaseModel):
     theme: str = Field(..., min_length=1, max_length=512)
     type: Literal["ege", "essay"]
@@ -43,11 +67,30 @@ class EssayStartRequest(BaseModel):
 
 class EssaySaveRequest(BaseModel):
     text: str = Field(..., min_length=1)
+    version: Optional[int] = Field(None, ge=0, description="Версия, которую видел клиент; при несовпадении — 409")
+
+
+class EssayTextOp(BaseModel):
+    """Правка текста: удалить delete символов начиная с offset и вставить insert (в кодовых точках Unicode)."""
+    offset: int = Field(..., ge=0)
+    delete: int = Field(0, ge=0)
+    insert: str = ""
+
+
+class EssayPatchRequest(BaseModel):
+    """Автосохранение правками; операции применяются по порядку к тексту версии version."""
+    version: int = Field(..., ge=0)
+    ops: list[EssayTextOp] = Field(..., min_length=1, max_length=100)
+
+
+class EssayPatchResponse(BaseModel):
+    version: int
 
 
 class EssayEndRequest(BaseModel):
     """Текст сочинения. criteries заполняются на бэкенде после оценки."""
     text: str = Field(..., min_length=1)
+    fresh: bool = Field(False, description="Оценить заново, не используя кэш результатов")
 
 
 class EssayListItem(BaseModel):
@@ -84,6 +127,7 @@ class EssayState(BaseModel):
     theme: str
     text: str
     started_at: datetime
+    version: int = 0  # растёт с каждым сохранением; передаётся в /essay/save и /essay/patch
 
 
 class EssayEndResponse(BaseModel):
@@ -0,0 +1,24 @@
+"""
+Тесты API без внешних сервисов: Redis — fakeredis с Lua (как в api.bench --redis fake).
+Запуск из корня репозитория:
+    pip install -r api/requirements.txt -r api/requirements-dev.txt
+    python -m pytest api/tests
+Клиент подменяется до импорта модулей api, чтобы Lua-скрипты регистрировались на нём.
+"""
+import asyncio
+
+import fakeredis
+import pytest
+
+import api.redis_client
+
+api.redis_client.redis_client = fakeredis.FakeAsyncRedis(decode_responses=True)
+
+
+@pytest.fixture
+def redis():
+    """Пустой fakeredis на время теста."""
+    client = api.redis_client.redis_client
+    asyncio.run(client.flushall())
+    yield client
+    asyncio.run(client.flushall())
@@ -0,0 +1,55 @@
+from datetime import datetime, timedelta, timezone
+
+import pytest
+from fastapi import HTTPException
+
+from api.main import _ESSAY_CURSOR_KEYS, _decode_cursor, _encode_cursor
+
+ENDED_AT = datetime(2026, 3, 1, 12, 30, 15, 123456, tzinfo=timezone(timedelta(hours=3)))
+
+CURSORS = {
+    "date": [ENDED_AT, 42],
+    "score": [17.5, ENDED_AT, 42],
+    "theme": ["Тема «с кавычками» и 😀", ENDED_AT, 42],
+    "relevance": [0.10000000149011612, 42],
+}
+
+
+def test_every_order_has_a_case():
+    assert set(CURSORS) == set(_ESSAY_CURSOR_KEYS)
+
+
+@pytest.mark.parametrize("order", sorted(CURSORS))
+def test_cursor_round_trip(order):
+    values = CURSORS[order]
+    cursor = _encode_cursor(order, values)
+    # Курсор уходит в заголовок: только URL-безопасные ASCII-символы без дополнения
+    assert cursor.isascii() and "=" not in cursor and "+" not in cursor and "/" not in cursor
+    decoded = _decode_cursor(cursor, order)
+    assert decoded == values
+    for original, restored in zip(values, decoded):
+        assert type(original) is type(restored)
+
+
+@pytest.mark.parametrize("order", sorted(CURSORS))
+def test_cursor_of_another_order_is_rejected(order):
+    other = next(o for o in sorted(CURSORS) if o != order)
+    with pytest.raises(HTTPException) as error:
+        _decode_cursor(_encode_cursor(other, CURSORS[other]), order)
+    assert error.value.status_code == 400
+
+
+@pytest.mark.parametrize(
+    "cursor",
+    [
+        "not-a-cursor",
+        "",
+        _encode_cursor("date", [ENDED_AT]),
+        _encode_cursor("date", ["вчера", 1]),
+        _encode_cursor("date", {"ended_at": 1}),
+    ],
+)
+def test_malformed_cursor_is_rejected(cursor):
+    with pytest.raises(HTTPException) as error:
+        _decode_cursor(cursor, "date")
+    assert error.value.status_code == 400
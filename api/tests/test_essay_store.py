@@ -0,0 +1,99 @@
+import asyncio
+from datetime import datetime, timezone
+
+import pytest
+from fastapi import HTTPException
+
+from api import essay_store
+from api.schemas import EssayState, EssayTextOp
+
+USER = "store-user"
+
+
+def _start(text: str) -> EssayState:
+    state = EssayState(
+        user_id=USER,
+        type="essay",
+        theme="Тема",
+        text=text,
+        started_at=datetime(2026, 1, 1, tzinfo=timezone.utc),
+        version=0,
+    )
+
+    async def create():
+        # Черновика в БД нет — создание идёт одним скриптом, без Postgres
+        await essay_store.mark_no_draft(USER)
+        assert await essay_store.create_active_essay(state)
+
+    asyncio.run(create())
+    return state
+
+
+def _patch(version: int, *ops: tuple[int, int, str]) -> int:
+    return asyncio.run(
+        essay_store.patch_active_text(
+            USER, version, [EssayTextOp(offset=offset, delete=delete, insert=insert) for offset, delete, insert in ops]
+        )
+    )
+
+
+def _text() -> str:
+    return asyncio.run(essay_store.get_active_essay(USER)).text
+
+
+@pytest.mark.parametrize(
+    "text, ops, expected",
+    [
+        ("Привет, мир", [(8, 3, "свет")], "Привет, свет"),
+        ("ёжик", [(0, 1, "Ё")], "Ёжик"),
+        # Эмодзи — одна кодовая точка, 4 байта UTF-8
+        ("a😀b", [(1, 1, "🙂"), (3, 0, "!")], "a🙂b!"),
+        ("中文字", [(1, 1, "")], "中字"),
+        ("конец", [(5, 0, " текста")], "конец текста"),
+        # Правки применяются по порядку: вторая видит результат первой
+        ("абв", [(0, 0, "я"), (1, 1, "Б")], "яБбв"),
+    ],
+)
+def test_patch_offsets_are_code_points(redis, text, ops, expected):
+    _start(text)
+    assert _patch(0, *ops) == 1
+    assert _text() == expected
+
+
+def test_patch_past_end_is_rejected_without_change(redis):
+    _start("ёж")
+    with pytest.raises(HTTPException) as error:
+        _patch(0, (1, 5, "x"))
+    assert error.value.status_code == 422
+    with pytest.raises(HTTPException) as error:
+        _patch(0, (3, 0, "x"))
+    assert error.value.status_code == 422
+    assert _text() == "ёж"
+    assert asyncio.run(essay_store.get_active_essay(USER)).version == 0
+
+
+def test_version_guard(redis):
+    _start("текст")
+    assert _patch(0, (0, 0, "мой ")) == 1
+    with pytest.raises(HTTPException) as error:
+        _patch(0, (0, 0, "старая вкладка "))
+    assert error.value.status_code == 409
+    assert error.value.detail["version"] == 1
+
+    with pytest.raises(HTTPException) as error:
+        asyncio.run(essay_store.save_active_text(USER, "целиком", version=0))
+    assert error.value.status_code == 409
+    state = asyncio.run(essay_store.save_active_text(USER, "целиком", version=1))
+    assert (state.text, state.version) == ("целиком", 2)
+    assert _text() == "целиком"
+
+
+def test_claim_then_release_and_second_claim(redis):
+    _start("текст")
+    claimed = asyncio.run(essay_store.claim_active_essay(USER))
+    assert claimed.text == "текст"
+    with pytest.raises(HTTPException) as error:
+        asyncio.run(essay_store.claim_active_essay(USER))
+    assert error.value.status_code == 409
+    asyncio.run(essay_store.release_claimed_essay(USER))
+    assert _text() == "текст"
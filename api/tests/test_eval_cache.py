@@ -0,0 +1,27 @@
+import asyncio
+
+from fastapi.testclient import TestClient
+
+from api import eval_cache
+
+
+def test_stats_count_hits_misses_and_bypass(redis):
+    async def scenario():
+        assert await eval_cache.get_cached_evaluation("fp") is None
+        await eval_cache.set_cached_evaluation("fp", {"total_score": 3})
+        assert await eval_cache.get_cached_evaluation("fp") == {"total_score": 3}
+        assert await eval_cache.get_cached_evaluation("fp") == {"total_score": 3}
+        await eval_cache.count_bypass()
+        return await eval_cache.get_cache_stats()
+
+    stats = asyncio.run(scenario())
+    assert stats == {"hit": 2, "miss": 1, "bypass": 1, "hit_rate": 0.6667, "enabled": True}
+
+
+def test_stats_endpoint(redis):
+    from api.main import APP
+
+    asyncio.run(redis.hset(eval_cache.EVAL_CACHE_STATS_KEY, mapping={"hit": 3, "miss": 1}))
+    response = TestClient(APP).get("/health/eval_cache")
+    assert response.status_code == 200
+    assert response.json()["hit_rate"] == 0.75
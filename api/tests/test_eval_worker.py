@@ -0,0 +1,58 @@
+import asyncio
+import time
+
+from api import eval_queue, eval_worker
+
+
+def test_retry_deadline_survives_an_in_flight_heartbeat(redis, monkeypatch):
+    monkeypatch.setattr(eval_worker, "EVAL_VISIBILITY_TIMEOUT_SEC", 0.03)
+
+    async def slow_extend(job_id):
+        # Команда уже ушла в Redis: отмена ожидающей корутины её не отменит
+        async def sent():
+            await asyncio.sleep(0.05)
+            await eval_queue.extend_visibility(job_id)
+
+        await asyncio.shield(sent())
+
+    async def failing_evaluation(essay_id, fresh=False):
+        await asyncio.sleep(0.015)
+        raise RuntimeError("model failed")
+
+    monkeypatch.setattr(eval_worker, "extend_visibility", slow_extend)
+    monkeypatch.setattr(eval_worker, "_evaluate_essay_task", failing_evaluation)
+
+    async def scenario():
+        await eval_queue.enqueue_evaluation(1)
+        job = await eval_queue.reserve_job()
+        slots = asyncio.Semaphore(0)
+        await eval_worker._run_job(job, slots)
+        await asyncio.sleep(0.1)
+        return job["id"], await redis.zscore(eval_queue.EVAL_PROCESSING_KEY, job["id"])
+
+    job_id, deadline = asyncio.run(scenario())
+    retry_at = time.time() + eval_queue.EVAL_RETRY_BACKOFF_SEC
+    assert abs(deadline - retry_at) < 1
+    assert asyncio.run(redis.hget(eval_queue.EVAL_JOBS_KEY, job_id))
+
+
+def test_heartbeat_stops_after_success(redis, monkeypatch):
+    calls = []
+
+    async def evaluation(essay_id, fresh=False):
+        calls.append("evaluated")
+
+    async def ack(job_id):
+        calls.append("ack")
+
+    monkeypatch.setattr(eval_worker, "_evaluate_essay_task", evaluation)
+    monkeypatch.setattr(eval_worker, "ack_job", ack)
+
+    async def scenario():
+        slots = asyncio.Semaphore(0)
+        await eval_worker._run_job({"id": "j", "essay_id": 1}, slots)
+        assert not [t for t in asyncio.all_tasks() if t is not asyncio.current_task()]
+        return slots.locked()
+
+    assert asyncio.run(scenario()) is False
+    assert calls == ["evaluated", "ack"]
@@ -0,0 +1,42 @@
+import pytest
+
+from api.essay_eval import InferenceBackend, LlamaCppBackend, StubBackend
+
+
+def test_backend_missing_a_method_fails_on_creation():
+    class NoComplete(InferenceBackend):
+        def model_id(self):
+            return "m"
+
+        def create_slot(self):
+            return None
+
+    with pytest.raises(TypeError, match="complete"):
+        NoComplete()
+
+
+def test_shipped_backends_are_complete():
+    StubBackend()
+    LlamaCppBackend()
+
+
+def test_llama_slots_default_to_one_on_gpu(monkeypatch):
+    from api import essay_eval
+
+    monkeypatch.setattr(essay_eval, "LLAMA_N_PARALLEL", 4)
+    monkeypatch.setattr(essay_eval, "_gpu_offload", lambda: True)
+    assert LlamaCppBackend().n_slots() == 1
+
+
+def test_llama_slots_capped_by_memory_on_cpu(monkeypatch):
+    from api import essay_eval
+
+    monkeypatch.setattr(essay_eval, "LLAMA_N_PARALLEL", 4)
+    monkeypatch.setattr(essay_eval, "LLAMA_SLOT_MEMORY_MB", 1000)
+    monkeypatch.setattr(essay_eval, "_gpu_offload", lambda: False)
+    monkeypatch.setattr(essay_eval, "_available_memory_mb", lambda: 2500)
+    assert LlamaCppBackend().n_slots() == 2
+    monkeypatch.setattr(essay_eval, "_available_memory_mb", lambda: 100)
+    assert LlamaCppBackend().n_slots() == 1
+    monkeypatch.setattr(essay_eval, "_available_memory_mb", lambda: 64000)
+    assert LlamaCppBackend().n_slots() == 4
@@ -0,0 +1,53 @@
+import asyncio
+
+import httpx
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives.asymmetric import rsa
+from jose import jwk
+
+from api import jwt_auth
+
+
+def _public_jwk(kid: str) -> dict:
+    key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+    pem = key.public_key().public_bytes(serialization.Encoding.PEM, serialization.PublicFormat.SubjectPublicKeyInfo)
+    return {**jwk.construct(pem.decode(), algorithm="RS256").to_dict(), "kid": kid}
+
+
+def test_refresher_rotates_keys_without_requests(monkeypatch):
+    documents = [{"keys": [_public_jwk("old")]}, {"keys": [_public_jwk("new")]}]
+    served = []
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        document = documents[min(len(served), len(documents) - 1)]
+        served.append(document)
+        return httpx.Response(200, json=document)
+
+    real_client = httpx.AsyncClient
+    monkeypatch.setattr(
+        jwt_auth.httpx, "AsyncClient", lambda **kwargs: real_client(transport=httpx.MockTransport(handler), **kwargs)
+    )
+    monkeypatch.setattr(jwt_auth, "JWKS_REFRESH_SEC", 0.05)
+    manager = jwt_auth.JwksKeyManager("http://auth.test/jwks", jwt_auth.verifier)
+    monkeypatch.setattr(jwt_auth, "key_manager", manager)
+    # Свой кэш на время теста: общий jwt_auth.claims_cache не засоряется
+    cache = jwt_auth.ClaimsCache(16)
+    monkeypatch.setattr(jwt_auth, "claims_cache", cache)
+    cache.put("token", jwt_auth.Claims(
+        exp=2**31, iat=0, jti="j", user_id="1", role=2, email="u@example.com", username="u",
+    ))
+
+    async def scenario():
+        stop = asyncio.Event()
+        task = asyncio.create_task(jwt_auth.run_jwks_refresher(stop))
+        for _ in range(100):
+            if set(manager._keys) == {"new"}:
+                break
+            await asyncio.sleep(0.02)
+        stop.set()
+        await asyncio.wait_for(task, 5)
+
+    asyncio.run(scenario())
+    assert set(manager._keys) == {"new"}
+    # Ключ убран из JWKS — токены, проверенные им, больше не берутся из кэша
+    assert cache.get("token") is None
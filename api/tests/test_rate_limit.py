@@ -0,0 +1,111 @@
+import asyncio
+
+import pytest
+from fastapi import HTTPException
+
+from api import rate_limit
+from api.rate_limit import RateWindow
+
+USER = "limit-user"
+THEME_KEY = f"{rate_limit.REDIS_KEY_PREFIX}theme:{USER}"
+
+
+@pytest.fixture
+def limits(monkeypatch, redis):
+    """Небольшие лимиты: 3 в минуту и 5 в час на тему, без общей пропускной способности."""
+    monkeypatch.setitem(rate_limit.BUDGETS, "theme", (RateWindow(60, 3, "в минуту"), RateWindow(3600, 5, "в час")))
+    monkeypatch.setattr(rate_limit, "CAPACITY_WINDOWS", ())
+    rate_limit.local_buckets.clear()
+    calls = []
+    script = rate_limit._hit_script
+
+    async def counting_script(**kwargs):
+        calls.append(kwargs)
+        return await script(**kwargs)
+
+    monkeypatch.setattr(rate_limit, "_hit_script", counting_script)
+    yield calls
+    rate_limit.local_buckets.clear()
+
+
+def _hit(user_id: str = USER, budget: str = "theme") -> int:
+    try:
+        asyncio.run(rate_limit.check_model_rate_limit(user_id, budget))
+    except HTTPException as e:
+        assert int(e.headers["Retry-After"]) >= 1
+        return e.status_code
+    return 200
+
+
+def _age_entries(redis, key: str, seconds: int) -> None:
+    """Сдвигает все записи окна в прошлое, как будто запросы были seconds секунд назад."""
+    async def shift():
+        entries = await redis.zrange(key, 0, -1, withscores=True)
+        await redis.zadd(key, {member: score - seconds * 1000 for member, score in entries})
+
+    asyncio.run(shift())
+
+
+def test_rejected_request_is_not_recorded(redis, limits):
+    assert [_hit() for _ in range(3)] == [200, 200, 200]
+    # Без локального ведра (другой процесс API) решение принимает Redis
+    rate_limit.local_buckets.clear()
+    assert _hit() == 429
+    assert _hit() == 429
+    assert asyncio.run(redis.zcard(THEME_KEY)) == 3
+    members = asyncio.run(redis.zrange(THEME_KEY, 0, -1))
+    assert len(set(members)) == 3
+
+
+def test_local_bucket_rejects_flood_without_redis(redis, limits):
+    assert [_hit() for _ in range(3)] == [200, 200, 200]
+    assert len(limits) == 3
+    assert [_hit() for _ in range(10)] == [429] * 10
+    assert len(limits) == 3
+
+
+def test_redis_rejection_refunds_local_token(redis, limits):
+    # Часовое окно почти исчерпано другими процессами: 4 записи двухминутной давности
+    two_minutes_ago_ms = (asyncio.run(redis.time())[0] - 120) * 1000
+    asyncio.run(redis.zadd(THEME_KEY, {f"old-{i}": two_minutes_ago_ms for i in range(4)}))
+    assert _hit() == 200
+    assert _hit() == 429
+    # Отказ Redis вернул токен: в ведре снова 2 из 3, следующий запрос снова идёт в Redis
+    bucket = rate_limit.local_buckets._items[THEME_KEY]
+    assert bucket[0] == pytest.approx(2.0, abs=0.01)
+    assert _hit() == 429
+    assert len(limits) == 3
+
+
+def test_hour_window_applies_after_minute_window_frees(redis, limits):
+    assert [_hit() for _ in range(3)] == [200, 200, 200]
+    _age_entries(redis, THEME_KEY, 120)
+    rate_limit.local_buckets.clear()
+    assert [_hit() for _ in range(3)] == [200, 200, 429]
+    assert asyncio.run(redis.zcard(THEME_KEY)) == 5
+
+
+def test_capacity_rejection_refunds_user_token(redis, limits, monkeypatch):
+    monkeypatch.setattr(rate_limit, "CAPACITY_WINDOWS", (RateWindow(60, 4, "в минуту"),))
+    assert [_hit(f"user-{i}") for i in range(4)] == [200] * 4
+    assert _hit("user-9") == 503
+    # Пользователь не потратил свой токен на отказ из-за общей перегрузки
+    bucket = rate_limit.local_buckets._items[f"{rate_limit.REDIS_KEY_PREFIX}theme:user-9"]
+    assert bucket[0] == pytest.approx(3.0, abs=0.01)
+    # Во всех окнах записано ровно по одному запросу на пользователя
+    assert asyncio.run(redis.zcard(rate_limit.CAPACITY_KEY)) == 4
+
+
+def test_budgets_are_separate(redis, limits, monkeypatch):
+    monkeypatch.setitem(rate_limit.BUDGETS, "grading", (RateWindow(60, 1, "в минуту"),))
+    assert _hit(budget="grading") == 200
+    assert _hit(budget="grading") == 429
+    assert [_hit() for _ in range(3)] == [200, 200, 200]
+
+
+def test_redis_failure_lets_request_through(redis, limits, monkeypatch):
+    async def broken(**kwargs):
+        raise ConnectionError("Redis недоступен")
+
+    monkeypatch.setattr(rate_limit, "_hit_script", broken)
+    assert _hit() == 200
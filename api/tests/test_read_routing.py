@@ -0,0 +1,109 @@
+import asyncio
+
+import pytest
+from fastapi.testclient import TestClient
+
+from api import db
+from api.jwt_auth import Claims
+
+
+class FakeSession:
+    """Сессия без БД: запоминает, из какой фабрики (primary или replica) она взята."""
+
+    def __init__(self, name, log):
+        self.name = name
+        self.log = log
+
+    async def __aenter__(self):
+        self.log.append(self.name)
+        return self
+
+    async def __aexit__(self, *exc):
+        return False
+
+    async def execute(self, statement):
+        return self
+
+    def scalar_one_or_none(self):
+        return None
+
+    def add(self, row):
+        pass
+
+    async def commit(self):
+        pass
+
+    async def refresh(self, row):
+        pass
+
+
+@pytest.fixture
+def sessions(monkeypatch, redis):
+    """Основная БД и реплика подменяются фабриками FakeSession; возвращает журнал выдачи сессий."""
+    log = []
+    monkeypatch.setattr(db, "DATABASE_READ_URL", "postgresql+asyncpg://replica/lingwo")
+    monkeypatch.setattr(db, "AsyncSessionLocal", lambda: FakeSession("primary", log))
+    monkeypatch.setattr(db, "AsyncReadSessionLocal", lambda: FakeSession("replica", log))
+    return log
+
+
+def _read(user_id):
+    async def scenario():
+        async with db.read_session(user_id) as session:
+            return session.name
+
+    return asyncio.run(scenario())
+
+
+def test_reads_go_to_replica_without_recent_writes(sessions):
+    assert _read("u1") == "replica"
+    assert _read(None) == "replica"
+
+
+def test_write_pins_only_that_user_to_primary(sessions, redis):
+    asyncio.run(db.pin_to_primary("u1"))
+    assert _read("u1") == "primary"
+    assert _read("u2") == "replica"
+    ttl = asyncio.run(redis.ttl(db._primary_pin_key("u1")))
+    assert 0 < ttl <= db.DB_READ_YOUR_WRITES_SEC == 10
+
+
+def test_pin_expiry_returns_reads_to_replica(sessions, redis):
+    asyncio.run(db.pin_to_primary("u1"))
+    # Истечение DB_READ_YOUR_WRITES_SEC
+    asyncio.run(redis.delete(db._primary_pin_key("u1")))
+    assert _read("u1") == "replica"
+
+
+def test_without_replica_nothing_is_pinned(monkeypatch, redis):
+    monkeypatch.setattr(db, "DATABASE_READ_URL", None)
+    asyncio.run(db.pin_to_primary("u1"))
+    assert asyncio.run(redis.exists(db._primary_pin_key("u1"))) == 0
+
+
+def test_redis_failure_reads_from_primary(sessions, monkeypatch):
+    class BrokenRedis:
+        async def exists(self, key):
+            raise ConnectionError("redis down")
+
+    monkeypatch.setattr(db, "redis_client", BrokenRedis())
+    assert _read("u1") == "primary"
+
+
+def test_settings_read_after_write_uses_primary(sessions):
+    from api.main import APP, get_current_user
+
+    user = {"id": "u1"}
+    APP.dependency_overrides[get_current_user] = lambda: Claims(
+        exp=0, iat=0, jti="j", user_id=user["id"], role=1, email="", username="", token="t"
+    )
+    try:
+        client = TestClient(APP)
+        assert client.get("/settings").status_code == 200
+        assert client.patch("/settings", json={"auto_save_enabled": False}).status_code == 200
+        assert client.get("/settings").status_code == 200
+        user["id"] = "u2"
+        assert client.get("/settings").status_code == 200
+    finally:
+        APP.dependency_overrides.pop(get_current_user, None)
+    assert sessions == ["replica", "primary", "primary", "replica"]
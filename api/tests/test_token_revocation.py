@@ -0,0 +1,74 @@
+import asyncio
+import json
+import time
+
+from api.jwt_auth import Claims
+from api.token_revocation import (
+    REVOCATIONS_CHANNEL,
+    REVOKED_JTIS_KEY,
+    REVOKED_USERS_KEY,
+    RevocationMirror,
+    revocations,
+    run_revocation_listener,
+)
+
+
+def _claims(user_id: str = "1", iat: int | None = None, jti: str = "jti-1") -> Claims:
+    now = int(time.time())
+    iat = now if iat is None else iat
+    return Claims(exp=iat + 600, iat=iat, jti=jti, user_id=user_id, role=2, email="u@example.com", username="u")
+
+
+def test_user_cutoff_rejects_only_tokens_issued_before_it():
+    mirror = RevocationMirror()
+    cutoff = 1_700_000_000
+    mirror.apply({"type": "user", "user_id": 7, "cutoff": cutoff})
+    assert mirror.is_revoked(_claims("7", iat=cutoff - 1))
+    # Вход в ту же секунду, что и «выйти везде», не получает 401
+    assert not mirror.is_revoked(_claims("7", iat=cutoff))
+    assert not mirror.is_revoked(_claims("8", iat=cutoff - 1))
+
+
+def test_older_cutoff_message_does_not_move_cutoff_back():
+    mirror = RevocationMirror()
+    mirror.apply({"type": "user", "user_id": "7", "cutoff": 200})
+    mirror.apply({"type": "user", "user_id": "7", "cutoff": 100})
+    assert mirror.cutoffs["7"] == 200
+
+
+def test_revoked_jti_and_prune():
+    mirror = RevocationMirror()
+    mirror.apply({"type": "jti", "jti": "gone", "exp": time.time() + 60})
+    mirror.apply({"type": "jti", "jti": "expired", "exp": time.time() - 1})
+    assert mirror.is_revoked(_claims(jti="gone"))
+    assert not mirror.is_revoked(_claims(jti="other"))
+    mirror.prune()
+    assert set(mirror.jtis) == {"gone"}
+
+
+def test_listener_loads_snapshot_and_follows_channel(redis):
+    async def scenario():
+        now = int(time.time())
+        await redis.zadd(REVOKED_JTIS_KEY, {"snap": now + 60, "old": now - 60})
+        await redis.zadd(REVOKED_USERS_KEY, {"5": now})
+        stop = asyncio.Event()
+        task = asyncio.create_task(run_revocation_listener(stop))
+        try:
+            for _ in range(50):
+                if "snap" in revocations.jtis:
+                    break
+                await asyncio.sleep(0.02)
+            assert set(revocations.jtis) == {"snap"}
+            assert revocations.is_revoked(_claims("5", iat=now - 1))
+
+            await redis.publish(REVOCATIONS_CHANNEL, json.dumps({"type": "jti", "jti": "live", "exp": now + 60}))
+            for _ in range(100):
+                if "live" in revocations.jtis:
+                    break
+                await asyncio.sleep(0.02)
+            assert revocations.is_revoked(_claims(jti="live"))
+        finally:
+            stop.set()
+            await asyncio.wait_for(task, 5)
+
+    asyncio.run(scenario())
@@ -0,0 +1,44 @@
+"""
+Кэш вердиктов проверки темы (validate_theme_sync) в Redis по нормализованному тексту темы.
+Проверка похожести на известные темы (Qdrant) выполняется в api.main до обращения к модели.
+"""
+import hashlib
+import json
+import logging
+import os
+import re
+from typing import Any, Optional
+
+from api.redis_client import redis_client
+
+logger = logging.getLogger(__name__)
+
+THEME_CACHE_TTL_SEC = int(os.getenv("THEME_CACHE_TTL_SEC", str(90 * 24 * 3600)))
+THEME_CACHE_PREFIX = "themecache:"
+
+_EDGE_PUNCT = re.compile(r"^[\s\"'«»“”„.,!?;:()\-–—]+|[\s\"'«»“”„.,!?;:()\-–—]+$")
+
+
+def normalize_theme(theme: str) -> str:
+    """Регистр, повторяющиеся пробелы, кавычки и знаки препинания по краям не влияют на вердикт."""
+    return _EDGE_PUNCT.sub("", " ".join(theme.lower().replace("ё", "е").split()))
+
+
+def _cache_key(normalized: str) -> str:
+    return THEME_CACHE_PREFIX + hashlib.sha256(normalized.encode("utf-8")).hexdigest()
+
+
+async def get_theme_verdict(normalized: str) -> Optional[dict[str, Any]]:
+    try:
+        data = await redis_client.get(_cache_key(normalized))
+    except Exception as e:
+        logger.warning("theme_cache: ошибка чтения кэша: %s", e)
+        return None
+    return json.loads(data) if data else None
+
+
+async def set_theme_verdict(normalized: str, verdict: dict[str, Any]) -> None:
+    try:
+        await redis_client.set(_cache_key(normalized), json.dumps(verdict, ensure_ascii=False), ex=THEME_CACHE_TTL_SEC)
+    except Exception as e:
+        logger.warning("theme_cache: ошибка записи в кэш: %s", e)
@@ -0,0 +1,109 @@
+"""
+Отозванные access-токены: копия в памяти процесса, проверка без сетевых запросов.
+Сервис авторизации (auth/users/revocation.py) при выходе и отзыве токенов администратором
+пишет в Redis отозванные jti (ZSET, score — exp токена) и отсечки по пользователю
+(ZSET, score — секунда отзыва: недействительны токены с iat строго раньше неё) и публикует
+каждое изменение в канал auth:revocations. Фоновая задача API подписывается на канал,
+загружает снимок обоих множеств и дальше применяет сообщения; при обрыве связи —
+переподключение и повторная загрузка снимка, раз в TOKEN_REVOCATION_RESYNC_SEC — сверка
+со снимком на случай потерянных сообщений. Пока Redis недоступен, действует последняя копия.
+"""
+import asyncio
+import contextlib
+import json
+import logging
+import os
+import time
+from typing import Any, Dict
+
+from api.redis_client import redis_client
+
+logger = logging.getLogger(__name__)
+
+# Ключи и формат сообщений совпадают с auth/users/revocation.py
+REVOKED_JTIS_KEY = "auth:revoked:jti"
+REVOKED_USERS_KEY = "auth:revoked:users"
+REVOCATIONS_CHANNEL = "auth:revocations"
+
+TOKEN_REVOCATION_RESYNC_SEC = float(os.getenv("TOKEN_REVOCATION_RESYNC_SEC", "300"))
+TOKEN_REVOCATION_RETRY_MAX_SEC = float(os.getenv("TOKEN_REVOCATION_RETRY_MAX_SEC", "30"))
+
+
+class RevocationMirror:
+    """Отозванные jti (jti -> exp) и отсечки по пользователям (user_id -> cutoff)."""
+
+    def __init__(self) -> None:
+        self.jtis: Dict[str, float] = {}
+        self.cutoffs: Dict[str, float] = {}
+        self.synced_at = 0.0
+
+    def is_revoked(self, claims: Any) -> bool:
+        if claims.jti in self.jtis:
+            return True
+        cutoff = self.cutoffs.get(claims.user_id)
+        return cutoff is not None and claims.iat < cutoff
+
+    def apply(self, message: Dict[str, Any]) -> None:
+        """Применяет сообщение канала auth:revocations."""
+        if message.get("type") == "jti":
+            self.jtis[message["jti"]] = float(message["exp"])
+        elif message.get("type") == "user":
+            user_id = str(message["user_id"])
+            self.cutoffs[user_id] = max(float(message["cutoff"]), self.cutoffs.get(user_id, 0.0))
+
+    def prune(self) -> None:
+        """Убирает jti истёкших токенов — они и так не пройдут проверку exp."""
+        now = time.time()
+        self.jtis = {jti: exp for jti, exp in self.jtis.items() if exp > now}
+
+    async def load_snapshot(self) -> None:
+        """Заменяет копию текущим содержимым Redis."""
+        async with redis_client.pipeline(transaction=False) as pipe:
+            pipe.zrangebyscore(REVOKED_JTIS_KEY, time.time(), "+inf", withscores=True)
+            pipe.zrange(REVOKED_USERS_KEY, 0, -1, withscores=True)
+            jtis, cutoffs = await pipe.execute()
+        self.jtis = dict(jtis)
+        self.cutoffs = dict(cutoffs)
+        self.synced_at = time.monotonic()
+
+
+revocations = RevocationMirror()
+
+
+async def _follow(stop: asyncio.Event) -> None:
+    pubsub = redis_client.pubsub()
+    try:
+        # Сначала подписка, потом снимок: отзыв между ними не теряется
+        await pubsub.subscribe(REVOCATIONS_CHANNEL)
+        await revocations.load_snapshot()
+        logger.info(
+            "token_revocation: загружено отозванных jti %s, отсечек %s",
+            len(revocations.jtis), len(revocations.cutoffs),
+        )
+        while not stop.is_set():
+            message = await pubsub.get_message(ignore_subscribe_messages=True, timeout=1.0)
+            if message is not None:
+                try:
+                    revocations.apply(json.loads(message["data"]))
+                except (ValueError, KeyError, TypeError) as e:
+                    logger.warning("token_revocation: некорректное сообщение %r: %s", message.get("data"), e)
+            if time.monotonic() - revocations.synced_at > TOKEN_REVOCATION_RESYNC_SEC:
+                await revocations.load_snapshot()
+    finally:
+        with contextlib.suppress(Exception):
+            await pubsub.aclose()
+
+
+async def run_revocation_listener(stop: asyncio.Event) -> None:
+    """Фоновая задача API: держит копию отзывов актуальной, пока не выставлен stop."""
+    retry = 1.0
+    while not stop.is_set():
+        try:
+            await _follow(stop)
+            retry = 1.0
+        except Exception as e:
+            logger.warning("token_revocation: потеряна связь с Redis, повтор через %.0f с: %s", retry, e)
+            with contextlib.suppress(asyncio.TimeoutError):
+                await asyncio.wait_for(stop.wait(), timeout=retry)
+            retry = min(retry * 2, TOKEN_REVOCATION_RETRY_MAX_SEC)
+        revocations.prune()
@@ -0,0 +1,199 @@
+"""
+Прогресс пользователя (таблица user_progress): взвешенное среднее по последним RECENT_WINDOW
+оценённым сочинениям, число оценённых сочинений по типам и средние баллы по критериям.
+Агрегаты обновляются инкрементально в той же транзакции, что сохраняет оценку (api.eval_worker)
+или удаляет сочинение; строка блокируется SELECT ... FOR UPDATE, поэтому параллельные
+воркеры не теряют обновлений. Для пользователей без строки агрегаты один раз считаются по essays.
+Готовый документ вместе с target_percent из настроек кэшируется в Redis (progress:{user_id}).
+"""
+import json
+import logging
+import os
+from datetime import datetime, timezone
+from typing import Any, Optional
+
+from sqlalchemy import select
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from api.db import AsyncSessionLocal
+from api.models import Essay, UserProgress, UserSettings
+from api.redis_client import redis_client
+
+logger = logging.getLogger(__name__)
+
+RECENT_WINDOW = 10
+DEFAULT_TARGET_PERCENT = 70
+PROGRESS_CACHE_PREFIX = "progress:"
+PROGRESS_CACHE_TTL_SEC = int(os.getenv("PROGRESS_CACHE_TTL_SEC", str(24 * 3600)))
+
+
+def weighted_average_percent(scores: list[float]) -> Optional[float]:
+    """Среднее в процентах с весами N..1 (последнее сочинение весит больше всего); scores — новые первыми."""
+    if not scores:
+        return None
+    weights = list(range(len(scores), 0, -1))
+    return round(sum(s * w for s, w in zip(scores, weights)) / sum(weights) * 100, 1)
+
+
+def _criterion_scores(criteries: Optional[dict]) -> dict[str, float]:
+    out = {}
+    for key, value in (criteries or {}).items():
+        if isinstance(value, dict) and isinstance(value.get("score"), (int, float)):
+            out[key] = float(value["score"])
+    return out
+
+
+def _add(progress: UserProgress, essay_type: str, score_per: float, criteries: Optional[dict], sign: int) -> None:
+    """Учитывает (sign=1) или вычитает (sign=-1) одно оценённое сочинение в счётчиках и критериях."""
+    progress.scored_count = max(0, (progress.scored_count or 0) + sign)
+    counts = dict(progress.count_by_type or {})
+    counts[essay_type] = max(0, counts.get(essay_type, 0) + sign)
+    progress.count_by_type = counts
+
+    criteria = {t: {k: list(v) for k, v in by_key.items()} for t, by_key in (progress.criteria or {}).items()}
+    by_key = criteria.setdefault(essay_type, {})
+    for key, score in _criterion_scores(criteries).items():
+        total, count = by_key.get(key, [0.0, 0])
+        by_key[key] = [total + sign * score, max(0, count + sign)]
+    progress.criteria = criteria
+
+
+def _set_recent(progress: UserProgress, recent: list[list]) -> None:
+    recent = sorted(recent, key=lambda item: (item[1], item[0]), reverse=True)[:RECENT_WINDOW]
+    progress.recent = recent
+    progress.weighted_avg_percent = weighted_average_percent([item[2] for item in recent])
+
+
+async def _recent_from_db(session: AsyncSession, user_id: str, exclude_id: int) -> list[list]:
+    rows = await session.execute(
+        select(Essay.id, Essay.ended_at, Essay.total_score_per)
+        .where(Essay.user_id == user_id, Essay.total_score_per.isnot(None), Essay.id != exclude_id)
+        .order_by(Essay.ended_at.desc(), Essay.id.desc())
+        .limit(RECENT_WINDOW)
+    )
+    return [[r.id, r.ended_at.isoformat(), r.total_score_per] for r in rows]
+
+
+async def _backfill(session: AsyncSession, progress: UserProgress, exclude_id: Optional[int]) -> None:
+    """Первичный подсчёт агрегатов по уже оценённым сочинениям пользователя."""
+    q = select(Essay.id, Essay.essay_type, Essay.ended_at, Essay.total_score_per, Essay.criteries).where(
+        Essay.user_id == progress.user_id, Essay.total_score_per.isnot(None)
+    )
+    if exclude_id is not None:
+        q = q.where(Essay.id != exclude_id)
+    recent = []
+    for row in await session.execute(q):
+        _add(progress, row.essay_type or "essay", row.total_score_per, row.criteries, 1)
+        recent.append([row.id, row.ended_at.isoformat(), row.total_score_per])
+    _set_recent(progress, recent)
+
+
+async def _lock(
+    session: AsyncSession, user_id: str, exclude_id: Optional[int] = None
+) -> tuple[UserProgress, bool]:
+    """
+    Строка прогресса под блокировкой до конца транзакции. Если строки не было, она создаётся
+    с подсчётом по essays (без exclude_id); второй элемент — True в этом случае.
+    """
+    now = datetime.now(timezone.utc)
+    created = await session.execute(
+        insert(UserProgress)
+        .values(user_id=user_id, scored_count=0, count_by_type={}, recent=[], criteria={}, updated_at=now)
+        .on_conflict_do_nothing(index_elements=[UserProgress.user_id])
+        .returning(UserProgress.user_id)
+    )
+    is_new = created.first() is not None
+    progress = (
+        await session.execute(
+            select(UserProgress).where(UserProgress.user_id == user_id).with_for_update().execution_options(populate_existing=True)
+        )
+    ).scalar_one()
+    if is_new:
+        await _backfill(session, progress, exclude_id)
+    progress.updated_at = now
+    return progress, is_new
+
+
+async def record_score(
+    session: AsyncSession,
+    essay: Essay,
+    previous_score_per: Optional[float],
+    previous_criteries: Optional[dict],
+) -> None:
+    """
+    Учитывает новую оценку essay (поля уже обновлены, коммит — за вызывающим).
+    previous_* — оценка до обновления: при повторной оценке старый вклад вычитается.
+    """
+    if essay.total_score_per is None:
+        return
+    essay_type = essay.essay_type or "essay"
+    # Без автосброса: новая оценка essay не должна попасть в первичный подсчёт
+    with session.no_autoflush:
+        progress, is_new = await _lock(session, essay.user_id, exclude_id=essay.id)
+    if previous_score_per is not None and not is_new:
+        _add(progress, essay_type, previous_score_per, previous_criteries, -1)
+    _add(progress, essay_type, essay.total_score_per, essay.criteries, 1)
+    recent = [item for item in (progress.recent or []) if item[0] != essay.id]
+    recent.append([essay.id, essay.ended_at.isoformat(), essay.total_score_per])
+    _set_recent(progress, recent)
+
+
+async def forget_essay(session: AsyncSession, essay: Essay) -> None:
+    """Убирает удаляемое сочинение из агрегатов (до session.delete, коммит — за вызывающим)."""
+    if essay.total_score_per is None:
+        return
+    progress, _ = await _lock(session, essay.user_id)
+    _add(progress, essay.essay_type or "essay", essay.total_score_per, essay.criteries, -1)
+    if any(item[0] == essay.id for item in progress.recent or []):
+        # Окно сдвигается: следующее по давности сочинение есть только в essays
+        _set_recent(progress, await _recent_from_db(session, essay.user_id, essay.id))
+
+
+def _document(progress: UserProgress, target_percent: int) -> dict[str, Any]:
+    criteria = {}
+    for essay_type, by_key in (progress.criteria or {}).items():
+        criteria[essay_type] = {key: round(total / count, 3) for key, (total, count) in by_key.items() if count}
+    return {
+        "weighted_avg_percent": progress.weighted_avg_percent,
+        "scored_count": progress.scored_count or 0,
+        "count_by_type": dict(progress.count_by_type or {}),
+        "criteria": criteria,
+        "target_percent": target_percent,
+    }
+
+
+def _cache_key(user_id: str) -> str:
+    return f"{PROGRESS_CACHE_PREFIX}{user_id}"
+
+
+async def get_progress(session: AsyncSession, user_id: str) -> dict[str, Any]:
+    """Документ прогресса: weighted_avg_percent, scored_count, count_by_type, criteria (средние), target_percent."""
+    try:
+        cached = await redis_client.get(_cache_key(user_id))
+        if cached:
+            return json.loads(cached)
+    except Exception as e:
+        logger.warning("user_progress: ошибка чтения кэша: %s", e)
+
+    progress = await session.get(UserProgress, user_id)
+    if progress is None:
+        # session может быть сессией реплики: первичный подсчёт пишется в основную БД
+        async with AsyncSessionLocal() as write_session:
+            progress, _ = await _lock(write_session, user_id)
+            await write_session.commit()
+    user_settings = await session.get(UserSettings, user_id)
+    document = _document(progress, user_settings.target_percent if user_settings else DEFAULT_TARGET_PERCENT)
+    try:
+        await redis_client.set(_cache_key(user_id), json.dumps(document), ex=PROGRESS_CACHE_TTL_SEC)
+    except Exception as e:
+        logger.warning("user_progress: ошибка записи в кэш: %s", e)
+    return document
+
+
+async def invalidate_progress(user_id: str) -> None:
+    """Сбрасывает кэш после коммита изменений оценок или настроек."""
+    try:
+        await redis_client.delete(_cache_key(user_id))
+    except Exception as e:
+        logger.warning("user_progress: ошибка сброса кэша: %s", e)
@@ -0,0 +1,172 @@
+"""
+Статистика пользователя для GET /stats: динамика баллов по периодам, средние по критериям,
+частота ошибок по типам. Считается в Postgres по JSONB criteries/common_mistakes.
+Основа — сводная таблица user_stats_daily (пользователь × день × тип сочинения); при сохранении
+оценки или удалении сочинения пересчитывается только затронутый день, поэтому запрос
+статистики читает десятки строк, а не все сочинения пользователя.
+"""
+from datetime import date, datetime, time, timedelta, timezone
+from typing import Any, Optional
+
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncConnection, AsyncSession
+
+from api.essay_eval import criterion_max_score
+
+STATS_BUCKETS = ("day", "week", "month")
+
+# Срезы по (user_id, день UTC, тип) из оценённых сочинений; {filter} — дополнительное условие на essays
+_ROLLUP_SQL = """
+WITH scored AS (
+    SELECT user_id, (ended_at AT TIME ZONE 'UTC')::date AS day, essay_type, total_score_per,
+           criteries, common_mistakes
+    FROM essays
+    WHERE total_score_per IS NOT NULL {filter}
+),
+totals AS (
+    SELECT user_id, day, essay_type, count(*) AS essays, sum(total_score_per) AS score_per_sum
+    FROM scored
+    GROUP BY user_id, day, essay_type
+),
+crit AS (
+    SELECT user_id, day, essay_type, jsonb_object_agg(key, jsonb_build_array(total, n)) AS criteria
+    FROM (
+        SELECT s.user_id, s.day, s.essay_type, c.key, sum((c.value->>'score')::float) AS total, count(*) AS n
+        FROM scored s
+        CROSS JOIN jsonb_each(CASE WHEN jsonb_typeof(s.criteries) = 'object' THEN s.criteries ELSE '{{}}' END) c
+        WHERE jsonb_typeof(c.value->'score') = 'number'
+        GROUP BY s.user_id, s.day, s.essay_type, c.key
+    ) per_key
+    GROUP BY user_id, day, essay_type
+),
+mist AS (
+    SELECT user_id, day, essay_type, jsonb_object_agg(kind, total) AS mistakes
+    FROM (
+        SELECT s.user_id, s.day, s.essay_type, m.value->>'type' AS kind, sum((m.value->>'count')::numeric) AS total
+        FROM scored s
+        CROSS JOIN jsonb_array_elements(
+            CASE WHEN jsonb_typeof(s.common_mistakes) = 'array' THEN s.common_mistakes ELSE '[]' END
+        ) m
+        WHERE m.value->>'type' IS NOT NULL AND jsonb_typeof(m.value->'count') = 'number'
+        GROUP BY s.user_id, s.day, s.essay_type, m.value->>'type'
+    ) per_kind
+    GROUP BY user_id, day, essay_type
+)
+INSERT INTO user_stats_daily (user_id, day, essay_type, essays, score_per_sum, criteria, mistakes)
+SELECT t.user_id, t.day, t.essay_type, t.essays, t.score_per_sum,
+       coalesce(c.criteria, '{{}}'), coalesce(m.mistakes, '{{}}')
+FROM totals t
+LEFT JOIN crit c USING (user_id, day, essay_type)
+LEFT JOIN mist m USING (user_id, day, essay_type)
+ON CONFLICT (user_id, day, essay_type) DO UPDATE SET
+    essays = EXCLUDED.essays,
+    score_per_sum = EXCLUDED.score_per_sum,
+    criteria = EXCLUDED.criteria,
+    mistakes = EXCLUDED.mistakes
+"""
+
+
+async def refresh_stats_day(session: AsyncSession, user_id: str, ended_at: datetime) -> None:
+    """
+    Пересчитывает срез дня ended_at (в транзакции вызывающего). Вызывать под блокировкой
+    строки user_progress пользователя, чтобы параллельные пересчёты не затирали друг друга.
+    """
+    day = ended_at.astimezone(timezone.utc).date()
+    start = datetime.combine(day, time.min, tzinfo=timezone.utc)
+    params = {"user_id": user_id, "day": day, "start": start, "end": start + timedelta(days=1)}
+    await session.execute(text("DELETE FROM user_stats_daily WHERE user_id = :user_id AND day = :day"), params)
+    await session.execute(
+        text(_ROLLUP_SQL.format(filter="AND user_id = :user_id AND ended_at >= :start AND ended_at < :end")),
+        params,
+    )
+
+
+async def rebuild_stats(conn: AsyncConnection) -> None:
+    """Полное перестроение user_stats_daily по всем оценённым сочинениям (например, после изменения агрегации)."""
+    await conn.execute(text(_ROLLUP_SQL.format(filter="")))
+
+
+def _filters(essay_type: Optional[str], date_from: Optional[date], date_to: Optional[date]) -> tuple[str, dict]:
+    where = "user_id = :user_id"
+    params: dict[str, Any] = {}
+    if essay_type:
+        where += " AND essay_type = :essay_type"
+        params["essay_type"] = essay_type
+    if date_from:
+        where += " AND day >= :date_from"
+        params["date_from"] = date_from
+    if date_to:
+        where += " AND day <= :date_to"
+        params["date_to"] = date_to
+    return where, params
+
+
+async def get_stats(
+    session: AsyncSession,
+    user_id: str,
+    bucket: str = "week",
+    essay_type: Optional[str] = None,
+    date_from: Optional[date] = None,
+    date_to: Optional[date] = None,
+) -> dict[str, Any]:
+    where, params = _filters(essay_type, date_from, date_to)
+    params["user_id"] = user_id
+
+    periods = await session.execute(
+        text(
+            f"SELECT date_trunc('{bucket}', day)::date AS period, sum(essays) AS essays, "
+            f"sum(score_per_sum) / sum(essays) AS avg_score_per "
+            f"FROM user_stats_daily WHERE {where} GROUP BY 1 ORDER BY 1"
+        ),
+        params,
+    )
+    criteria = await session.execute(
+        text(
+            "SELECT essay_type, c.key, sum((c.value->>0)::float) AS total, sum((c.value->>1)::int) AS n "
+            f"FROM user_stats_daily CROSS JOIN jsonb_each(criteria) c WHERE {where} "
+            "GROUP BY essay_type, c.key ORDER BY essay_type, c.key"
+        ),
+        params,
+    )
+    mistakes = await session.execute(
+        text(
+            "SELECT m.key AS kind, sum(m.value::numeric) AS total "
+            f"FROM user_stats_daily CROSS JOIN jsonb_each_text(mistakes) m WHERE {where} "
+            "GROUP BY m.key ORDER BY total DESC"
+        ),
+        params,
+    )
+
+    timeline = [
+        {
+            "period_start": row.period,
+            "essays": int(row.essays),
+            "avg_score_percent": round(float(row.avg_score_per) * 100, 1),
+        }
+        for row in periods
+    ]
+    by_criterion = []
+    for row in criteria:
+        if not row.n:
+            continue
+        max_score = criterion_max_score(row.essay_type, row.key)
+        mean = row.total / row.n
+        by_criterion.append(
+            {
+                "type": row.essay_type,
+                "key": row.key,
+                "mean": round(mean, 3),
+                "max_score": max_score,
+                "mean_percent": round(mean / max_score * 100, 1) if max_score else None,
+                "essays": int(row.n),
+            }
+        )
+    rated = [c for c in by_criterion if c["mean_percent"] is not None]
+    return {
+        "bucket": bucket,
+        "total_essays": sum(p["essays"] for p in timeline),
+        "timeline": timeline,
+        "criteria": by_criterion,
+        "weakest_criterion": min(rated, key=lambda c: c["mean_percent"]) if rated else None,
+        "mistakes": {row.kind: int(row.total) for row in mistakes},
+    }
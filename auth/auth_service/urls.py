@@ -19,8 +19,8 @@ from django.contrib import admin
 from django.urls import path, include
 from health_check.views import HealthCheckView
 # from users.oauth_views import OTPTokenView
-from users.views import OTPTokenObtainPairView, LogoutView, JwksView
-from rest_framework_simplejwt.views import TokenRefreshView, TokenBlacklistView
+from users.views import OTPTokenObtainPairView, LogoutView, JwksView, TokenBlacklistPublishView
+from rest_framework_simplejwt.views import TokenRefreshView
 
 urlpatterns = [
     path("admin/", admin.site.urls),
@@ -28,7 +28,7 @@ urlpatterns = [
     path("accounts/", include("django.contrib.auth.urls")),
     path("api/token/", OTPTokenObtainPairView.as_view(), name="token_obtain_pair"),
     path("api/token/refresh/", TokenRefreshView.as_view(), name="token_refresh"),
-    path("api/token/logout/", TokenBlacklistView.as_view(), name="token_blacklist"),
+    path("api/token/logout/", TokenBlacklistPublishView.as_view(), name="token_blacklist"),
     path('.well-known/jwks.json', JwksView.as_view(), name='jwks'),
     # path("o/token/", OTPTokenView.as_view(), name="token"),
     # path("o/", include("oauth2_provider.urls", namespace="oauth2_provider")),
@@ -0,0 +1,78 @@
+"""
+Публикация отзывов токенов для Lingwo API через Redis.
+API проверяет access-токены локально и не ходит в БД сервиса авторизации, поэтому отзывы
+дублируются в Redis: отозванные jti access-токенов (ZSET, score — exp токена) и отсечки
+по пользователю (ZSET, score — секунда отзыва: токены с iat раньше отсечки недействительны).
+iat в токене — целые секунды, поэтому отсечка — начало секунды отзыва: токен, полученный сразу
+после «выйти везде», действует, а выданный в ту же секунду до отзыва доживает до своего exp.
+Каждое изменение публикуется в канал auth:revocations — API держит копию в памяти (api.token_revocation).
+Ключи и формат сообщений должны совпадать с api/token_revocation.py.
+"""
+import json
+import logging
+import time
+
+from django.conf import settings
+from django_redis import get_redis_connection
+
+logger = logging.getLogger(__name__)
+
+REVOKED_JTIS_KEY = "auth:revoked:jti"
+REVOKED_USERS_KEY = "auth:revoked:users"
+REVOCATIONS_CHANNEL = "auth:revocations"
+
+
+def _access_lifetime_sec() -> int:
+    return int(settings.SIMPLE_JWT["ACCESS_TOKEN_LIFETIME"].total_seconds())
+
+
+def revoke_access_jti(jti: str, exp: int) -> None:
+    """Отзывает access-токен по jti до его exp."""
+    now = time.time()
+    if exp <= now:
+        return
+    try:
+        redis = get_redis_connection("default")
+        pipe = redis.pipeline()
+        pipe.zadd(REVOKED_JTIS_KEY, {jti: exp})
+        pipe.zremrangebyscore(REVOKED_JTIS_KEY, "-inf", now)
+        pipe.publish(REVOCATIONS_CHANNEL, json.dumps({"type": "jti", "jti": jti, "exp": exp}))
+        pipe.execute()
+    except Exception as e:
+        # Refresh-токен уже в черном списке БД; access-токен доживёт до exp
+        logger.warning("revocation: не удалось опубликовать отзыв jti %s: %s", jti, e)
+
+
+def revoke_user_tokens(user_id) -> None:
+    """Отзывает все access-токены пользователя, выданные до текущего момента."""
+    now = time.time()
+    # Не ceil: иначе вход в ту же секунду после отзыва получил бы 401 (iat == отсечке)
+    cutoff = int(now)
+    try:
+        redis = get_redis_connection("default")
+        pipe = redis.pipeline()
+        pipe.zadd(REVOKED_USERS_KEY, {str(user_id): cutoff})
+        # Отсечки старше времени жизни access-токена уже ничего не отсекают
+        pipe.zremrangebyscore(REVOKED_USERS_KEY, "-inf", now - _access_lifetime_sec())
+        pipe.publish(REVOCATIONS_CHANNEL, json.dumps({"type": "user", "user_id": str(user_id), "cutoff": cutoff}))
+        pipe.execute()
+    except Exception as e:
+        logger.warning("revocation: не удалось опубликовать отзыв токенов пользователя %s: %s", user_id, e)
+
+
+def revoke_request_access_token(request) -> None:
+    """Отзывает access-токен, которым подписан запрос (выход из аккаунта), если он есть и валиден."""
+    token = getattr(request, "auth", None)
+    if token is None:
+        from rest_framework_simplejwt.authentication import JWTAuthentication
+
+        try:
+            authenticated = JWTAuthentication().authenticate(request)
+        except Exception:
+            return
+        if authenticated is None:
+            return
+        token = authenticated[1]
+    payload = getattr(token, "payload", None) or {}
+    if payload.get("jti") and payload.get("exp"):
+        revoke_access_jti(payload["jti"], int(payload["exp"]))
@@ -4,53 +4,70 @@ from rest_framework import status
 from rest_framework.permissions import IsAdminUser
 from rest_framework_simplejwt.token_blacklist.models import OutstandingToken, BlacklistedToken
 from django.contrib.auth import get_user_model
+from django.db import transaction
 from django.shortcuts import get_object_or_404
+from rest_framework_simplejwt.utils import aware_utcnow
 
 from ..models import AdminEventType
+from ..revocation import revoke_user_tokens
 
 User = get_user_model()
 
+# Строк в одном INSERT при отзыве; у активного пользователя с ротацией refresh их тысячи
+REVOKE_BATCH_SIZE = 1000
+
 class TokenRevokeAdminView(APIView):
     permission_classes = (IsAdminUser,) 
 
-    def post(self, request, user_id):
+    def post(self, request, username):
         """
-        Отзывает все Refresh Tokens для указанного user_id.
+        Отзывает все Refresh Tokens пользователя за постоянное число запросов к БД:
+        выборка ещё не отозванных токенов (anti-join) и пакетная вставка в черный список.
         """
         
-        # 1. Получаем пользователя по user_id
+        # 1. Получаем пользователя по username из URL
         # Если пользователь не найден, Django автоматически вернет 404
-        user = get_object_or_404(User, pk=user_id) 
+        user = get_object_or_404(User, username=username)
+        user_id = user.pk
         
         # 2. Находим все активные токены обновления (Outstanding Tokens)
         # OutstandingToken — это таблица со всеми выданными Refresh Tokens
-        outstanding_tokens = OutstandingToken.objects.filter(user=user)
-        
-        if not outstanding_tokens.exists():
+        outstanding_tokens = OutstandingToken.objects.filter(user=user).order_by()
+
+        # Уже выданные access-токены API проверяет без БД: публикуем отсечку по времени выдачи
+        revoke_user_tokens(user_id)
+
+        # 3. Заносим в черный список только не истёкшие и ещё не отозванные токены;
+        # истёкшие удаляет manage.py flushexpiredtokens (сервис auth-token-flush-lingwo)
+        with transaction.atomic():
+            pending_ids = list(
+                outstanding_tokens.filter(
+                    blacklistedtoken__isnull=True, expires_at__gt=aware_utcnow()
+                ).values_list("id", flat=True)
+            )
+            # ignore_conflicts: токен, отозванный параллельным запросом, просто пропускается
+            BlacklistedToken.objects.bulk_create(
+                [BlacklistedToken(token_id=token_id) for token_id in pending_ids],
+                batch_size=REVOKE_BATCH_SIZE,
+                ignore_conflicts=True,
+            )
+        total_outstanding = outstanding_tokens.count()
+
+        if not total_outstanding:
             return Response(
                 {"detail": f"No outstanding tokens found for user ID {user_id}."},
                 status=status.HTTP_200_OK
             )
             
-        blacklisted_count = 0
-        
-        # 3. Заносим каждый токен в черный список
-        for token in outstanding_tokens:
-            # Проверяем, не находится ли токен уже в черном списке, 
-            # чтобы избежать создания дубликатов
-            if not BlacklistedToken.objects.filter(token=token).exists():
-                BlacklistedToken.objects.create(token=token)
-                blacklisted_count += 1
-                
         # 4. Формируем ответ
         response_data = {
-            "detail": f"Successfully revoked {blacklisted_count} refresh tokens for user ID {user_id}.",
+            "detail": f"Successfully revoked {len(pending_ids)} refresh tokens for user ID {user_id}.",
             "revoked_user_id": user_id,
-            "total_outstanding": outstanding_tokens.count(),
+            "total_outstanding": total_outstanding,
         }
 
         # ❗️ Для целей логирования: добавьте ID отозванного пользователя в ответ
         # Это нужно, чтобы ваш декоратор audit_log_action мог его найти (Шаг 3)
         response_data["user_id"] = user_id 
         
-        return Response(response_data, status=status.HTTP_200_OK)
\ No newline at end of file
+        return Response(response_data, status=status.HTTP_200_OK)
@@ -2,12 +2,13 @@ from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework import status
 from rest_framework.permissions import AllowAny
-from rest_framework_simplejwt.views import TokenObtainPairView
+from rest_framework_simplejwt.views import TokenObtainPairView, TokenBlacklistView
 from django.db.models import Q
 from rest_framework.exceptions import NotFound
 from ..serializers import OTPTokenObtainSerializer, OTPSendSerializer
 from ..models import ABSUser, AuthType
 from ..otp_utils import generate_and_send_otp
+from ..revocation import revoke_request_access_token
 from rest_framework_simplejwt.authentication import JWTAuthentication
 from rest_framework_simplejwt.tokens import RefreshToken, Token
 from rest_framework_simplejwt.exceptions import TokenError
@@ -75,6 +76,8 @@ class LogoutView(APIView):
             token = RefreshToken(refresh_token)
 
             token.blacklist()
+            # Access-токен живёт до exp — отзываем и его, чтобы API перестал его принимать
+            revoke_request_access_token(request)
 
             return Response({"detail": "Successfully logged out."}, status=status.HTTP_200_OK)
 
@@ -86,4 +89,17 @@ class LogoutView(APIView):
         except TokenError as e:
             return Response({"detail": str(e)}, status=status.HTTP_400_BAD_REQUEST)
         except Exception as e:
-            return Response({"detail": "An unexpected error occurred during logout."}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
\ No newline at end of file
+            return Response({"detail": "An unexpected error occurred during logout."}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+
+class TokenBlacklistPublishView(TokenBlacklistView):
+    """
+    Выход через api/token/logout/: refresh token в черный список (simplejwt),
+    access token из заголовка Authorization (если передан) — в отзывы для API.
+    """
+
+    def post(self, request, *args, **kwargs):
+        response = super().post(request, *args, **kwargs)
+        if response.status_code == status.HTTP_200_OK:
+            revoke_request_access_token(request)
+        return response
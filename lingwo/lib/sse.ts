@@ -0,0 +1,41 @@
+/**
+ * Чтение server-sent events через fetch: в отличие от EventSource можно передать заголовок
+ * Authorization. Возвращается, когда сервер закрыл поток; при ошибке HTTP — исключение со status.
+ */
+export async function readEventStream(
+  url: string,
+  options: {
+    headers?: Record<string, string>
+    signal?: AbortSignal
+    onEvent: (event: string, data: string) => void
+  },
+): Promise<void> {
+  const res = await fetch(url, {
+    headers: { Accept: 'text/event-stream', ...options.headers },
+    signal: options.signal,
+    cache: 'no-store',
+  })
+  if (!res.ok || !res.body) {
+    throw Object.assign(new Error(`SSE ${res.status}`), { status: res.status })
+  }
+  const reader = res.body.pipeThrough(new TextDecoderStream()).getReader()
+  let buffer = ''
+  while (true) {
+    const { value, done } = await reader.read()
+    if (done) return
+    buffer += value.replace(/\r\n?/g, '\n')
+    let end: number
+    while ((end = buffer.indexOf('\n\n')) !== -1) {
+      const block = buffer.slice(0, end)
+      buffer = buffer.slice(end + 2)
+      let event = 'message'
+      const data: string[] = []
+      for (const line of block.split('\n')) {
+        // Строки с «:» в начале — комментарии (ping)
+        if (line.startsWith('event:')) event = line.slice(6).trim()
+        else if (line.startsWith('data:')) data.push(line.slice(5).replace(/^ /, ''))
+      }
+      if (data.length) options.onEvent(event, data.join('\n'))
+    }
+  }
+}